@@ -0,0 +1,126 @@
+# batch_report.py
+"""命令行批量报表：为一个或多个数据目录计算概览指标、每日时间预算和轨迹统计
+
+用法:
+    python batch_report.py data -o reports
+    python batch_report.py users/ -o reports --format parquet --workers 8
+
+参数可以是数据目录（含 activities.bin 或旧版 activities.json），也可以是其直接子目录为数据目录的
+上级目录（如每个用户一个子目录）。各目录分发到进程池并行计算，每完成一个
+就把结果行追加写入 summary / daily_budget / daily_trajectory 三张表，
+最后报告吞吐量（用户/秒）。写出Parquet需要安装 pyarrow。
+"""
+import argparse
+import csv
+import importlib.util
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from core.reports import REPORT_COLUMNS, user_report
+from core.store import is_data_dir
+
+PARQUET_TYPES = {"str": "string", "int": "int64", "float": "float64"}
+
+
+def find_data_dirs(paths):
+    """展开参数中的数据目录：本身含活动文件的直接使用，否则使用含活动文件的子目录"""
+    data_dirs = []
+    for path in paths:
+        if is_data_dir(path):
+            data_dirs.append(path)
+            continue
+        for name in sorted(os.listdir(path)):
+            child = os.path.join(path, name)
+            if is_data_dir(child):
+                data_dirs.append(child)
+            elif is_data_dir(os.path.join(child, "data")):
+                data_dirs.append(os.path.join(child, "data"))
+    return data_dirs
+
+
+def _csv_sink(path, columns):
+    f = open(path, "w", encoding="utf-8-sig", newline="")
+    writer = csv.DictWriter(f, fieldnames=[name for name, _ in columns])
+    writer.writeheader()
+    return writer.writerows, f.close
+
+
+def _parquet_sink(path, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(name, PARQUET_TYPES[kind]) for name, kind in columns])
+    writer = pq.ParquetWriter(path, schema)
+
+    def write(rows):
+        if rows:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+    return write, writer.close
+
+
+SINKS = {"csv": _csv_sink, "parquet": _parquet_sink}
+
+
+def iter_reports(data_dirs, workers):
+    """按完成顺序产出 (数据目录, 报表或异常)"""
+    if workers == 1 or len(data_dirs) <= 1:
+        for data_dir in data_dirs:
+            try:
+                yield data_dir, user_report(data_dir)
+            except Exception as e:
+                yield data_dir, e
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(user_report, data_dir): data_dir for data_dir in data_dirs}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+
+
+def main():
+    parser = argparse.ArgumentParser(description="个人活动日志批量报表")
+    parser.add_argument("paths", nargs="+", help="数据目录，或以数据目录为子目录的上级目录")
+    parser.add_argument("-o", "--output", default="reports", help="输出目录")
+    parser.add_argument("--format", choices=sorted(SINKS), default="csv")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认为CPU核数")
+    args = parser.parse_args()
+
+    data_dirs = find_data_dirs(args.paths)
+    if not data_dirs:
+        parser.error("没有找到包含活动数据的目录")
+    if args.format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        parser.error("写出Parquet需要安装 pyarrow")
+
+    os.makedirs(args.output, exist_ok=True)
+    sinks = {table: SINKS[args.format](os.path.join(args.output, f"{table}.{args.format}"), columns)
+             for table, columns in REPORT_COLUMNS.items()}
+    rows_written = dict.fromkeys(REPORT_COLUMNS, 0)
+    failed = 0
+    start = time.perf_counter()
+    try:
+        for done, (data_dir, report) in enumerate(iter_reports(data_dirs, args.workers), 1):
+            if isinstance(report, Exception):
+                failed += 1
+                print(f"[失败] {data_dir}: {report}", file=sys.stderr)
+                continue
+            for table, rows in report.items():
+                sinks[table][0](rows)
+                rows_written[table] += len(rows)
+            print(f"[{done}/{len(data_dirs)}] {data_dir}", file=sys.stderr)
+    finally:
+        for write, close in sinks.values():
+            close()
+    elapsed = time.perf_counter() - start
+
+    succeeded = len(data_dirs) - failed
+    print(f"完成 {succeeded} 个用户（失败 {failed}），用时 {elapsed:.2f}s，"
+          f"吞吐量 {succeeded / max(elapsed, 1e-9):.1f} 用户/秒")
+    for table, count in rows_written.items():
+        print(f"  {table}: {count} 行 → {os.path.join(args.output, f'{table}.{args.format}')}")
+
+
+if __name__ == "__main__":
+    main()
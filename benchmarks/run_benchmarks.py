@@ -0,0 +1,209 @@
+# benchmarks/run_benchmarks.py
+"""直接调用 core 中的数据函数并计时，结果追加到 results/history.jsonl
+
+用法:
+    python benchmarks/run_benchmarks.py                      # 默认规模 1k / 10k / 100k
+    python benchmarks/run_benchmarks.py --sizes 1000 1000000 --repeat 5
+    python benchmarks/run_benchmarks.py --only recommend
+
+每个用例报告多次运行中的最短和中位耗时，并与历史中同一用例、同一规模的
+上一次结果比较，变慢超过阈值时标记为回归。不导入Streamlit，状态是一个普通字典。
+
+生成的活动先写成列式文件，再像应用启动时一样用 open_history 打开；每次计时前
+重新打开，上一次计时物化的活动不会让下一次变快。
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+HISTORY_FILE = os.path.join(BENCH_DIR, "results", "history.jsonl")
+REGRESSION_RATIO = 1.25
+
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+from synthetic import generate_activities  # noqa: E402
+from core import columnar, indexes, store  # noqa: E402
+from core.aggregations import (build_day_matrix, compute_mobility_metrics,  # noqa: E402
+                               compute_overview_stats, weekday_weekend_budget)
+from core.places import build_place_index  # noqa: E402
+from core.hierarchy import hierarchy_frame  # noqa: E402
+from core.history import field_values, open_history, window  # noqa: E402
+from core.intervals import covered_dates, daily_minutes_by, hour_of_day_minutes  # noqa: E402
+from core.queries import (activities_overlapping, build_interval_index,  # noqa: E402
+                          covered_minutes, filter_activities)
+from core.recommenders import recommend_by_location, recommend_by_pattern, recommend_by_time  # noqa: E402
+from core.rollups import rollup_frame  # noqa: E402
+
+
+def benchmark_cases(state, data_dir):
+    """(名称, 准备函数, 被测函数)；准备函数在每次计时前运行，不计入耗时"""
+    activities_file = os.path.join(data_dir, store.STORE_FILES["activities"])
+
+    def fresh(setup):
+        def run():
+            state["activities"] = open_history(activities_file)
+            setup()
+        return run
+
+    def cold():
+        indexes.invalidate_activity_indexes(state)
+
+    def warm_recommendations():
+        indexes.get_recommendation_tables(state)
+        indexes.get_next_activity_model(state)
+        indexes.get_location_index(state)
+
+    def nothing():
+        pass
+
+    def warm_rollups():
+        indexes.get_rollups(state)
+
+    def warm_intervals():
+        indexes.get_interval_index(state)
+
+    def warm_hierarchy():
+        indexes.get_hierarchy_cube(state)
+
+    def by_time():
+        return recommend_by_time(indexes.get_recommendation_tables(state), indexes.get_location_index(state),
+                                 indexes.get_place_index(state), 9, 0, [])
+
+    def by_pattern():
+        return recommend_by_pattern(indexes.get_next_activity_model(state), indexes.get_location_index(state),
+                                    indexes.get_place_index(state), 9, [])
+
+    def by_location():
+        return recommend_by_location(indexes.get_recommendation_tables(state), indexes.get_place_index(state), [])
+
+    def first_page():
+        filtered = filter_activities(activities())
+        return list(reversed(window(filtered, max(0, len(filtered) - 50), len(filtered))))
+
+    activities = lambda: state["activities"]
+    last_date = lambda: datetime.date.fromisoformat(activities()[-1]["start_time"][:10])
+    cases = [
+        ("save_all_data", nothing, lambda: store.save_store(state, data_dir)),
+        ("load_activities_file", nothing, lambda: store.load_data_file(activities_file, "activities")),
+        ("materialize_activities", nothing, lambda: columnar.read_activities(activities_file)),
+        ("lazy_overview_stats", nothing,
+         lambda: compute_overview_stats(store.load_data_file(activities_file, "activities"))),
+        ("overview_stats", nothing, lambda: compute_overview_stats(activities())),
+        ("mobility_metrics", nothing, lambda: compute_mobility_metrics(activities())),
+        ("place_index", nothing, lambda: build_place_index(activities())),
+        ("interval_index_coverage", nothing,
+         lambda: covered_minutes(build_interval_index(activities()))),
+        ("day_matrix_budget", nothing,
+         lambda: weekday_weekend_budget(build_day_matrix(activities()))),
+        ("records_filter", nothing,
+         lambda: filter_activities(activities(), "同事", "工作", last_date())),
+        ("records_search_all", nothing, lambda: filter_activities(activities(), "同事")),
+        ("records_first_page", nothing, first_page),
+        ("trajectory_dates_and_range", warm_intervals,
+         lambda: (covered_dates(activities()),
+                  activities_overlapping(activities(), last_date() - datetime.timedelta(days=6), last_date(),
+                                         indexes.get_interval_index(state)["max_length"]))),
+        ("split_hour_histogram", nothing, lambda: hour_of_day_minutes(activities())),
+        ("split_daily_budget", nothing, lambda: daily_minutes_by(activities(), field_values(activities(), "demand"))),
+        ("rollups_build", cold, lambda: indexes.get_rollups(state)),
+        ("classification_index_build", cold, lambda: indexes.get_classification_index(state)),
+        ("classification_members_build", cold, lambda: indexes.get_classification_index(state, members=True)),
+        ("hierarchy_build", cold, lambda: indexes.get_hierarchy_cube(state)),
+        ("hierarchy_last_30_days", warm_hierarchy,
+         lambda: hierarchy_frame(indexes.get_hierarchy_cube(state), last_date() - datetime.timedelta(days=29), last_date())),
+        ("rollup_trend_day", warm_rollups, lambda: rollup_frame(indexes.get_rollups(state), "day")),
+        ("rollup_trend_month", warm_rollups, lambda: rollup_frame(indexes.get_rollups(state), "month", dimension="demand")),
+        ("recommend_by_time_cold", cold, by_time),
+        ("recommend_by_pattern_cold", cold, by_pattern),
+        ("recommend_by_location_cold", cold, by_location),
+        ("recommend_by_time_warm", warm_recommendations, by_time),
+        ("recommend_by_pattern_warm", warm_recommendations, by_pattern),
+        ("recommend_by_location_warm", warm_recommendations, by_location),
+    ]
+    return [(name, fresh(setup), func) for name, setup, func in cases]
+
+
+def time_case(setup, func, repeat):
+    timings = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), statistics.median(timings)
+
+
+def load_history():
+    if not os.path.exists(HISTORY_FILE):
+        return []
+    with open(HISTORY_FILE, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="个人活动日志数据函数基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", default="", help="只运行名称包含该字符串的用例")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-save", action="store_true", help="不写入历史结果")
+    args = parser.parse_args()
+
+    previous = {}
+    for record in load_history():
+        previous[(record["case"], record["size"])] = record
+
+    run_info = {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                "commit": git_commit(), "python": platform.python_version(), "machine": platform.machine()}
+    results = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        state = store.load_store(data_dir)
+        for size in args.sizes:
+            start = time.perf_counter()
+            generated = generate_activities(
+                size, state["classification_system"], state["location_categories"], seed=args.seed)
+            store.save_data_file(os.path.join(data_dir, store.STORE_FILES["activities"]), "activities", generated)
+            indexes.invalidate_activity_indexes(state)
+            print(f"\n== {size} 条活动（生成 {time.perf_counter() - start:.1f}s）==")
+            for name, setup, func in benchmark_cases(state, data_dir):
+                if args.only not in name:
+                    continue
+                best, median = time_case(setup, func, args.repeat)
+                record = dict(run_info, case=name, size=size, best_s=round(best, 6), median_s=round(median, 6))
+                results.append(record)
+                note = ""
+                before = previous.get((name, size))
+                if before:
+                    ratio = best / max(before["best_s"], 1e-9)
+                    note = f"  ×{ratio:.2f} vs {before['commit'] or before['timestamp']}"
+                    if ratio > REGRESSION_RATIO:
+                        note += "  ⚠️ 回归"
+                print(f"{name:<30} best {best * 1000:10.2f} ms   median {median * 1000:10.2f} ms{note}")
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
+        with open(HISTORY_FILE, "a", encoding="utf-8") as f:
+            for record in results:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"\n结果已追加到 {os.path.relpath(HISTORY_FILE, REPO_DIR)}")
+
+
+if __name__ == "__main__":
+    main()
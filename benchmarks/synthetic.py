@@ -0,0 +1,126 @@
+# benchmarks/synthetic.py
+"""合成活动历史：按天生成作息规律、带坐标和描述的活动记录
+
+每天由 睡眠 → 早餐 → 通勤 → 工作/休闲 → 晚餐 → 晚间活动 组成，工作日与周末
+不同；家、工作地和若干常去地点固定，坐标带几十米的抖动，少量记录没有坐标。
+分类路径从分类系统中按需求类型抽取，与应用默认的分类系统保持一致。
+"""
+import datetime
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.timezones import DEFAULT_TIMEZONE, set_activity_times  # noqa: E402
+
+CITY_CENTER = (39.9042, 116.4074)
+JITTER_DEGREES = 0.0003  # 约30米
+NO_COORDINATE_SHARE = 0.05
+
+DESCRIPTIONS = [
+    "", "", "", "和同事一起", "状态不错", "有点累", "临时安排", "按计划完成",
+    "下雨", "顺路", "效率很高", "被打断了几次", "和家人一起", "准备下周的事情",
+]
+
+
+def classification_paths(classification_system):
+    """分类系统中的全部五级路径，按需求类型分组"""
+    paths = {}
+    for demand, projects in classification_system.items():
+        for project, activities in projects.items():
+            for activity, behaviors in activities.items():
+                for behavior, segments in behaviors.items():
+                    for segment in segments:
+                        paths.setdefault(demand, []).append((demand, project, activity, behavior, segment))
+    return paths
+
+
+def _places(rng, location_categories):
+    """固定的家、工作地和常去地点"""
+    def around(spread):
+        return (CITY_CENTER[0] + rng.gauss(0, spread), CITY_CENTER[1] + rng.gauss(0, spread))
+
+    categories = list(location_categories) or ["其他场所"]
+    places = {
+        "home": ("居住场所", "家", "家", around(0.05)),
+        "work": ("工作场所", "办公室", "公司", around(0.05)),
+    }
+    for i in range(30):
+        category = rng.choice(categories)
+        tags = location_categories.get(category) or [""]
+        tag = rng.choice(tags)
+        places[f"place{i}"] = (category, tag, f"{tag or category}{i + 1}", around(0.08))
+    return places
+
+
+def _pick_path(rng, paths, demand, keyword=None):
+    candidates = paths.get(demand) or [p for group in paths.values() for p in group]
+    if keyword:
+        matched = [p for p in candidates if keyword in p[2] or keyword in p[3]]
+        candidates = matched or candidates
+    return rng.choice(candidates)
+
+
+def _day_plan(rng, weekday):
+    """一天的 (开始小时, 时长分钟, 需求, 关键词, 地点) 计划"""
+    plan = [(0, 7 * 60 + rng.randint(-30, 30), "个人", "睡", "home"),
+            (7.5, 30, "个人", "餐", "home")]
+    if weekday < 5:
+        plan += [(8.2, rng.randint(30, 60), "移动", "通勤", None),
+                 (9.2, 180, "工作", None, "work"),
+                 (12.2, 60, "个人", "餐", f"place{rng.randint(0, 5)}"),
+                 (13.3, 270, "工作", None, "work"),
+                 (18.0, rng.randint(30, 60), "移动", "通勤", None)]
+    else:
+        plan += [(9.0, 120, "家庭", None, "home"),
+                 (11.5, 90, "个人", "休闲", f"place{rng.randint(0, 29)}"),
+                 (13.5, 180, "个人", None, f"place{rng.randint(0, 29)}"),
+                 (17.0, 60, "家庭", None, "home")]
+    plan += [(19.0, 60, "个人", "餐", "home"),
+             (20.5, rng.randint(60, 150), "个人", None, rng.choice(["home", "home", f"place{rng.randint(0, 29)}"]))]
+    return plan
+
+
+def generate_activities(n, classification_system, location_categories, seed=0,
+                        start_date=datetime.date(2020, 1, 1), tz_name=DEFAULT_TIMEZONE):
+    """生成n条按开始时间排序的活动记录，字段与应用写入的一致"""
+    rng = random.Random(seed)
+    paths = classification_paths(classification_system)
+    places = _places(rng, location_categories)
+    activities = []
+    day = start_date
+    while len(activities) < n:
+        day_start = datetime.datetime.combine(day, datetime.time())
+        for hour, duration, demand, keyword, place_key in _day_plan(rng, day.weekday()):
+            if len(activities) >= n:
+                break
+            start = day_start + datetime.timedelta(minutes=int(hour * 60) + rng.randint(-15, 15))
+            start = max(start, day_start)
+            end = start + datetime.timedelta(minutes=duration)
+            if place_key is None:
+                category, tag, name, center = "交通场所", "地铁站", "地铁", places["work"][3]
+            else:
+                category, tag, name, center = places[place_key]
+            coordinates = None
+            if rng.random() >= NO_COORDINATE_SHARE:
+                coordinates = {"lat": center[0] + rng.gauss(0, JITTER_DEGREES),
+                               "lng": center[1] + rng.gauss(0, JITTER_DEGREES)}
+            path = _pick_path(rng, paths, demand, keyword)
+            activities.append(set_activity_times({
+                "id": len(activities) + 1,
+                "duration": duration,
+                "location_category": category,
+                "location_tag": tag,
+                "location_name": name,
+                "coordinates": coordinates,
+                "demand": path[0],
+                "project": path[1],
+                "activity": path[2],
+                "behavior": path[3],
+                "segment": path[4],
+                "description": rng.choice(DESCRIPTIONS),
+                "created_at": end.isoformat(),
+            }, start, end, tz_name))
+        day += datetime.timedelta(days=1)
+    activities.sort(key=lambda a: a["start_ts"])
+    return activities
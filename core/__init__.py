@@ -0,0 +1,24 @@
+# core/__init__.py
+"""个人活动日志的核心库，不依赖Streamlit
+
+- store: 数据文件读写、默认数据、活动批量写入
+- columnar: 列式活动文件（字典编码、内存映射读取）
+- history: 按需物化的活动历史（共享内存映射的列、整列读取）
+- queries: 时间解析、日期筛选、时间区间索引
+- intervals: 活动按本地日期、小时的精确区间拆分
+- classification: 分类树索引、路径解析与批量改名合并
+- hierarchy: 分类树各节点按日期范围的时长与次数汇总
+- places: 坐标聚类得到的规范地点与锚点
+- aggregations: 概览统计、出行与活动空间、日程矩阵
+- recommenders: 推荐计数表、下一活动模型、地点习惯、模板使用统计
+- routines: 常规日程挖掘与草稿生成
+- anomalies: 异常日检测
+- indexes: 派生索引的缓存与增量维护
+- geocoding: 地点名称搜索
+- reports: 批量报表（每个数据目录的概览、每日时间预算和轨迹统计）
+- rollups: 按日、周、月的增量汇总表
+- timezones: 活动时区与UTC时间戳
+
+所有函数都以显式参数接收数据；需要缓存索引的场景把一个包含 "activities"
+的可变映射作为状态传给 indexes 中的函数。
+"""
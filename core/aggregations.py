@@ -0,0 +1,296 @@
+# core/aggregations.py
+"""统计聚合：数据概览指标、出行与活动空间、日程矩阵
+
+输入都是活动列表或由它构建的数组，全部用NumPy批量计算。
+"""
+import datetime
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from .history import coordinate_columns, field_values, number_column, time_column
+from .intervals import DAYTIME_HOURS, MINUTES_PER_DAY, local_minute_bounds, split_intervals
+from .places import haversine_km
+
+OVERVIEW_TIME_SLOTS = ["深夜(0-6)", "早晨(6-9)", "上午(9-12)", "中午(12-14)", "下午(14-18)", "晚上(18-24)"]
+OVERVIEW_SLOT_BOUNDS = [6, 9, 12, 14, 18]
+MAX_PLAUSIBLE_SPEED_KMH = 1000  # 超过民航客机巡航速度的移动视为不可能
+DAY_MATRIX_LEVELS = {  # 编码层级 → 组成标签的字段
+    "需求": ("demand",),
+    "活动": ("demand", "activity"),
+}
+
+
+# 概览统计
+def compute_overview_stats(activities, today=None):
+    """数据概览的全部聚合：开始时间只解析一次，按日期、时刻的时间预算按区间拆分精确计入"""
+    today = today or datetime.date.today()
+    starts, ends = local_minute_bounds(activities)
+    days = (starts // MINUTES_PER_DAY).astype("datetime64[D]")
+    minutes = number_column(activities, "duration")
+    durations = minutes.astype(float)
+    demands, activity_names = field_values(activities, "demand"), field_values(activities, "activity")
+    demand_minutes = _minutes_by(demands, minutes)
+    location_minutes = _minutes_by(field_values(activities, "location_category"), minutes)
+    activity_counts = Counter(f"{demand} - {name}" for demand, name in zip(demands, activity_names))
+    unique_days = np.unique(days)
+
+    # 按小时拆分：时段分布、白天时长和每小时占用都由24小时直方图得到
+    _, hour_bins, hour_pieces = split_intervals(starts, ends, 60)
+    hour_minutes = np.bincount(hour_bins % 24, weights=hour_pieces, minlength=24)
+    slot_minutes = np.add.reduceat(hour_minutes, [0] + OVERVIEW_SLOT_BOUNDS)
+    rows, day_bins, day_pieces = split_intervals(starts, ends, MINUTES_PER_DAY)
+    on_today = day_bins == (np.datetime64(today) - np.datetime64(0, "D")).astype(np.int64)
+
+    return {
+        "total_activities": len(activities),
+        "total_duration": float(durations.sum()),
+        "today_activities": len(np.unique(rows[on_today])),
+        "today_minutes": float(day_pieces[on_today].sum()),
+        "demand_minutes": demand_minutes,
+        "slot_minutes": dict(zip(OVERVIEW_TIME_SLOTS, slot_minutes.tolist())),
+        "hour_minutes": hour_minutes,
+        "durations": durations,
+        "location_minutes": location_minutes,
+        "top_activities": activity_counts.most_common(10),
+        "first_date": unique_days[0].item() if len(unique_days) else None,
+        "last_date": unique_days[-1].item() if len(unique_days) else None,
+        "level_counts": {level: len(set(field_values(activities, level)))
+                         for level in ("demand", "project", "activity", "behavior")},
+        "daytime_minutes": float(hour_minutes[slice(*DAYTIME_HOURS)].sum()),
+    }
+
+
+def _minutes_by(labels, durations):
+    """各标签的总时长，按标签首次出现的顺序"""
+    totals = {}
+    for label, minutes in zip(labels, durations.tolist()):
+        totals[label] = totals.get(label, 0) + minutes
+    return totals
+
+
+# 出行推断与活动空间计算
+def activity_point_arrays(activities):
+    """提取带坐标活动的时间与坐标数组，按UTC开始时间排序
+
+    start/end 是本地时间（用于按日期分组和显示），start_ts/end_ts 是UTC时间戳
+    （用于计算跨时区出行的真实间隔）。
+    """
+    lats, lngs = coordinate_columns(activities)
+    located = np.flatnonzero(~np.isnan(lats))
+    if not len(located):
+        return None
+    start_ts = number_column(activities, "start_ts")[located]
+    located = located[np.argsort(start_ts, kind="stable")]
+    return {
+        "start": time_column(activities, "start_time")[located],
+        "end": time_column(activities, "end_time")[located],
+        "start_ts": number_column(activities, "start_ts")[located],
+        "end_ts": number_column(activities, "end_ts")[located],
+        "duration": number_column(activities, "duration", float)[located],
+        "lat": lats[located],
+        "lng": lngs[located],
+    }
+
+
+def infer_trips(points):
+    """由相邻两次活动的坐标推断隐含出行：距离、间隔时间、隐含速度和异常标记"""
+    if points is None or len(points["lat"]) < 2:
+        return pd.DataFrame(columns=["出发时间", "到达时间", "日期", "距离(km)", "间隔(分钟)", "速度(km/h)", "速度异常"])
+
+    distance = haversine_km(points["lat"][:-1], points["lng"][:-1], points["lat"][1:], points["lng"][1:])
+    gap = (points["start_ts"][1:] - points["end_ts"][:-1]) / 60
+    # 首尾相接的记录间隔按1分钟计，避免除零；瞬移过远仍会被标记
+    speed = distance / (np.maximum(gap, 1.0) / 60)
+    return pd.DataFrame({
+        "出发时间": points["end"][:-1],
+        "到达时间": points["start"][1:],
+        "日期": points["start"][1:].astype("datetime64[D]"),
+        "距离(km)": distance,
+        "间隔(分钟)": gap,
+        "速度(km/h)": speed,
+        "速度异常": speed > MAX_PLAUSIBLE_SPEED_KMH,
+    })
+
+
+def daily_activity_space(points):
+    """按日计算以时长加权的回转半径和标准距离圆面积"""
+    if points is None:
+        return pd.DataFrame(columns=["日期", "地点数", "回转半径(km)", "活动空间(km²)"])
+
+    days, day_idx = np.unique(points["start"].astype("datetime64[D]"), return_inverse=True)
+    weights = np.maximum(points["duration"], 1.0)
+    weight_sum = np.bincount(day_idx, weights=weights)
+    center_lat = np.bincount(day_idx, weights=weights * points["lat"]) / weight_sum
+    center_lng = np.bincount(day_idx, weights=weights * points["lng"]) / weight_sum
+
+    dist = haversine_km(points["lat"], points["lng"], center_lat[day_idx], center_lng[day_idx])
+    radius = np.sqrt(np.bincount(day_idx, weights=weights * dist ** 2) / weight_sum)
+    return pd.DataFrame({
+        "日期": days,
+        "地点数": np.bincount(day_idx),
+        "回转半径(km)": radius,
+        "活动空间(km²)": np.pi * radius ** 2,
+    })
+
+
+def compute_mobility_metrics(activities):
+    """计算出行与活动空间指标，供数据概览使用"""
+    points = activity_point_arrays(activities)
+    trips = infer_trips(points)
+    daily_space = daily_activity_space(points)
+
+    daily_distance = trips.groupby("日期")["距离(km)"].sum() if not trips.empty else pd.Series(dtype=float)
+    overall_radius = 0.0
+    if points is not None:
+        weights = np.maximum(points["duration"], 1.0)
+        center_lat = np.average(points["lat"], weights=weights)
+        center_lng = np.average(points["lng"], weights=weights)
+        dist = haversine_km(points["lat"], points["lng"], center_lat, center_lng)
+        overall_radius = float(np.sqrt(np.average(dist ** 2, weights=weights)))
+
+    return {
+        "trips": trips,
+        "daily_distance": daily_distance,
+        "daily_space": daily_space,
+        "avg_daily_distance": float(daily_distance.mean()) if len(daily_distance) else 0.0,
+        "avg_daily_radius": float(daily_space["回转半径(km)"].mean()) if len(daily_space) else 0.0,
+        "avg_daily_area": float(daily_space["活动空间(km²)"].mean()) if len(daily_space) else 0.0,
+        "overall_radius": overall_radius,
+        "impossible_trips": int(trips["速度异常"].sum()) if not trips.empty else 0,
+    }
+
+
+# 日程矩阵：每天编码为固定分辨率的状态向量
+def build_day_matrix(activities, slot_minutes=15, level="需求"):
+    """把活动绘制到 天数×时段 的整数矩阵上，0表示未记录
+
+    每个活动按四舍五入覆盖它占据过半的时段，跨午夜的活动自然延伸到次日。
+    重叠时开始较晚的活动覆盖较早的。
+    """
+    if not activities:
+        return None
+
+    values = [" - ".join(parts) for parts in zip(*(field_values(activities, field)
+                                                   for field in DAY_MATRIX_LEVELS[level]))]
+    labels = sorted(set(values))
+    codes = np.searchsorted(labels, values) + 1
+    dtype = np.uint8 if len(labels) < 255 else np.uint16
+
+    starts = time_column(activities, "start_time").astype("int64")
+    ends = time_column(activities, "end_time").astype("int64")
+    order = np.argsort(starts, kind="stable")
+    starts, ends, codes = starts[order], ends[order], codes[order]
+
+    first_day = starts.min() // 1440
+    slots_per_day = 1440 // slot_minutes
+    origin = first_day * 1440
+    start_slot = np.round((starts - origin) / slot_minutes).astype(np.int64)
+    end_slot = np.round((ends - origin) / slot_minutes).astype(np.int64)
+    lengths = np.maximum(end_slot - start_slot, 0)
+    n_days = int(max(end_slot.max(), start_slot.max() + 1) // slots_per_day) + 1
+
+    # 展开所有 (活动, 时段) 对，一次性写入扁平矩阵
+    total = int(lengths.sum())
+    flat = np.zeros(n_days * slots_per_day, dtype=dtype)
+    if total:
+        offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        cells = np.repeat(start_slot, lengths) + (np.arange(total) - offsets)
+        flat[cells] = np.repeat(codes, lengths).astype(dtype)
+
+    return {
+        "dates": np.arange(first_day, first_day + n_days).astype("datetime64[D]"),
+        "matrix": flat.reshape(n_days, slots_per_day),
+        "labels": ["未记录"] + labels,
+        "slot_minutes": slot_minutes,
+    }
+
+
+def day_code_minutes(day_matrix):
+    """每天每种状态的分钟数，形状为 (天数, 状态数)"""
+    matrix = day_matrix["matrix"]
+    n_codes = len(day_matrix["labels"])
+    day_idx = np.repeat(np.arange(matrix.shape[0]), matrix.shape[1])
+    counts = np.bincount(day_idx * n_codes + matrix.ravel().astype(np.int64),
+                         minlength=matrix.shape[0] * n_codes)
+    return counts.reshape(matrix.shape[0], n_codes) * day_matrix["slot_minutes"]
+
+
+def recorded_day_mask(day_matrix):
+    """至少有一个时段有记录的天"""
+    return (day_matrix["matrix"] > 0).any(axis=1)
+
+
+def typical_day_profile(day_matrix, day_mask=None):
+    """典型一天：每个时段各状态出现的比例，形状为 (状态数, 时段数)"""
+    matrix = day_matrix["matrix"]
+    if day_mask is not None:
+        matrix = matrix[day_mask]
+    if not len(matrix):
+        return np.zeros((len(day_matrix["labels"]), day_matrix["matrix"].shape[1]))
+    return np.stack([(matrix == code).mean(axis=0) for code in range(len(day_matrix["labels"]))])
+
+
+def weekday_weekend_budget(day_matrix):
+    """工作日与周末的日均时间预算（分钟）"""
+    minutes = day_code_minutes(day_matrix)
+    recorded = recorded_day_mask(day_matrix)
+    weekend = ((day_matrix["dates"].astype("int64") + 3) % 7) >= 5  # 1970-01-01是周四
+    rows = {}
+    for name, mask in (("工作日", recorded & ~weekend), ("周末", recorded & weekend)):
+        rows[name] = minutes[mask].mean(axis=0) if mask.any() else np.zeros(minutes.shape[1])
+    return pd.DataFrame(rows, index=day_matrix["labels"]).drop(index="未记录")
+
+
+def day_similarity(day_matrix, rows=None):
+    """日期间的相似度：任一方有记录的时段中状态相同的比例
+
+    rows为日期索引列表时只计算这些日期与全部日期的相似度，避免多年数据下的
+    天数×天数全矩阵。
+    """
+    matrix = day_matrix["matrix"]
+    subset = matrix if rows is None else matrix[rows]
+    same = np.zeros((subset.shape[0], matrix.shape[0]), dtype=np.float32)
+    for code in range(1, len(day_matrix["labels"])):
+        same += (subset == code).astype(np.float32) @ (matrix == code).astype(np.float32).T
+    union = matrix.shape[1] - (subset == 0).astype(np.float32) @ (matrix == 0).astype(np.float32).T
+    return np.divide(same, union, out=np.zeros_like(same), where=union > 0)
+
+
+def day_feature_vectors(day_matrix, block_hours=2):
+    """按时间块统计各状态占比，作为日期聚类的特征"""
+    matrix = day_matrix["matrix"]
+    block_slots = block_hours * 60 // day_matrix["slot_minutes"]
+    n_blocks = matrix.shape[1] // block_slots
+    blocks = matrix[:, :n_blocks * block_slots].reshape(matrix.shape[0], n_blocks, block_slots)
+    return np.concatenate([(blocks == code).mean(axis=2) for code in range(len(day_matrix["labels"]))], axis=1)
+
+
+def cluster_day_types(day_matrix, n_clusters=4, iterations=30, seed=0):
+    """用k-means把有记录的日期聚成若干日程类型，返回 (日期索引, 类别)"""
+    days = np.flatnonzero(recorded_day_mask(day_matrix))
+    features = day_feature_vectors(day_matrix)[days]
+    n_clusters = min(n_clusters, len(days))
+    if n_clusters == 0:
+        return days, np.zeros(0, dtype=np.int64)
+
+    # k-means++ 初始化
+    rng = np.random.default_rng(seed)
+    centers = [features[rng.integers(len(features))]]
+    for _ in range(1, n_clusters):
+        dist = np.min([((features - c) ** 2).sum(axis=1) for c in centers], axis=0)
+        if dist.sum() == 0:
+            break
+        centers.append(features[rng.choice(len(features), p=dist / dist.sum())])
+    centers = np.array(centers)
+
+    for _ in range(iterations):
+        dist = ((features[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        assignment = dist.argmin(axis=1)
+        new_centers = np.array([features[assignment == k].mean(axis=0) if (assignment == k).any() else centers[k]
+                                for k in range(len(centers))])
+        if np.allclose(new_centers, centers):
+            break
+        centers = new_centers
+    return days, assignment
@@ -0,0 +1,173 @@
+# core/anomalies.py
+"""异常日检测：每天的特征向量与按日类型（工作日/周末）的稳健基线比较
+
+特征包括各需求的时间预算、记录总时长、出行距离、陌生地点停留、锚点缺失和
+常规日程缺失；基线是中位数与MAD，异常分是截断后稳健z分数的均方根。
+"""
+import datetime
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from .aggregations import activity_point_arrays, infer_trips
+from .history import field_values, number_column, time_column, window
+from .places import activity_places, place_anchors
+from .queries import activity_paths
+from .routines import mine_routines
+from .timezones import DEFAULT_TIMEZONE, local_to_epoch
+
+ANOMALY_MIN_DAYS = 14              # 至少需要这么多已结束的记录日才建立基线
+ANOMALY_Z_THRESHOLD = 3.0          # 稳健z分数超过该值的特征列为偏离原因
+ANOMALY_Z_CLIP = 10.0              # 单项z分数上限，避免一个特征主导总分
+ANOMALY_RARE_PLACE_SHARE = 0.05    # 出现天数占比低于该值的地点视为陌生地点
+ANOMALY_BASELINE_REFRESH_DAYS = 30  # 基线缓存超过该天数后整体重建
+
+
+def _anomaly_context(activities, place_keys, place_index, routine_index):
+    """由历史活动得到评分所需的基线上下文：需求列表、地点出现天数、锚点和常规日程"""
+    days = time_column(activities, "start_time").astype("datetime64[D]").astype("int64")
+    place_days = Counter(key for key, _ in set(zip(place_keys, days.tolist())) if key != "")
+    routines = {}
+    for routine in mine_routines(routine_index):
+        routines.setdefault(routine["weekday"], set()).add((routine["hour"], routine["path"]))
+    return {
+        "demands": sorted(set(field_values(activities, "demand"))),
+        "place_days": place_days,
+        "n_days": max(len(np.unique(days)), 1),
+        "anchors": place_anchors(place_index),
+        "routines": routines,
+    }
+
+
+def day_anomaly_features(activities, place_keys, context):
+    """为活动涉及的每一天计算特征向量，返回 (日期数组, 特征矩阵, 特征名称)"""
+    starts = time_column(activities, "start_time")
+    days = starts.astype("datetime64[D]")
+    unique_days, day_idx = np.unique(days.astype("int64"), return_inverse=True)
+    n = len(unique_days)
+    durations = number_column(activities, "duration", float)
+
+    # 各需求的时间预算
+    demands = context["demands"]
+    demand_pos = {demand: i for i, demand in enumerate(demands)}
+    codes = np.fromiter((demand_pos.get(demand, -1) for demand in field_values(activities, "demand")),
+                        dtype=np.int64, count=len(activities))
+    known = codes >= 0
+    demand_minutes = np.bincount(day_idx[known] * len(demands) + codes[known], weights=durations[known],
+                                 minlength=n * len(demands)).reshape(n, len(demands))
+    total_minutes = np.bincount(day_idx, weights=durations, minlength=n)
+
+    # 出行距离（排除速度异常的出行）
+    distance = np.zeros(n)
+    trips = infer_trips(activity_point_arrays(activities))
+    if not trips.empty:
+        trips = trips[~trips["速度异常"]]
+        trip_days = trips["日期"].to_numpy().astype("datetime64[D]").astype("int64")
+        distance = np.bincount(np.searchsorted(unique_days, trip_days), weights=trips["距离(km)"].to_numpy(),
+                               minlength=n)
+
+    # 陌生地点与锚点
+    share = np.fromiter((context["place_days"].get(key, 0) for key in place_keys), dtype=float,
+                        count=len(place_keys)) / context["n_days"]
+    rare = (share < ANOMALY_RARE_PLACE_SHARE) & np.fromiter((key != "" for key in place_keys), dtype=bool,
+                                                             count=len(place_keys))
+    rare_minutes = np.bincount(day_idx, weights=durations * rare, minlength=n)
+    weekdays = (unique_days + 3) % 7  # 1970-01-01是周四
+    anchor_missing = {}
+    for role in ("home", "work"):
+        anchor = context["anchors"].get(role)
+        at_anchor = np.fromiter((key == anchor for key in place_keys), dtype=float, count=len(place_keys))
+        missing = np.bincount(day_idx, weights=at_anchor, minlength=n) == 0
+        anchor_missing[role] = (missing & (anchor is not None) & (role == "home" or weekdays < 5)).astype(float)
+
+    # 常规日程缺失：该星期几的常规模式在前后一小时内没有出现
+    hours = ((starts - days).astype("int64") // 60).tolist()
+    present = set(zip(day_idx.tolist(), hours, activity_paths(activities)))
+    routine_missed = np.zeros(n)
+    for i, weekday in enumerate(weekdays.tolist()):
+        expected = context["routines"].get(weekday)
+        if expected:
+            missed = sum(all((i, hour + dh, path) not in present for dh in (-1, 0, 1)) for hour, path in expected)
+            routine_missed[i] = missed / len(expected)
+
+    features = np.column_stack([demand_minutes, total_minutes, distance, rare_minutes,
+                                anchor_missing["home"], anchor_missing["work"], routine_missed])
+    names = ([f"{demand}时长" for demand in demands]
+             + ["记录总时长", "出行距离", "陌生地点时长", "未到家", "工作日未到工作地", "常规缺失比例"])
+    return unique_days.astype("datetime64[D]"), features, names
+
+
+def anomaly_baseline(dates, features):
+    """按工作日/周末分别计算特征的中位数和稳健尺度（MAD，退化时用平均绝对偏差）"""
+    weekend = ((dates.astype("int64") + 3) % 7) >= 5
+    baseline = {}
+    for is_weekend in (False, True):
+        rows = features[weekend == is_weekend]
+        if len(rows) < ANOMALY_MIN_DAYS // 2:
+            rows = features
+        median = np.median(rows, axis=0)
+        deviation = np.abs(rows - median)
+        mad = np.median(deviation, axis=0) * 1.4826
+        baseline[is_weekend] = (median, np.where(mad > 0, mad, deviation.mean(axis=0) * 1.2533))
+    return baseline
+
+
+def score_anomalies(dates, features, baseline):
+    """稳健z分数及每天的异常分（z分数的均方根）"""
+    weekend = (((dates.astype("int64") + 3) % 7) >= 5)[:, None]
+    median = np.where(weekend, baseline[True][0], baseline[False][0])
+    scale = np.where(weekend, baseline[True][1], baseline[False][1])
+    z = np.divide(features - median, scale, out=np.zeros_like(features), where=scale > 0)
+    z = np.clip(z, -ANOMALY_Z_CLIP, ANOMALY_Z_CLIP)
+    return z, np.sqrt((z ** 2).mean(axis=1))
+
+
+def _closed_position(activities, closed_before, tz_name):
+    """closed_before（tz_name时区）零点之前开始的活动个数"""
+    midnight = datetime.datetime.combine(closed_before, datetime.time())
+    return int(np.searchsorted(number_column(activities, "start_ts"), local_to_epoch(midnight, tz_name)))
+
+
+def build_anomaly_report(activities, place_index, routine_index, closed_before, tz_name=DEFAULT_TIMEZONE):
+    """对closed_before之前已经结束的记录日整体计算特征、基线和异常分"""
+    closed = window(activities, 0, _closed_position(activities, closed_before, tz_name))
+    place_keys = activity_places(place_index, closed)
+    context = _anomaly_context(closed, place_keys, place_index, routine_index)
+    dates, features, names = day_anomaly_features(closed, place_keys, context) if closed else (None, None, [])
+    if dates is None or len(dates) < ANOMALY_MIN_DAYS:
+        return {"closed_before": closed_before, "baseline_date": closed_before, "dates": None}
+    baseline = anomaly_baseline(dates, features)
+    z, scores = score_anomalies(dates, features, baseline)
+    return {"closed_before": closed_before, "baseline_date": closed_before, "context": context,
+            "baseline": baseline, "names": names, "dates": dates, "z": z, "scores": scores}
+
+
+def extend_anomaly_report(report, activities, place_index, closed_before, tz_name=DEFAULT_TIMEZONE):
+    """新结束的日期只计算自身特征，用缓存的基线评分后追加"""
+    lo = _closed_position(activities, report["closed_before"], tz_name)
+    new = window(activities, lo, _closed_position(activities, closed_before, tz_name))
+    if new:
+        dates, features, _ = day_anomaly_features(new, activity_places(place_index, new), report["context"])
+        z, scores = score_anomalies(dates, features, report["baseline"])
+        report["dates"] = np.concatenate([report["dates"], dates])
+        report["z"] = np.concatenate([report["z"], z])
+        report["scores"] = np.concatenate([report["scores"], scores])
+    report["closed_before"] = closed_before
+
+
+def rank_anomalies(report, top_n=20):
+    """按异常分排列的日期及其主要偏离原因"""
+    rows = []
+    for i in np.argsort(-report["scores"], kind="stable")[:top_n]:
+        z = report["z"][i]
+        reasons = [f"{report['names'][j]}{'偏多' if z[j] > 0 else '偏少'}({z[j]:+.1f})"
+                   for j in np.argsort(-np.abs(z)) if abs(z[j]) >= ANOMALY_Z_THRESHOLD]
+        date = report["dates"][i].item()
+        rows.append({
+            "日期": date.isoformat(),
+            "星期": "一二三四五六日"[date.weekday()],
+            "异常分": round(float(report["scores"][i]), 2),
+            "主要偏离": "、".join(reasons[:4]) or "多项轻微偏离",
+        })
+    return pd.DataFrame(rows)
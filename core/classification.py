@@ -0,0 +1,341 @@
+# core/classification.py
+"""分类树索引：需求 → 企划 → 活动 → 行为 → 片段 五级分类的节点编号、路径解析和批量改名
+
+分类系统以嵌套字典持久化（行为下是片段名称列表），索引为其中每个节点分配编号，
+记录父节点、按名称的子节点和完整路径，父子查找与路径解析都是一次字典访问。
+只填写级联选择框时用不到活动，建立索引不读取活动历史。
+
+统计活动数、改名、合并前用 index_activities 按列读取活动编号和分类路径，建立
+倒排表：把活动编号挂在其路径末端的节点上（未记录片段的挂在行为节点），路径
+不在分类系统中的活动记为孤立活动（活动编号 → 路径）。改名、合并时按编号只
+取出并改写受影响的活动和模板，不物化全部历史。
+"""
+import numpy as np
+
+from .history import field_values, number_column, take
+
+CLASSIFICATION_LEVELS = ("demand", "project", "activity", "behavior", "segment")
+CLASSIFICATION_LEVEL_NAMES = ("需求", "企划", "活动", "行为", "片段")
+LEAF_DEPTH = len(CLASSIFICATION_LEVELS) - 1
+
+
+def classification_path(record):
+    """活动或模板的分类路径，去掉末尾未填写的层级（如未记录片段）"""
+    return trim_path(tuple(record.get(field, "") for field in CLASSIFICATION_LEVELS))
+
+
+def trim_path(path):
+    """去掉路径末尾的空层级"""
+    while path and not path[-1]:
+        path = path[:-1]
+    return path
+
+
+def build_classification_index(classification_system):
+    """为分类系统建立节点索引；活动倒排表（members、orphans）在 index_activities 之前为None"""
+    index = {"nodes": {}, "roots": {}, "paths": {}, "members": None, "orphans": None, "next_id": 1}
+    _add_subtree(index, None, (), classification_system)
+    return index
+
+
+def index_activities(index, activities):
+    """按列读取活动编号和分类路径，把活动登记到其路径末端的节点"""
+    index["members"] = {node_id: set() for node_id in index["nodes"]}
+    index["orphans"] = {}
+    ids = number_column(activities, "id").tolist()
+    paths = zip(*(field_values(activities, field, "") for field in CLASSIFICATION_LEVELS))
+    for activity_id, path in zip(ids, paths):
+        _add_member(index, activity_id, trim_path(path))
+
+
+def has_members(index):
+    return index["members"] is not None
+
+
+def _add_member(index, activity_id, path):
+    node_id = index["paths"].get(path)
+    if node_id is None:
+        index["orphans"][activity_id] = path
+    else:
+        index["members"][node_id].add(activity_id)
+
+
+def _rewrite_activities(activities, targets):
+    """把 {活动编号: 新路径前缀} 写入对应活动的前几级分类字段，只取出这些活动"""
+    if not targets:
+        return
+    ids = number_column(activities, "id")
+    positions = np.flatnonzero(np.isin(ids, np.fromiter(targets, dtype=ids.dtype, count=len(targets))))
+    for activity in take(activities, positions):
+        for field, name in zip(CLASSIFICATION_LEVELS, targets[activity["id"]]):
+            activity[field] = name
+
+
+def _add_node(index, parent_id, path):
+    node_id = index["next_id"]
+    index["next_id"] += 1
+    index["nodes"][node_id] = {"id": node_id, "name": path[-1], "depth": len(path) - 1,
+                               "parent": parent_id, "children": {}}
+    _siblings(index, parent_id)[path[-1]] = node_id
+    index["paths"][path] = node_id
+    if has_members(index):
+        index["members"][node_id] = set()
+    return node_id
+
+
+def _add_subtree(index, parent_id, path, children):
+    """登记 children（嵌套字典的一层或片段列表）中尚未登记的节点"""
+    if isinstance(children, list):
+        for name in children:
+            if path + (name,) not in index["paths"]:
+                _add_node(index, parent_id, path + (name,))
+        return
+    for name, grandchildren in children.items():
+        child_path = path + (name,)
+        node_id = index["paths"].get(child_path) or _add_node(index, parent_id, child_path)
+        _add_subtree(index, node_id, child_path, grandchildren)
+
+
+def _siblings(index, parent_id):
+    return index["roots"] if parent_id is None else index["nodes"][parent_id]["children"]
+
+
+def _subtree_ids(index, node_id):
+    """节点及其全部后代的编号"""
+    ids = [node_id]
+    for current in ids:
+        ids.extend(index["nodes"][current]["children"].values())
+    return ids
+
+
+def _subtree_members(index, node_id):
+    """子树中各节点登记的活动编号集合"""
+    return [index["members"][i] for i in _subtree_ids(index, node_id)]
+
+
+def _system_children(classification_system, path):
+    """嵌套字典中 path 节点的子节点：字典，行为节点为片段列表"""
+    children = classification_system
+    for name in path:
+        children = children[name]
+    return children
+
+
+def _remove_child(children, name):
+    if isinstance(children, list):
+        children.remove(name)
+    else:
+        del children[name]
+
+
+# 查询
+def resolve_path(index, path):
+    """路径对应的节点编号，不存在时返回None"""
+    return index["paths"].get(tuple(path))
+
+
+def node_path(index, node_id):
+    """节点编号对应的完整路径"""
+    names = []
+    while node_id is not None:
+        node = index["nodes"][node_id]
+        names.append(node["name"])
+        node_id = node["parent"]
+    return tuple(reversed(names))
+
+
+def child_names(index, path=()):
+    """路径下一级的名称列表（保持分类系统中的顺序），路径不存在时为空"""
+    if not path:
+        return list(index["roots"])
+    node_id = resolve_path(index, path)
+    return list(index["nodes"][node_id]["children"]) if node_id is not None else []
+
+
+def count_activities(index, path):
+    """路径下（含全部后代）的活动数，需要先 index_activities"""
+    node_id = resolve_path(index, path)
+    return sum(len(members) for members in _subtree_members(index, node_id)) if node_id is not None else 0
+
+
+# 活动登记：倒排表尚未建立时不需要维护
+def add_activity_to_index(index, activity):
+    if has_members(index):
+        _add_member(index, activity["id"], classification_path(activity))
+
+
+def remove_activity_from_index(index, activity):
+    if not has_members(index):
+        return
+    node_id = index["paths"].get(classification_path(activity))
+    if node_id is None:
+        index["orphans"].pop(activity["id"], None)
+    else:
+        index["members"][node_id].discard(activity["id"])
+
+
+def _adopt_orphans(index):
+    """路径已在分类系统中的孤立活动登记到对应节点"""
+    if not has_members(index):
+        return
+    for activity_id, path in list(index["orphans"].items()):
+        node_id = index["paths"].get(path)
+        if node_id is not None:
+            index["members"][node_id].add(activity_id)
+            del index["orphans"][activity_id]
+
+
+# 修改分类系统：嵌套字典、节点索引、活动和模板同步更新
+def add_node(index, classification_system, parent_path, name):
+    """在 parent_path 下添加子节点，已存在时返回False"""
+    parent_path = tuple(parent_path)
+    children = _system_children(classification_system, parent_path)
+    if name in children:
+        return False
+    if isinstance(children, list):
+        children.append(name)
+    else:
+        children[name] = [] if len(parent_path) == LEAF_DEPTH - 1 else {}
+    _add_node(index, resolve_path(index, parent_path) if parent_path else None, parent_path + (name,))
+    _adopt_orphans(index)
+    return True
+
+
+def delete_node(index, classification_system, path):
+    """删除没有活动的节点及其后代；仍有活动时返回False，应先合并到其他节点
+
+    需要先 index_activities。
+    """
+    path = tuple(path)
+    node_id = resolve_path(index, path)
+    if node_id is None or count_activities(index, path):
+        return False
+    _remove_child(_system_children(classification_system, path[:-1]), path[-1])
+    _drop_subtree(index, node_id)
+    return True
+
+
+def _drop_subtree(index, node_id):
+    """从索引中移除子树，返回其中登记的 {活动编号: 原路径}"""
+    moved = {}
+    node = index["nodes"][node_id]
+    del _siblings(index, node["parent"])[node["name"]]
+    for descendant in _subtree_ids(index, node_id):
+        path = node_path(index, descendant)
+        del index["paths"][path]
+        moved.update(dict.fromkeys(index["members"].pop(descendant, ()), path))
+    for descendant in _subtree_ids(index, node_id):
+        del index["nodes"][descendant]
+    return moved
+
+
+def rename_node(index, classification_system, templates, activities, path, new_name):
+    """节点改名并同步到其下的活动和模板，返回改写的活动数
+
+    同级已有同名节点时改为合并到该节点。需要先 index_activities。
+    """
+    path = tuple(path)
+    if new_name == path[-1]:
+        return 0
+    target = path[:-1] + (new_name,)
+    if target in index["paths"]:
+        return merge_nodes(index, classification_system, templates, activities, path, target)
+
+    node_id = resolve_path(index, path)
+    subtree = _subtree_ids(index, node_id)
+    old_paths = [node_path(index, i) for i in subtree]
+    siblings = _system_children(classification_system, path[:-1])
+    if isinstance(siblings, list):
+        siblings[siblings.index(path[-1])] = new_name
+    else:
+        _rename_key(siblings, path[-1], new_name)
+    node = index["nodes"][node_id]
+    _rename_key(_siblings(index, node["parent"]), path[-1], new_name)
+    node["name"] = new_name
+    for descendant, old_path in zip(subtree, old_paths):
+        del index["paths"][old_path]
+        index["paths"][target + old_path[len(path):]] = descendant
+
+    rewrites = {activity_id: target for members in _subtree_members(index, node_id) for activity_id in members}
+    rewrites.update(_retarget_orphans(index, path, target))
+    _rewrite_activities(activities, rewrites)
+    _retarget_templates(templates, path, target)
+    _adopt_orphans(index)
+    return len(rewrites)
+
+
+def merge_nodes(index, classification_system, templates, activities, source, target):
+    """把 source 节点合并到同一层级的 target 节点，返回改写的活动数
+
+    两者的子节点按名称合并（行为下的片段取并集），source 下的活动和模板改写为
+    target 下对应的路径，随后删除 source。需要先 index_activities。
+    """
+    source, target = tuple(source), tuple(target)
+    if len(source) != len(target) or source == target:
+        raise ValueError("只能合并同一层级的两个不同节点")
+    if len(source) <= LEAF_DEPTH:
+        _merge_children(_system_children(classification_system, target[:-1]), target[-1],
+                        _system_children(classification_system, source))
+    _remove_child(_system_children(classification_system, source[:-1]), source[-1])
+
+    moved = _drop_subtree(index, resolve_path(index, source))
+    if len(target) <= LEAF_DEPTH:
+        _add_subtree(index, resolve_path(index, target), target, _system_children(classification_system, target))
+
+    depth = len(source)
+    for activity_id, path in moved.items():
+        _add_member(index, activity_id, target + path[depth:])
+    rewrites = dict.fromkeys(moved, target)
+    rewrites.update(_retarget_orphans(index, source, target))
+    _rewrite_activities(activities, rewrites)
+    _retarget_templates(templates, source, target)
+    _adopt_orphans(index)
+    return len(rewrites)
+
+
+def restore_orphans(index, classification_system):
+    """把孤立活动的路径补回分类系统，返回补回的活动数；需要先 index_activities"""
+    restored = len(index["orphans"])
+    for path in dict.fromkeys(index["orphans"].values()):
+        for depth in range(len(path)):
+            if path[:depth + 1] not in index["paths"]:
+                add_node(index, classification_system, path[:depth], path[depth])
+    _adopt_orphans(index)
+    return restored - len(index["orphans"])
+
+
+def _rename_key(mapping, old, new):
+    """保持顺序地改名字典的键（原地修改）"""
+    items = [(new if key == old else key, value) for key, value in mapping.items()]
+    mapping.clear()
+    mapping.update(items)
+
+
+def _merge_children(parent, name, source):
+    """把 source（子节点字典或片段列表）合并进 parent[name]"""
+    if name not in parent:
+        parent[name] = source
+    elif isinstance(source, list):
+        parent[name].extend(segment for segment in source if segment not in parent[name])
+    else:
+        for child, grandchildren in source.items():
+            _merge_children(parent[name], child, grandchildren)
+
+
+def _retarget_orphans(index, source, target):
+    """孤立活动中路径以 source 开头的同样改写路径，返回 {活动编号: target}"""
+    depth = len(source)
+    changed = {}
+    for activity_id, path in index["orphans"].items():
+        if path[:depth] == source:
+            index["orphans"][activity_id] = target + path[depth:]
+            changed[activity_id] = target
+    return changed
+
+
+def _retarget_templates(templates, source, target):
+    depth = len(source)
+    for template in templates.values():
+        if classification_path(template)[:depth] == source:
+            for field, name in zip(CLASSIFICATION_LEVELS[:depth], target):
+                template[field] = name
@@ -0,0 +1,291 @@
+# core/columnar.py
+"""列式活动文件：字典编码的字符串列和定长数值列，读取时内存映射
+
+文件布局为魔数行、8字节小端的头部长度、JSON头部，之后是按8字节对齐的各列
+数据。头部记录每列的名称、类型、偏移，字符串列另存去重后的词表，列数据只是
+int32词表编号（-1表示该活动没有这个字段）；整数列为int64，本地时间列为
+int64的秒或微秒数，坐标列为 (行数, 2) 的float64（没有坐标时为NaN）。
+无法归入这些类型的字段按JSON字符串字典编码。
+
+read_columns 只解析头部并用 np.memmap 映射各列，不复制文件内容；
+materialize 把其中若干行批量解码为活动字典（按需物化见 core.history）。
+
+数据文件写成后不再修改：每次保存写入新的版本文件“名称.版本号.扩展名”，再
+替换只记录版本文件名的指针文件（即调用方使用的路径），已映射旧版本的读者不
+受影响。Windows 上仍被映射的文件不能替换或删除，因此被替换的只有不会被映射
+的指针文件；旧版本文件在之后的保存中、已不再被映射时才删掉。
+"""
+import json
+import os
+import re
+import struct
+import uuid
+
+import numpy as np
+
+MAGIC = b"TGCOL1\n"
+POINTER_MAGIC = b"TGCOLPTR\n"
+ALIGNMENT = 8
+TIME_FIELDS = ("start_time", "end_time", "created_at")
+ABSENT = object()
+
+
+# 编码
+def _is_int(value):
+    return type(value) is int
+
+
+def _is_point(value):
+    return value is None or (isinstance(value, dict) and value.keys() == {"lat", "lng"}
+                             and all(isinstance(v, (int, float)) for v in value.values()))
+
+
+def _dictionary(values):
+    """字符串（或任意可比较值）的词表和int32编号，缺失值编号为-1"""
+    codes, vocab = {}, []
+    encoded = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        if value is ABSENT:
+            encoded[i] = -1
+            continue
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(vocab)
+            vocab.append(value)
+        encoded[i] = code
+    return vocab, encoded
+
+
+def _encode_time(values):
+    """ISO本地时间字符串转换为整数列，不能原样还原时返回None"""
+    try:
+        micros = np.array(values, dtype="datetime64[us]").astype(np.int64)
+    except (TypeError, ValueError):
+        return None
+    unit = "s" if not (micros % 1_000_000).any() else "us"
+    data = micros // 1_000_000 if unit == "s" else micros
+    column = {"kind": "time", "unit": unit}
+    if _decode_time(column, data) != values:
+        return None
+    return column, data
+
+
+def encode_column(name, values):
+    """一列字段值的头部描述和数据数组"""
+    present = all(value is not ABSENT for value in values)
+    if present and all(_is_int(value) for value in values):
+        return {"kind": "int"}, np.array(values, dtype=np.int64)
+    if present and all(_is_point(value) for value in values):
+        data = np.full((len(values), 2), np.nan)
+        for i, value in enumerate(values):
+            if value is not None:
+                data[i] = value["lat"], value["lng"]
+        return {"kind": "point"}, data
+    if present and name in TIME_FIELDS and all(isinstance(value, str) for value in values):
+        encoded = _encode_time(values)
+        if encoded is not None:
+            return encoded
+    if all(value is ABSENT or isinstance(value, str) for value in values):
+        vocab, codes = _dictionary(values)
+        return {"kind": "str", "vocab": vocab}, codes
+    vocab, codes = _dictionary([value if value is ABSENT else json.dumps(value, ensure_ascii=False)
+                                for value in values])
+    return {"kind": "json", "vocab": vocab}, codes
+
+
+def patch_column(column, rows, positions, values):
+    """复用已有列的编码：取出文件中 rows 行的数据，把 positions 处替换为 values 的编码
+
+    返回 (头部描述, 数据数组)；values 中有不符合该列类型的值时返回None。
+    """
+    kind = column["kind"]
+    data = column["data"][rows]
+    header = {key: value for key, value in column.items() if key not in ("name", "dtype", "offset", "data", "parsed")}
+    if kind in ("str", "json"):
+        if kind == "str" and not all(value is ABSENT or isinstance(value, str) for value in values):
+            return None
+        vocab = list(column["vocab"])
+        codes = {value: code for code, value in enumerate(vocab)}
+        for position, value in zip(positions, values):
+            if value is ABSENT:
+                data[position] = -1
+                continue
+            if kind == "json":
+                value = json.dumps(value, ensure_ascii=False)
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(vocab)
+                vocab.append(value)
+            data[position] = code
+        # 删除、改名后不再使用的词去掉
+        used, data = np.unique(data, return_inverse=True)
+        data = data.reshape(-1).astype(np.int32) - int(len(used) > 0 and used[0] < 0)
+        header["vocab"] = [vocab[code] for code in used.tolist() if code >= 0]
+    elif kind == "int":
+        if not all(_is_int(value) for value in values):
+            return None
+        data[positions] = values
+    elif kind == "point":
+        if not all(value is not ABSENT and _is_point(value) for value in values):
+            return None
+        for position, value in zip(positions, values):
+            data[position] = (value["lat"], value["lng"]) if value is not None else (np.nan, np.nan)
+    elif kind == "time":
+        if not all(isinstance(value, str) for value in values):
+            return None
+        try:
+            micros = np.array(values, dtype="datetime64[us]").astype(np.int64)
+        except ValueError:
+            return None
+        if header["unit"] == "s":
+            if (micros % 1_000_000).any():
+                return None
+            micros //= 1_000_000
+        if _decode_time(header, micros) != values:
+            return None
+        data[positions] = micros
+    else:
+        return None
+    return header, data
+
+
+def write_columns(file_path, rows, encoded):
+    """把 [(列名, 头部描述, 数据数组), ...] 写成新的版本文件，并让 file_path 指向它"""
+    header = {"rows": rows, "columns": []}
+    blocks = []
+    offset = 0
+    for name, column, data in encoded:
+        data = np.ascontiguousarray(data)
+        header["columns"].append(dict(column, name=name, dtype=data.dtype.str, offset=offset))
+        blocks.append(data)
+        offset += -(-data.nbytes // ALIGNMENT) * ALIGNMENT
+
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    preamble = len(MAGIC) + 8 + len(header_bytes)
+    padding = -preamble % ALIGNMENT
+    stem, ext = os.path.splitext(file_path)
+    version_path = f"{stem}.{uuid.uuid4().hex}{ext}"
+    with open(version_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes) + padding))
+        f.write(header_bytes + b" " * padding)
+        for data in blocks:
+            f.write(data.tobytes())
+            f.write(b"\0" * (-data.nbytes % ALIGNMENT))
+
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(POINTER_MAGIC + os.path.basename(version_path).encode("utf-8"))
+    os.replace(temp_path, file_path)
+    _remove_old_versions(file_path, version_path)
+
+
+def _remove_old_versions(file_path, current):
+    """删除 file_path 以前的版本文件，仍被映射（Windows）而删不掉的留到下次保存"""
+    directory = os.path.dirname(file_path) or "."
+    stem, ext = os.path.splitext(os.path.basename(file_path))
+    pattern = re.compile(re.escape(stem) + r"\.[0-9a-f]{32}" + re.escape(ext))
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if pattern.fullmatch(name) and name != os.path.basename(current):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def write_activities(file_path, activities):
+    """把活动列表写成列式文件"""
+    names = list(dict.fromkeys(name for activity in activities for name in activity))
+    write_columns(file_path, len(activities),
+                  [(name,) + encode_column(name, [activity.get(name, ABSENT) for activity in activities])
+                   for name in names])
+
+
+# 读取
+def data_file(file_path):
+    """file_path 当前指向的版本文件；直接写成的单个列式文件就是它本身"""
+    with open(file_path, "rb") as f:
+        if f.read(len(POINTER_MAGIC)) != POINTER_MAGIC:
+            return file_path
+        name = f.read().decode("utf-8")
+    return os.path.join(os.path.dirname(file_path), name)
+
+
+def read_columns(file_path):
+    """映射列式文件，返回 {"rows": 行数, "columns": {列名: 头部描述（含data数组）}}"""
+    file_path = data_file(file_path)
+    with open(file_path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{file_path} 不是列式活动文件")
+        header_length, = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_length))
+    base = len(MAGIC) + 8 + header_length
+    rows = header["rows"]
+    columns = {}
+    for column in header["columns"]:
+        shape = (rows, 2) if column["kind"] == "point" else (rows,)
+        dtype = np.dtype(column["dtype"])
+        column["data"] = (np.memmap(file_path, dtype=dtype, mode="r", offset=base + column["offset"], shape=shape)
+                          if rows else np.empty(shape, dtype=dtype))
+        columns[column["name"]] = column
+    return {"rows": rows, "columns": columns}
+
+
+def _decode_time(column, data):
+    """整数时间列还原为ISO字符串：日期和时刻分别去重格式化后拼接"""
+    data = np.asarray(data, dtype=np.int64)
+    seconds, micros = (data, None) if column["unit"] == "s" else np.divmod(data, 1_000_000)
+    days, clock = np.divmod(seconds, 86400)
+    day_values, day_codes = np.unique(days, return_inverse=True)
+    clock_values, clock_codes = np.unique(clock, return_inverse=True)
+    day_text = np.datetime_as_string(day_values.astype("datetime64[D]")).tolist()
+    clock_text = [f"T{c // 3600:02d}:{c // 60 % 60:02d}:{c % 60:02d}" for c in clock_values.tolist()]
+    strings = [day_text[d] + clock_text[c] for d, c in zip(day_codes.reshape(-1).tolist(),
+                                                          clock_codes.reshape(-1).tolist())]
+    if micros is not None:
+        # isoformat() 在微秒为0时省略小数部分
+        for i in np.flatnonzero(micros).tolist():
+            strings[i] += f".{micros[i]:06d}"
+    return strings
+
+
+def decode_column(column, rows=slice(None), missing=ABSENT):
+    """把一列（或其中 rows 选中的行）解码为Python值列表，没有该字段的活动取 missing"""
+    data = column["data"][rows]
+    kind = column["kind"]
+    if kind == "int":
+        return data.tolist()
+    if kind == "time":
+        return _decode_time(column, data)
+    if kind == "point":
+        return [None if lat != lat else {"lat": lat, "lng": lng} for lat, lng in data.tolist()]
+    vocab = column["vocab"]
+    codes = data.tolist()
+    if kind == "str":
+        return [vocab[code] if code >= 0 else missing for code in codes]
+    # 解析后的词表缓存在列描述上，按行解码时不必每次解析整个词表；
+    # 列表和字典每行重新解析，避免不同活动共享同一个可变对象
+    parsed = column.get("parsed")
+    if parsed is None:
+        parsed = column["parsed"] = [json.loads(value) for value in vocab]
+    return [missing if code < 0 else json.loads(vocab[code]) if isinstance(parsed[code], (list, dict)) else parsed[code]
+            for code in codes]
+
+
+def materialize(table, rows=slice(None)):
+    """把列式表中 rows 选中的行还原为活动字典列表"""
+    names = list(table["columns"])
+    values = [decode_column(table["columns"][name], rows) for name in names]
+    activities = [dict(zip(names, row)) for row in zip(*values)]
+    for name, column, decoded in zip(names, table["columns"].values(), values):
+        if column["kind"] in ("str", "json") and (column["data"][rows] < 0).any():
+            for activity, value in zip(activities, decoded):
+                if value is ABSENT:
+                    del activity[name]
+    return activities
+
+
+def read_activities(file_path):
+    """读取列式文件为活动字典列表"""
+    return materialize(read_columns(file_path))
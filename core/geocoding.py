@@ -0,0 +1,21 @@
+# core/geocoding.py
+"""地理编码：按名称搜索地点坐标"""
+
+GEOCODER_USER_AGENT = "personal_activity_tracker"
+
+
+def search_location(query, user_agent=GEOCODER_USER_AGENT, country_codes="cn"):
+    """使用Nominatim搜索地点，返回 {name, lat, lng}，找不到时返回None
+
+    网络或服务错误直接抛出，由调用方决定如何提示。
+    """
+    from geopy.geocoders import Nominatim
+    geolocator = Nominatim(user_agent=user_agent)
+    location = geolocator.geocode(query, addressdetails=True, country_codes=country_codes)
+    if location:
+        return {
+            "name": location.address,
+            "lat": location.latitude,
+            "lng": location.longitude
+        }
+    return None
@@ -0,0 +1,118 @@
+# core/hierarchy.py
+"""分类层级汇总：分类树每个节点的时长和活动数，支持按日期范围筛选
+
+一次扫描把活动汇总为 天数×叶路径 的时长矩阵和次数矩阵（时长按本地日期拆分，
+次数计在开始日期），节点结构与叶路径到各级祖先节点的映射同时建好。任意日期
+范围的各节点汇总只需对矩阵切片求和再按祖先累加，与原始记录数无关；旭日图、
+矩形树图的展开折叠在前端完成，不需要重新计算。
+"""
+import numpy as np
+import pandas as pd
+
+from .classification import CLASSIFICATION_LEVELS, classification_path, trim_path
+from .history import field_values
+from .intervals import split_by_day
+
+HIERARCHY_COLUMNS = ["id", "parent", "名称", "层级", "时长(分钟)", "活动数"]
+
+
+def build_hierarchy_cube(activities):
+    """建立按天、按叶路径的汇总矩阵，没有活动时返回None"""
+    if not activities:
+        return None
+    paths = [trim_path(path) for path in zip(*(field_values(activities, level, "") for level in CLASSIFICATION_LEVELS))]
+    leaves = sorted(set(paths))
+    leaf_codes = {path: code for code, path in enumerate(leaves)}
+    codes = np.fromiter((leaf_codes[path] for path in paths), dtype=np.int64, count=len(activities))
+
+    rows, days, minutes = split_by_day(activities)
+    first_day = days.min()
+    n_days = int((days.max() - first_day).astype(np.int64)) + 1
+    day_idx = (days - first_day).astype(np.int64)
+    cube_minutes = np.zeros((n_days, len(leaves)))
+    np.add.at(cube_minutes, (day_idx, codes[rows]), minutes)
+    # 每个活动的第一段就是开始日期
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    cube_counts = np.zeros((n_days, len(leaves)), dtype=np.int32)
+    np.add.at(cube_counts, (day_idx[starts], codes[rows[starts]]), 1)
+
+    cube = {"dates": first_day + np.arange(n_days), "leaves": leaves, "leaf_codes": leaf_codes,
+            "minutes": cube_minutes, "counts": cube_counts}
+    cube.update(_node_structure(leaves))
+    return cube
+
+
+def _node_structure(leaves):
+    """叶路径的全部前缀节点，以及每个叶路径在各层级的祖先节点编号（路径较短时为-1）"""
+    nodes, node_codes = [], {}
+    ancestors = np.full((len(leaves), len(CLASSIFICATION_LEVELS)), -1, dtype=np.int64)
+    for leaf_code, leaf in enumerate(leaves):
+        for depth in range(len(leaf)):
+            prefix = leaf[:depth + 1]
+            code = node_codes.get(prefix)
+            if code is None:
+                code = node_codes[prefix] = len(nodes)
+                nodes.append(prefix)
+            ancestors[leaf_code, depth] = code
+    return {"nodes": nodes, "ancestors": ancestors}
+
+
+def update_hierarchy_cube(cube, activity, sign=1):
+    """按差量计入（sign=1）或扣除（sign=-1）一条活动
+
+    活动的叶路径或日期超出已有矩阵时返回False，由调用方丢弃后重建。
+    """
+    leaf_code = cube["leaf_codes"].get(classification_path(activity))
+    if leaf_code is None:
+        return False
+    _, days, minutes = split_by_day([activity])
+    day_idx = (days - cube["dates"][0]).astype(np.int64)
+    if day_idx.min() < 0 or day_idx.max() >= len(cube["dates"]):
+        return False
+    cube["minutes"][day_idx, leaf_code] += minutes * sign
+    cube["counts"][day_idx[0], leaf_code] += sign
+    return True
+
+
+def _day_slice(cube, start_date=None, end_date=None):
+    first = cube["dates"][0]
+    lo = max(int((np.datetime64(start_date) - first).astype(np.int64)), 0) if start_date else 0
+    hi = int((np.datetime64(end_date) - first).astype(np.int64)) + 1 if end_date else len(cube["dates"])
+    return slice(lo, max(hi, lo))
+
+
+def hierarchy_totals(cube, start_date=None, end_date=None):
+    """日期范围内各节点的 (分钟数, 活动数) 数组，顺序与 cube["nodes"] 一致"""
+    days = _day_slice(cube, start_date, end_date)
+    leaf_minutes = cube["minutes"][days].sum(axis=0)
+    leaf_counts = cube["counts"][days].sum(axis=0)
+    n_nodes = len(cube["nodes"])
+    node_minutes, node_counts = np.zeros(n_nodes), np.zeros(n_nodes)
+    for level in cube["ancestors"].T:
+        present = level >= 0
+        node_minutes += np.bincount(level[present], weights=leaf_minutes[present], minlength=n_nodes)
+        node_counts += np.bincount(level[present], weights=leaf_counts[present], minlength=n_nodes)
+    return node_minutes, node_counts.astype(np.int64)
+
+
+def hierarchy_frame(cube, start_date=None, end_date=None, level_names=None):
+    """日期范围内有记录的节点表，列为 HIERARCHY_COLUMNS，可直接用于旭日图和矩形树图
+
+    id 与 parent 是以 " → " 连接的路径，顶层节点的 parent 为空字符串。
+    """
+    if cube is None:
+        return pd.DataFrame(columns=HIERARCHY_COLUMNS)
+    node_minutes, node_counts = hierarchy_totals(cube, start_date, end_date)
+    rows = []
+    for path, minutes, count in zip(cube["nodes"], node_minutes.tolist(), node_counts.tolist()):
+        if minutes <= 0 and count <= 0:
+            continue
+        rows.append({
+            "id": " → ".join(path),
+            "parent": " → ".join(path[:-1]),
+            "名称": path[-1] or "（未填写）",
+            "层级": level_names[len(path) - 1] if level_names else len(path) - 1,
+            "时长(分钟)": int(minutes),
+            "活动数": count,
+        })
+    return pd.DataFrame(rows, columns=HIERARCHY_COLUMNS)
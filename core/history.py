@@ -0,0 +1,293 @@
+# core/history.py
+"""按需物化的活动历史：在内存映射的列式文件上提供活动列表接口
+
+ActivityHistory 是一个可变序列，底层是 columnar.read_columns 映射的各列；同一
+进程中打开同一版本文件的会话共享这份映射，也共享操作系统的页缓存。每个会话
+只保存自己的行顺序数组、访问过的活动字典和新增的活动：按下标、切片或二分
+查找访问时才把对应的行解码为字典并缓存，之后对字典的修改在缓存中生效；整体
+遍历（正向或反向）按块解码，会物化全部行。
+
+统计函数通过 field_values、number_column、time_column、coordinate_columns
+读取整列：对 ActivityHistory 直接取自映射的列（已物化或新增的活动以字典为准），
+对普通活动列表逐条读取字典，两者结果相同。
+"""
+import os
+from collections.abc import MutableSequence
+
+import numpy as np
+
+from . import columnar
+
+ITER_CHUNK = 4096  # 整体遍历时每次批量解码的行数
+
+_shared_tables = {}
+
+
+class ActivityHistory(MutableSequence):
+    """列式文件上的活动列表
+
+    _order 是当前的行顺序：非负数为文件中的行号，负数 ~k 指向本会话新增的
+    第k条活动。
+    """
+
+    def __init__(self, table):
+        self._table = table
+        self._order = np.arange(table["rows"], dtype=np.int64)
+        self._loaded = {}
+        self._added = []
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return self._entries(self._order[position])
+        return self._entries(self._order[[position]])[0]
+
+    def __setitem__(self, position, activity):
+        if isinstance(position, slice):
+            raise TypeError("ActivityHistory 不支持切片赋值")
+        self._added.append(activity)
+        self._order[position] = ~(len(self._added) - 1)
+
+    def __delitem__(self, position):
+        removed = self._order[position]
+        for entry in np.atleast_1d(removed).tolist():
+            if entry >= 0:
+                self._loaded.pop(entry, None)
+        self._order = np.delete(self._order, np.arange(len(self._order))[position])
+
+    def insert(self, position, activity):
+        n = len(self._order)
+        position = max(0, min(n, position if position >= 0 else n + position))
+        self._added.append(activity)
+        self._order = np.insert(self._order, position, ~(len(self._added) - 1))
+
+    def extend(self, activities):
+        activities = list(activities)
+        first = len(self._added)
+        self._added.extend(activities)
+        self._order = np.concatenate([self._order, ~np.arange(first, first + len(activities), dtype=np.int64)])
+
+    def take(self, positions):
+        """按位置列表批量取出活动"""
+        return self._entries(self._order[np.asarray(positions, dtype=np.int64)])
+
+    def window(self, start, stop):
+        """[start, stop) 位置的只读视图，与本历史共享已物化的字典"""
+        view = ActivityHistory.__new__(ActivityHistory)
+        view._table, view._loaded, view._added = self._table, self._loaded, self._added
+        view._order = self._order[start:stop]
+        return view
+
+    def __iter__(self):
+        for start in range(0, len(self._order), ITER_CHUNK):
+            yield from self._entries(self._order[start:start + ITER_CHUNK])
+
+    def __reversed__(self):
+        for stop in range(len(self._order), 0, -ITER_CHUNK):
+            yield from reversed(self._entries(self._order[max(0, stop - ITER_CHUNK):stop]))
+
+    def sort(self, key=None, reverse=False):
+        """与 list.sort 相同（稳定排序），需要物化全部活动；按数值列排序用 sort_by"""
+        keys = [key(activity) if key else activity for activity in self]
+        self._order = self._order[sorted(range(len(keys)), key=keys.__getitem__, reverse=reverse)]
+
+    def sort_by(self, field):
+        """按整数字段（如 start_ts）稳定排序，直接使用映射的列"""
+        self._order = self._order[np.argsort(self.number_column(field), kind="stable")]
+
+    # 物化
+    def _entries(self, entries):
+        """行顺序条目对应的活动字典，未解码的行批量解码后缓存"""
+        entries = np.asarray(entries).tolist()
+        missing = sorted({entry for entry in entries if entry >= 0 and entry not in self._loaded})
+        if missing:
+            self._loaded.update(zip(missing, columnar.materialize(self._table, np.array(missing))))
+        return [self._loaded[entry] if entry >= 0 else self._added[~entry] for entry in entries]
+
+    def _overrides(self):
+        """已物化或新增的活动所在位置和字典，读取整列时以这些字典为准"""
+        mask = self._order < 0
+        if self._loaded:
+            mask |= np.isin(self._order, np.fromiter(self._loaded, dtype=np.int64, count=len(self._loaded)))
+        positions = np.flatnonzero(mask)
+        return positions.tolist(), self._entries(self._order[positions])
+
+    def _base(self, name):
+        """某字段在文件中的列及与当前顺序对应的行号，文件中没有该列时返回 (None, None)"""
+        column = self._table["columns"].get(name)
+        if column is None or not self._table["rows"]:
+            return None, None
+        return column, np.maximum(self._order, 0)
+
+    # 整列读取
+    def field_values(self, name, default=None):
+        column, rows = self._base(name)
+        if column is None:
+            values = [default] * len(self._order)
+        else:
+            values = columnar.decode_column(column, rows, missing=default)
+        for position, activity in zip(*self._overrides()):
+            values[position] = activity.get(name, default)
+        return values
+
+    def number_column(self, name, dtype=np.int64):
+        column, rows = self._base(name)
+        if column is None or column["kind"] != "int":
+            return np.array(self.field_values(name), dtype=dtype)
+        values = column["data"][rows].astype(dtype)
+        positions, activities = self._overrides()
+        values[positions] = [activity[name] for activity in activities]
+        return values
+
+    def time_column(self, name):
+        column, rows = self._base(name)
+        if column is None or column["kind"] != "time":
+            return _parse_minutes(self.field_values(name))
+        values = column["data"][rows].astype(f"datetime64[{column['unit']}]").astype("datetime64[m]")
+        positions, activities = self._overrides()
+        if positions:
+            values[positions] = _parse_minutes([activity[name] for activity in activities])
+        return values
+
+    def coordinate_columns(self):
+        column, rows = self._base("coordinates")
+        if column is None or column["kind"] != "point":
+            return _coordinates(self.field_values("coordinates"))
+        points = column["data"][rows]
+        lats, lngs = points[:, 0].copy(), points[:, 1].copy()
+        positions, activities = self._overrides()
+        if positions:
+            lats[positions], lngs[positions] = _coordinates([activity.get("coordinates") for activity in activities])
+        return lats, lngs
+
+    def incomplete(self, fields):
+        """可能缺少 fields 中某个字段（或其值为空）的活动；文件中这些列齐全的行不必物化"""
+        suspect = self._order < 0
+        for name in fields:
+            column, rows = self._base(name)
+            if column is None:
+                suspect[:] = True
+            elif column["kind"] == "str":
+                empty = np.array([value == "" for value in column["vocab"]] + [True])
+                suspect |= empty[column["data"][rows]]
+            elif column["kind"] != "int":
+                suspect |= self._order >= 0
+        positions, _ = self._overrides()
+        suspect[positions] = True
+        return self._entries(self._order[np.flatnonzero(suspect)])
+
+    # 保存
+    def encoded_columns(self):
+        """按列编码当前内容，供 columnar.write_columns 写入
+
+        文件中已有的列直接复用其编码，只对已物化或新增的活动重新编码；
+        取值不符合该列类型时整列重新编码。
+        """
+        positions, activities = self._overrides()
+        names = list(self._table["columns"]) if self._table["rows"] else []
+        names += [name for name in dict.fromkeys(key for activity in activities for key in activity) if name not in names]
+        encoded = []
+        for name in names:
+            column, rows = self._base(name)
+            result = None
+            if column is not None:
+                result = columnar.patch_column(column, rows, positions,
+                                               [activity.get(name, columnar.ABSENT) for activity in activities])
+            if result is None:
+                result = columnar.encode_column(name, self.field_values(name, columnar.ABSENT))
+            encoded.append((name,) + result)
+        return encoded
+
+
+def _parse_minutes(values):
+    return np.array(values, dtype="datetime64[us]").astype("datetime64[m]")
+
+
+def _coordinates(values):
+    lats, lngs = np.full(len(values), np.nan), np.full(len(values), np.nan)
+    for i, coords in enumerate(values):
+        if coords:
+            lats[i], lngs[i] = coords["lat"], coords["lng"]
+    return lats, lngs
+
+
+def open_history(file_path):
+    """打开列式活动文件；同一版本的文件在进程内只映射一次"""
+    version_path = columnar.data_file(file_path)
+    stat = os.stat(version_path)
+    key = (os.path.abspath(file_path), os.path.abspath(version_path), stat.st_mtime_ns, stat.st_size)
+    table = _shared_tables.get(key)
+    if table is None:
+        # 旧版本的映射由仍在使用它的会话持有，这里只保留最新版本
+        for old in [k for k in _shared_tables if k[0] == key[0]]:
+            del _shared_tables[old]
+        table = _shared_tables[key] = columnar.read_columns(file_path)
+    return ActivityHistory(table)
+
+
+def save_history(file_path, activities):
+    """把活动（ActivityHistory 或活动列表）写成列式文件"""
+    if isinstance(activities, ActivityHistory):
+        columnar.write_columns(file_path, len(activities), activities.encoded_columns())
+    else:
+        columnar.write_activities(file_path, activities)
+
+
+# 统一的整列读取：ActivityHistory 直接读列，活动列表逐条读取
+def field_values(activities, name, default=None):
+    """每条活动某字段的值列表，缺少该字段时为 default"""
+    if isinstance(activities, ActivityHistory):
+        return activities.field_values(name, default)
+    return [activity.get(name, default) for activity in activities]
+
+
+def number_column(activities, name, dtype=np.int64):
+    """数值字段的数组"""
+    if isinstance(activities, ActivityHistory):
+        return activities.number_column(name, dtype)
+    return np.fromiter((activity[name] for activity in activities), dtype=dtype, count=len(activities))
+
+
+def time_column(activities, name):
+    """本地时间字段（start_time / end_time）的分钟精度datetime64数组"""
+    if isinstance(activities, ActivityHistory):
+        return activities.time_column(name)
+    return _parse_minutes([activity[name] for activity in activities])
+
+
+def coordinate_columns(activities):
+    """坐标的纬度、经度数组，没有坐标的活动为NaN"""
+    if isinstance(activities, ActivityHistory):
+        return activities.coordinate_columns()
+    return _coordinates([activity.get("coordinates") for activity in activities])
+
+
+def take(activities, positions):
+    """按位置列表取出活动，ActivityHistory 一次批量物化"""
+    if isinstance(activities, ActivityHistory):
+        return activities.take(positions)
+    return [activities[i] for i in positions]
+
+
+def window(activities, start, stop):
+    """activities[start:stop]，ActivityHistory 返回不物化的视图"""
+    if isinstance(activities, ActivityHistory):
+        return activities.window(start, stop)
+    return activities[start:stop]
+
+
+def incomplete_activities(activities, fields):
+    """可能缺少 fields 中某个字段或其值为空的活动（供数据迁移检查）"""
+    if isinstance(activities, ActivityHistory):
+        return activities.incomplete(fields)
+    return activities
+
+
+def sort_by_start(activities):
+    """按UTC开始时间戳原地稳定排序"""
+    if isinstance(activities, ActivityHistory):
+        activities.sort_by("start_ts")
+    else:
+        activities.sort(key=lambda a: a["start_ts"])
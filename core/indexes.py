@@ -0,0 +1,216 @@
+# core/indexes.py
+"""派生索引的缓存与维护
+
+索引保存在一个可变映射（界面中是 st.session_state，批处理中是普通字典）里，
+与活动列表 state["activities"] 放在一起。首次访问时整体构建；新增活动时
+on_activity_added 增量更新已构建的索引；删除单条活动时 on_activity_removed
+按差量更新地点索引、汇总表、分类索引、分类层级汇总和模板使用索引，丢弃其余索引；导入、清空等整体修改后调用
+invalidate_activity_indexes 全部丢弃，下次访问时重建。分类改名、合并时
+分类索引原地更新并改写受影响的活动，以分类名称为键的其余索引随之丢弃。
+"""
+import datetime
+from contextlib import nullcontext
+
+from .aggregations import build_day_matrix
+from .anomalies import ANOMALY_BASELINE_REFRESH_DAYS, build_anomaly_report, extend_anomaly_report
+from .classification import (add_activity_to_index, build_classification_index, has_members, index_activities,
+                             merge_nodes, remove_activity_from_index, rename_node)
+from .hierarchy import build_hierarchy_cube, update_hierarchy_cube
+from .places import (activity_place_key, activity_places, add_to_place_index, build_place_index,
+                     remove_from_place_index)
+from .queries import add_to_interval_index, build_interval_index
+from .recommenders import (add_to_location_index, add_to_recommendation_tables, add_to_usage_index,
+                           build_location_index, build_next_activity_model, build_recommendation_tables,
+                           build_usage_index, remove_from_usage_index, train_next_activity_model)
+from .rollups import add_to_rollups, build_rollups, remove_from_rollups
+from .routines import add_to_routine_index, build_routine_index
+from .timezones import DEFAULT_TIMEZONE
+
+ACTIVITY_INDEX_KEYS = ["place_index", "day_matrices", "interval_index", "recommendation_tables",
+                       "next_activity_model", "usage_index", "location_index", "routine_index",
+                       "anomaly_report", "rollups", "classification_index", "hierarchy_cube"]
+
+# 以规范地点为键的索引，更新它们前需要先确定新活动的地点
+_PLACE_KEYED_INDEXES = ("recommendation_tables", "location_index", "routine_index", "next_activity_model",
+                        "rollups")
+
+# 支持按差量删除的索引，删除活动时保留
+_REMOVABLE_INDEXES = ("place_index", "rollups", "classification_index", "hierarchy_cube", "usage_index")
+
+_build_section = nullcontext
+
+
+def set_build_profiler(section):
+    """设置包裹每次索引构建的上下文管理器工厂，参数为构建名称，用于性能分析"""
+    global _build_section
+    _build_section = section
+
+
+def _cached(state, key, label, build):
+    if key not in state:
+        with _build_section(label):
+            state[key] = build()
+    return state[key]
+
+
+def get_place_index(state):
+    return _cached(state, "place_index", "地点索引构建", lambda: build_place_index(state["activities"]))
+
+
+def get_interval_index(state):
+    return _cached(state, "interval_index", "区间索引构建", lambda: build_interval_index(state["activities"]))
+
+
+def get_day_matrix(state, slot_minutes=15, level="需求"):
+    cache = state.setdefault("day_matrices", {})
+    key = (slot_minutes, level)
+    if key not in cache:
+        with _build_section("日程矩阵构建"):
+            cache[key] = build_day_matrix(state["activities"], slot_minutes, level)
+    return cache[key]
+
+
+def get_recommendation_tables(state):
+    return _cached(state, "recommendation_tables", "推荐计数表构建", lambda: build_recommendation_tables(
+        state["activities"], activity_places(get_place_index(state), state["activities"])))
+
+
+def get_next_activity_model(state):
+    return _cached(state, "next_activity_model", "序列模型训练", lambda: build_next_activity_model(
+        state["activities"], activity_places(get_place_index(state), state["activities"])))
+
+
+def get_location_index(state):
+    return _cached(state, "location_index", "地点习惯索引构建", lambda: build_location_index(
+        state["activities"], activity_places(get_place_index(state), state["activities"])))
+
+
+def get_routine_index(state):
+    return _cached(state, "routine_index", "常规日程挖掘", lambda: build_routine_index(
+        state["activities"], activity_places(get_place_index(state), state["activities"])))
+
+
+def get_usage_index(state):
+    return _cached(state, "usage_index", "模板使用索引构建", lambda: build_usage_index(state["activities"]))
+
+
+def get_rollups(state):
+    return _cached(state, "rollups", "汇总表构建", lambda: build_rollups(
+        state["activities"], activity_places(get_place_index(state), state["activities"])))
+
+
+def get_classification_index(state, members=False):
+    """分类树索引；members=True 时同时建立活动倒排表（统计活动数、改名、合并时需要）"""
+    index = _cached(state, "classification_index", "分类索引构建",
+                    lambda: build_classification_index(state["classification_system"]))
+    if members and not has_members(index):
+        with _build_section("分类活动登记"):
+            index_activities(index, state["activities"])
+    return index
+
+
+def get_hierarchy_cube(state):
+    return _cached(state, "hierarchy_cube", "分类层级汇总", lambda: build_hierarchy_cube(state["activities"]))
+
+
+def get_anomaly_report(state, today=None):
+    """异常日报告：today（state["timezone"]时区）之前的日期都已结束，跨天后只增量评分新结束的日期"""
+    today = today or datetime.date.today()
+    tz_name = state.get("timezone", DEFAULT_TIMEZONE)
+    report = state.get("anomaly_report")
+    if (report is None or report["dates"] is None
+            or (today - report["baseline_date"]).days > ANOMALY_BASELINE_REFRESH_DAYS):
+        if report is None or report["closed_before"] != today:
+            with _build_section("异常日评分"):
+                report = state["anomaly_report"] = build_anomaly_report(
+                    state["activities"], get_place_index(state), get_routine_index(state), today, tz_name)
+    elif report["closed_before"] != today:
+        extend_anomaly_report(report, state["activities"], get_place_index(state), today, tz_name)
+    return report
+
+
+def on_activity_added(state, activity):
+    """新活动写入后增量更新已构建的派生索引"""
+    if "place_index" in state:
+        add_to_place_index(state["place_index"], activity)
+    if any(key in state for key in _PLACE_KEYED_INDEXES):
+        place = activity_place_key(get_place_index(state), activity)
+    if "interval_index" in state:
+        add_to_interval_index(state["interval_index"], activity)
+    if "recommendation_tables" in state:
+        if not add_to_recommendation_tables(state["recommendation_tables"], activity, place):
+            del state["recommendation_tables"]
+    if "usage_index" in state:
+        add_to_usage_index(state["usage_index"], activity)
+    if "location_index" in state:
+        add_to_location_index(state["location_index"], activity, place)
+    if "routine_index" in state:
+        if not add_to_routine_index(state["routine_index"], activity, place):
+            del state["routine_index"]
+    if "rollups" in state:
+        add_to_rollups(state["rollups"], activity, place)
+    if "classification_index" in state:
+        add_activity_to_index(state["classification_index"], activity)
+    if state.get("hierarchy_cube") is not None:
+        if not update_hierarchy_cube(state["hierarchy_cube"], activity):
+            del state["hierarchy_cube"]
+    else:
+        state.pop("hierarchy_cube", None)
+    if "next_activity_model" in state:
+        model = state["next_activity_model"]
+        if model["last_start"] is None or activity["start_ts"] >= model["last_start"]:
+            train_next_activity_model(model, activity, place)
+        else:
+            del state["next_activity_model"]
+    # 异常日报告只缓存已结束的日期，补录过去的活动时才需要重建
+    report = state.get("anomaly_report")
+    if report is not None and activity["start_time"] < report["closed_before"].isoformat():
+        del state["anomaly_report"]
+    # 日程矩阵按整体向量化重建，代价与一次扫描相当，新增后直接丢弃
+    state.pop("day_matrices", None)
+
+
+def on_activity_removed(state, activity):
+    """活动从列表中移除前调用：支持差量删除的索引按差量扣除，其余索引丢弃"""
+    if "rollups" in state:
+        remove_from_rollups(state["rollups"], activity, activity_place_key(get_place_index(state), activity))
+    if "place_index" in state:
+        remove_from_place_index(state["place_index"], activity)
+    if "classification_index" in state:
+        remove_activity_from_index(state["classification_index"], activity)
+    if state.get("hierarchy_cube") is not None:
+        update_hierarchy_cube(state["hierarchy_cube"], activity, -1)
+    if "usage_index" in state:
+        remove_from_usage_index(state["usage_index"], activity, state["activities"])
+    for key in ACTIVITY_INDEX_KEYS:
+        if key not in _REMOVABLE_INDEXES:
+            state.pop(key, None)
+
+
+def rename_classification(state, path, new_name):
+    """分类节点改名（同级重名时合并），同步改写活动和模板，返回改写的活动数"""
+    changed = rename_node(get_classification_index(state, members=True), state["classification_system"],
+                          state.get("activity_templates", {}), state["activities"], path, new_name)
+    _drop_name_keyed_indexes(state)
+    return changed
+
+
+def merge_classification(state, source, target):
+    """把分类节点合并到同一层级的另一节点，同步改写活动和模板，返回改写的活动数"""
+    changed = merge_nodes(get_classification_index(state, members=True), state["classification_system"],
+                          state.get("activity_templates", {}), state["activities"], source, target)
+    _drop_name_keyed_indexes(state)
+    return changed
+
+
+def _drop_name_keyed_indexes(state):
+    # 推荐、汇总等索引以分类名称为键；模板使用统计按路径匹配，模板改写后也需重建
+    for key in ACTIVITY_INDEX_KEYS:
+        if key not in ("place_index", "interval_index", "classification_index"):
+            state.pop(key, None)
+
+
+def invalidate_activity_indexes(state):
+    """活动被删除、导入或清空后丢弃派生索引"""
+    for key in ACTIVITY_INDEX_KEYS:
+        state.pop(key, None)
@@ -0,0 +1,80 @@
+# core/intervals.py
+"""区间拆分：把活动按本地时间精确投影到日、小时等等长的箱中
+
+活动的 [开始, 结束) 按本地分钟计，跨越箱边界的部分分别计入各自的箱，
+23:00–07:00 的睡眠会拆成前一天1小时和次日7小时。所有拆分都是对整个
+活动列表的一次NumPy区间运算，按日期、时刻统计时间预算的地方都以此为准。
+夏令时切换日按墙上时间计。
+"""
+import numpy as np
+
+from .history import time_column
+
+MINUTES_PER_DAY = 1440
+DAYTIME_HOURS = (6, 23)  # 白天时段 [6:00, 23:00)
+
+
+def local_minute_bounds(activities):
+    """活动本地开始、结束时间自1970-01-01起的分钟数（int64数组），结束早于开始的按零长处理"""
+    starts = time_column(activities, "start_time").astype(np.int64)
+    ends = time_column(activities, "end_time").astype(np.int64)
+    return starts, np.maximum(ends, starts)
+
+
+def split_intervals(starts, ends, bin_minutes):
+    """把 [starts, ends) 区间拆分到长度为 bin_minutes 的箱中
+
+    返回 (区间下标, 箱编号, 分钟数) 三个等长数组，按区间下标、箱编号升序。
+    每个区间至少产出开始所在箱的一段，零长区间该段分钟数为0。
+    """
+    first = starts // bin_minutes
+    last = np.maximum(ends - 1, starts) // bin_minutes
+    counts = last - first + 1
+    rows = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    bins = first[rows] + offsets
+    minutes = np.minimum(ends[rows], (bins + 1) * bin_minutes) - np.maximum(starts[rows], bins * bin_minutes)
+    return rows, bins, minutes
+
+
+def split_by_day(activities):
+    """按本地日期拆分，返回 (活动下标, 日期datetime64[D], 分钟数)"""
+    rows, days, minutes = split_intervals(*local_minute_bounds(activities), MINUTES_PER_DAY)
+    return rows, days.astype("datetime64[D]"), minutes
+
+
+def hour_of_day_minutes(activities):
+    """一天24个小时各自被活动占用的总分钟数（每小时占用直方图）"""
+    _, hours, minutes = split_intervals(*local_minute_bounds(activities), 60)
+    return np.bincount(hours % 24, weights=minutes, minlength=24)
+
+
+def minutes_on_dates(activities, start_date, end_date):
+    """每条活动落在 [start_date, end_date] 这几个本地日期内的分钟数"""
+    rows, days, minutes = split_by_day(activities)
+    inside = (days >= np.datetime64(start_date)) & (days <= np.datetime64(end_date))
+    return np.bincount(rows[inside], weights=minutes[inside], minlength=len(activities))
+
+
+def daily_minutes_by(activities, labels):
+    """每个本地日期各标签的分钟数，labels 为与活动一一对应的标签
+
+    返回 (日期数组, 标签列表, 分钟数数组)，只含分钟数大于0的组合，按日期、标签排序。
+    """
+    rows, days, minutes = split_by_day(activities)
+    labels, codes = np.unique(labels, return_inverse=True)
+    keys = days.astype(np.int64) * len(labels) + codes.reshape(-1)[rows]
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    totals = np.bincount(inverse.reshape(-1), weights=minutes)
+    keep = totals > 0
+    unique_keys, totals = unique_keys[keep], totals[keep]
+    return ((unique_keys // len(labels)).astype("datetime64[D]"),
+            labels[unique_keys % len(labels)].tolist(), totals.astype(np.int64))
+
+
+def covered_dates(activities):
+    """有活动时间落入的全部本地日期，升序（含跨午夜活动延伸到的日期）"""
+    if not activities:
+        return []
+    _, days, _ = split_by_day(activities)
+    return [day.item() for day in np.unique(days)]
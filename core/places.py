@@ -0,0 +1,258 @@
+# core/places.py
+"""地点聚类：把历史坐标归并为规范地点，并识别家、工作地等锚点
+
+地点编号是整数；没有坐标、只能按名称归并的地点用名称字符串表示，
+无法确定地点时为空字符串。
+"""
+import datetime
+import math
+from collections import Counter
+
+import numpy as np
+
+from .history import coordinate_columns, field_values, number_column, time_column
+
+EARTH_RADIUS_KM = 6371.0088
+PLACE_RADIUS_M = 150  # 距地点中心该半径内的坐标视为同一地点
+PLACE_SNAP_DIGITS = 4  # 约10米的坐标吸附精度，用于重复坐标的快速查找
+METERS_PER_DEGREE = 111320.0
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """向量化的球面距离（公里），参数可以是标量或NumPy数组"""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _place_cell(lat, lng):
+    """坐标所在的网格单元，单元边长等于聚类半径"""
+    y = lat * METERS_PER_DEGREE
+    x = lng * METERS_PER_DEGREE * math.cos(math.radians(lat))
+    return (int(x // PLACE_RADIUS_M), int(y // PLACE_RADIUS_M))
+
+
+def _snap_key(lat, lng):
+    return (round(lat, PLACE_SNAP_DIGITS), round(lng, PLACE_SNAP_DIGITS))
+
+
+def _distance_m(lat1, lng1, lat2, lng2):
+    """短距离的等距矩形近似（米），用于逐点聚类时避免NumPy标量开销"""
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return EARTH_RADIUS_KM * 1000 * math.hypot(x, y)
+
+
+def _nearest_place(index, lat, lng):
+    """在相邻3x3网格内查找半径内最近的地点"""
+    cx, cy = _place_cell(lat, lng)
+    best, best_dist = None, PLACE_RADIUS_M
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for place_id in index["grid"].get((cx + dx, cy + dy), ()):
+                place = index["places"][place_id]
+                dist = _distance_m(lat, lng, place["lat"], place["lng"])
+                if dist <= best_dist:
+                    best, best_dist = place_id, dist
+    return best
+
+
+def _assign_place(index, lat, lng, weight=1):
+    """把坐标并入最近的地点（移动其中心），找不到则新建地点"""
+    place_id = _nearest_place(index, lat, lng)
+    if place_id is None:
+        place_id = len(index["places"])
+        index["places"].append({
+            "id": place_id, "lat": lat, "lng": lng, "count": 0,
+            "minutes": 0, "night_minutes": 0, "work_minutes": 0, "names": Counter()
+        })
+        index["grid"].setdefault(_place_cell(lat, lng), []).append(place_id)
+    place = index["places"][place_id]
+    total = place["count"] + weight
+    place["lat"] += (lat - place["lat"]) * weight / total
+    place["lng"] += (lng - place["lng"]) * weight / total
+    place["count"] = total
+    return place_id
+
+
+def _time_role_minutes(start_time, duration):
+    """返回活动计入夜间和工作时段的分钟数，用于识别家和工作地"""
+    start = datetime.datetime.fromisoformat(start_time)
+    night = duration if start.hour >= 22 or start.hour < 6 else 0
+    work = duration if start.weekday() < 5 and 9 <= start.hour < 18 else 0
+    return night, work
+
+
+def build_place_index(activities):
+    """对全部历史坐标做网格索引的半径聚类，返回地点索引
+
+    先把坐标吸附到约10米精度并去重，只对去重后的点按首次出现顺序聚类，
+    再用NumPy把活动的时长等统计量汇总到地点上。
+    """
+    index = {"places": [], "grid": {}, "snap": {}, "name_place": {}, "loose_names": set()}
+    lats, lngs = coordinate_columns(activities)
+    names = field_values(activities, "location_name", "")
+    has_coordinates = ~np.isnan(lats)
+    index["loose_names"] = {name for name, located in zip(names, has_coordinates.tolist()) if name and not located}
+    located = np.flatnonzero(has_coordinates)
+    if not len(located):
+        return index
+
+    lats, lngs = lats[located], lngs[located]
+    scale = 10 ** PLACE_SNAP_DIGITS
+    # 经纬度吸附后合成一个int64键，比按行去重快得多
+    lng_span = 400 * scale
+    keys = np.round(lats * scale).astype(np.int64) * lng_span + np.round(lngs * scale).astype(np.int64) + lng_span // 2
+    unique_keys, first_index, inverse, counts = np.unique(
+        keys, return_index=True, return_inverse=True, return_counts=True)
+    unique_lats = (unique_keys // lng_span) / scale
+    unique_lngs = (unique_keys % lng_span - lng_span // 2) / scale
+
+    unique_place = np.empty(len(unique_keys), dtype=np.int64)
+    for u in np.argsort(first_index, kind="stable"):
+        lat, lng = float(unique_lats[u]), float(unique_lngs[u])
+        place_id = _assign_place(index, lat, lng, int(counts[u]))
+        unique_place[u] = place_id
+        index["snap"][(lat, lng)] = place_id
+
+    place_of = unique_place[inverse]
+    durations = number_column(activities, "duration", float)[located]
+    starts = time_column(activities, "start_time")[located]
+    hours = (starts - starts.astype("datetime64[D]")).astype("int64") // 60
+    weekdays = (starts.astype("datetime64[D]").astype("int64") + 3) % 7  # 1970-01-01是周四
+    night = (hours >= 22) | (hours < 6)
+    work = (weekdays < 5) & (hours >= 9) & (hours < 18)
+
+    n_places = len(index["places"])
+    minutes = np.bincount(place_of, weights=durations, minlength=n_places)
+    night_minutes = np.bincount(place_of, weights=durations * night, minlength=n_places)
+    work_minutes = np.bincount(place_of, weights=durations * work, minlength=n_places)
+    for place in index["places"]:
+        place["minutes"] = int(minutes[place["id"]])
+        place["night_minutes"] = int(night_minutes[place["id"]])
+        place["work_minutes"] = int(work_minutes[place["id"]])
+
+    name_counts = Counter(zip(place_of.tolist(), (names[i] for i in located.tolist())))
+    for (place_id, name), count in name_counts.items():
+        if name:
+            index["places"][place_id]["names"][name] += count
+    _refresh_name_places(index)
+    return index
+
+
+def _refresh_name_places(index):
+    """地点名称映射到最常使用该名称的地点，供无坐标的活动归并"""
+    best = {}
+    for place in index["places"]:
+        for name, count in place["names"].items():
+            if count > best.get(name, (0, None))[0]:
+                best[name] = (count, place["id"])
+    index["name_place"] = {name: place_id for name, (count, place_id) in best.items()}
+
+
+def add_to_place_index(index, activity):
+    """增量地把一条新活动并入地点索引"""
+    coords = activity.get("coordinates")
+    name = activity.get("location_name", "")
+    if not coords:
+        if name:
+            index["loose_names"].add(name)
+        return
+
+    lat, lng = _snap_key(coords["lat"], coords["lng"])
+    place_id = index["snap"].get((lat, lng))
+    if place_id is None:
+        place_id = _assign_place(index, lat, lng)
+        index["snap"][(lat, lng)] = place_id
+    else:
+        index["places"][place_id]["count"] += 1
+
+    place = index["places"][place_id]
+    night, work = _time_role_minutes(activity["start_time"], activity["duration"])
+    place["minutes"] += activity["duration"]
+    place["night_minutes"] += night
+    place["work_minutes"] += work
+    if name:
+        place["names"][name] += 1
+        current = index["name_place"].get(name)
+        if current is None or place["names"][name] > index["places"][current]["names"][name]:
+            index["name_place"][name] = place_id
+
+
+def remove_from_place_index(index, activity):
+    """删除活动后从所属地点的统计中扣除
+
+    地点中心和网格保持不变，已分配的地点编号不会变化，其他以地点编号为键的
+    索引（如汇总表）可以继续使用。纯名称地点是集合，无法判断是否还有同名
+    记录，保持不变。
+    """
+    if not activity.get("coordinates"):
+        return
+    place_id = activity_place_key(index, activity)
+    if not isinstance(place_id, int):
+        return
+    place = index["places"][place_id]
+    night, work = _time_role_minutes(activity["start_time"], activity["duration"])
+    place["count"] -= 1
+    place["minutes"] -= activity["duration"]
+    place["night_minutes"] -= night
+    place["work_minutes"] -= work
+    name = activity.get("location_name", "")
+    if name and place["names"][name] > 0:
+        place["names"][name] -= 1
+        if not place["names"][name]:
+            del place["names"][name]
+        _refresh_name_places(index)
+
+
+def activity_place_key(index, activity):
+    """活动的规范地点：有坐标时为地点编号，否则按名称归并，无法归并时返回名称本身"""
+    coords = activity.get("coordinates")
+    lat, lng = (coords["lat"], coords["lng"]) if coords else (math.nan, math.nan)
+    return _place_key(index, lat, lng, activity.get("location_name", ""))
+
+
+def _place_key(index, lat, lng, name):
+    if not math.isnan(lat):
+        place_id = index["snap"].get(_snap_key(lat, lng))
+        if place_id is None:
+            place_id = _nearest_place(index, lat, lng)
+        if place_id is not None:
+            return place_id
+    return index["name_place"].get(name, name)
+
+
+def activity_places(index, activities):
+    """与活动一一对应的规范地点列表，供批量构建其他索引使用（按列读取坐标和名称）"""
+    lats, lngs = coordinate_columns(activities)
+    return [_place_key(index, lat, lng, name)
+            for lat, lng, name in zip(lats.tolist(), lngs.tolist(), field_values(activities, "location_name", ""))]
+
+
+def place_display_name(index, key):
+    """规范地点的显示名称：取该地点最常用的名称"""
+    if isinstance(key, str):
+        return key
+    names = index["places"][key]["names"]
+    return names.most_common(1)[0][0] if names else f"地点#{key + 1}"
+
+
+def count_canonical_places(index):
+    """规范地点数量：仍有记录的坐标聚类地点加上无法归并的纯名称地点"""
+    return (sum(1 for place in index["places"] if place["count"] > 0)
+            + len(index["loose_names"] - index["name_place"].keys()))
+
+
+def place_anchors(index):
+    """识别锚点地点：夜间停留最久的是家，工作日白天停留最久的（家以外）是工作地"""
+    anchors = {}
+    places = index["places"]
+    home = max(places, key=lambda p: p["night_minutes"], default=None)
+    if home and home["night_minutes"] > 0:
+        anchors["home"] = home["id"]
+    work = max((p for p in places if p["id"] != anchors.get("home")),
+               key=lambda p: p["work_minutes"], default=None)
+    if work and work["work_minutes"] > 0:
+        anchors["work"] = work["id"]
+    return anchors
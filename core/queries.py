@@ -0,0 +1,163 @@
+# core/queries.py
+"""活动列表上的基础查询：ISO时间解析、日期筛选和时间区间索引
+
+活动列表约定按UTC开始时间戳 start_ts 升序排列，日期范围查询先按时间戳二分，
+再按活动所在时区的本地日期精确筛选。时间区间索引以UTC分钟为单位。
+"""
+import bisect
+import datetime
+from datetime import timedelta
+
+import numpy as np
+
+from .history import field_values, number_column, take, time_column
+from .timezones import MAX_UTC_OFFSET_SECONDS, date_to_epoch, ts_array
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def parse_iso_minutes(values):
+    """把ISO时间字符串批量解析为分钟精度的datetime64数组"""
+    return np.array(values, dtype='datetime64[us]').astype('datetime64[m]')
+
+
+def iso_to_minutes(value):
+    """ISO时间字符串转换为自1970-01-01起的分钟数"""
+    return int((datetime.datetime.fromisoformat(value) - EPOCH).total_seconds() // 60)
+
+
+def minutes_to_datetime(minutes):
+    return EPOCH + timedelta(minutes=int(minutes))
+
+
+def start_hours_weekdays(activities):
+    """批量解析活动开始时刻的小时和星期几（周一为0）"""
+    starts = time_column(activities, "start_time")
+    days = starts.astype("datetime64[D]")
+    hours = (starts - days).astype("int64") // 60
+    weekdays = (days.astype("int64") + 3) % 7  # 1970-01-01是周四
+    return hours.tolist(), weekdays.tolist()
+
+
+def activity_path(activity):
+    """活动的四级分类路径"""
+    return (activity["demand"], activity["project"], activity["activity"], activity["behavior"])
+
+
+def activity_paths(activities):
+    """全部活动的四级分类路径列表，按列读取"""
+    return list(zip(*(field_values(activities, field) for field in ("demand", "project", "activity", "behavior"))))
+
+
+# 活动筛选：活动列表按UTC开始时间排序，日期范围用二分查找定位
+def activities_between(activities, start_date, end_date):
+    """本地开始日期在 [start_date, end_date] 内的活动
+
+    各活动的时区不同，先用放宽了最大时区偏移的时间戳范围二分，
+    再按本地时间字符串精确筛选。
+    """
+    next_day = end_date + timedelta(days=1)
+    lo, hi = np.searchsorted(number_column(activities, "start_ts"),
+                             [date_to_epoch(start_date) - MAX_UTC_OFFSET_SECONDS,
+                              date_to_epoch(next_day) + MAX_UTC_OFFSET_SECONDS]).tolist()
+    first, stop = start_date.isoformat(), next_day.isoformat()
+    return [a for a in activities[lo:hi] if first <= a["start_time"] < stop]
+
+
+def activities_overlapping(activities, start_date, end_date, max_length=0):
+    """与本地日期 [start_date, end_date] 有时间交集的活动，包括前一天开始、跨午夜延续进来的
+
+    max_length 为最长活动的分钟数（见时间区间索引），用于把二分的下界再向前放宽。
+    """
+    next_day = end_date + timedelta(days=1)
+    lo, hi = np.searchsorted(number_column(activities, "start_ts"),
+                             [date_to_epoch(start_date) - MAX_UTC_OFFSET_SECONDS - max_length * 60,
+                              date_to_epoch(next_day) + MAX_UTC_OFFSET_SECONDS]).tolist()
+    first = datetime.datetime.combine(start_date, datetime.time()).isoformat()
+    stop = next_day.isoformat()
+    return [a for a in activities[lo:hi]
+            if a["start_time"] < stop and (a["end_time"] > first or a["start_time"] >= first)]
+
+
+def activity_dates(activities):
+    """有活动开始的全部日期，升序"""
+    days = np.unique(time_column(activities, "start_time").astype("datetime64[D]"))
+    return [day.item() for day in days]
+
+
+def filter_activities(activities, search_term="", demand="", date=None):
+    """活动记录页的筛选：描述关键词、需求类型和日期
+
+    关键词和需求类型按列匹配，只取出命中的活动。
+    """
+    if date:
+        activities = activities_between(activities, date, date)
+    if search_term or demand:
+        term = search_term.lower()
+        matched = [i for i, (description, demand_type) in enumerate(zip(field_values(activities, "description", ""),
+                                                                         field_values(activities, "demand")))
+                   if term in description.lower() and (not demand or demand_type == demand)]
+        activities = take(activities, matched)
+    return activities
+
+
+# 时间区间索引：按UTC开始时间排序的区间（UTC分钟），用于重叠检测和空档统计
+def build_interval_index(activities):
+    """构建按开始时间排序的区间索引，并记录最长区间长度用于限定查询窗口"""
+    index = {"starts": [], "ends": [], "ids": [], "max_length": 0}
+    if not activities:
+        return index
+    starts = ts_array(activities, "start_ts") // 60
+    ends = ts_array(activities, "end_ts") // 60
+    ids = number_column(activities, "id")
+    order = np.argsort(starts, kind="stable")
+    index["starts"] = starts[order].tolist()
+    index["ends"] = ends[order].tolist()
+    index["ids"] = ids[order].tolist()
+    index["max_length"] = int((ends - starts).max())
+    return index
+
+
+def add_to_interval_index(index, activity):
+    """按开始时间插入一个区间"""
+    start, end = activity["start_ts"] // 60, activity["end_ts"] // 60
+    pos = bisect.bisect_right(index["starts"], start)
+    index["starts"].insert(pos, start)
+    index["ends"].insert(pos, end)
+    index["ids"].insert(pos, activity["id"])
+    index["max_length"] = max(index["max_length"], end - start)
+
+
+def find_overlaps(index, start, end):
+    """查找与 [start, end) 重叠的区间，返回 (开始, 结束, 活动编号) 列表
+
+    区间长度不超过max_length，所以只需检查开始时间落在
+    (start - max_length, end) 内的区间：O(log n + k)。
+    """
+    lo = bisect.bisect_right(index["starts"], start - index["max_length"])
+    hi = bisect.bisect_left(index["starts"], end)
+    return [(index["starts"][i], index["ends"][i], index["ids"][i])
+            for i in range(lo, hi) if index["ends"][i] > start]
+
+
+def find_gaps(index, start, end, min_gap=1):
+    """[start, end) 内没有任何活动覆盖的时段"""
+    gaps = []
+    cursor = start
+    for s, e, _ in sorted(find_overlaps(index, start, end)):
+        if s - cursor >= min_gap:
+            gaps.append((cursor, s))
+        cursor = max(cursor, e)
+    if end - cursor >= min_gap:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def covered_minutes(index):
+    """所有区间并集的总长度（分钟），重叠部分只计一次"""
+    if not index["starts"]:
+        return 0
+    starts = np.asarray(index["starts"], dtype=np.int64)
+    ends = np.asarray(index["ends"], dtype=np.int64)
+    reach = np.concatenate([[starts[0]], np.maximum.accumulate(ends)[:-1]])
+    return int(np.maximum(ends - np.maximum(starts, reach), 0).sum())
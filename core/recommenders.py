@@ -0,0 +1,454 @@
+# core/recommenders.py
+"""活动推荐：时间段/地点计数表、下一活动n元语法模型、地点习惯和模板使用统计
+
+各索引都可以一次扫描整体构建，也可以在新活动按时间顺序到达时增量更新。
+需要规范地点的函数接收由 places.activity_places 算出的地点列表或单个地点。
+"""
+import datetime
+import heapq
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+import numpy as np
+
+from .history import field_values, number_column, time_column
+from .places import place_display_name
+from .queries import activity_path, activity_paths, start_hours_weekdays
+from .timezones import local_to_epoch, ts_array
+
+TIME_PERIODS = {
+    (6, 9): "早晨活动",
+    (9, 12): "上午学习",
+    (12, 14): "午间休息",
+    (14, 18): "下午工作",
+    (18, 22): "晚间活动",
+    (22, 6): "夜间休息"  # 跨天
+}
+HOUR_PERIODS = [next(name for (start, end), name in TIME_PERIODS.items()
+                     if (start <= hour < end if start < end else (hour >= start or hour < end)))
+                for hour in range(24)]
+MIN_WEEKDAY_SAMPLES = 5  # 同一星期几的样本少于该数时退回只按时间段统计
+NGRAM_ORDER = 3  # 最多以前两个活动为上下文
+NEXT_ACTIVITY_WEIGHTS = {"trigram": 0.35, "bigram": 0.25, "period": 0.2, "place": 0.12, "unigram": 0.08}
+LOCATION_HALF_LIFE_DAYS = 30  # 地点习惯衰减权重的半衰期
+LOCATION_REBASE_DAYS = 3000   # 参考时间落后太多时整体重新缩放，防止权重溢出
+USAGE_TREND_WEEKS = 4  # 趋势比较最近几周与之前同样长的几周
+
+
+# 推荐计数表：新增活动时增量维护，推荐时只做字典查找
+def _new_recommendation_tables():
+    return {
+        "period_paths": defaultdict(Counter),          # 时间段 → 分类路径计数
+        "period_weekday_paths": defaultdict(Counter),  # (时间段, 星期几) → 分类路径计数
+        "place_paths": defaultdict(Counter),           # 规范地点 → 分类路径计数
+        "place_last_seen": {},                         # 规范地点 → 最近一次活动的UTC开始时间戳
+        "pair_paths": defaultdict(Counter),            # (需求, 活动) → 完整分类路径计数
+        "last_start": None,                            # 最近一次活动的UTC开始时间戳
+    }
+
+
+def _count_activity(tables, activity, place):
+    """把一条活动计入各计数表"""
+    start = datetime.datetime.fromisoformat(activity["start_time"])
+    path = activity_path(activity)
+    pair = (activity["demand"], activity["activity"])
+    period = HOUR_PERIODS[start.hour]
+
+    tables["period_paths"][period][path] += 1
+    tables["period_weekday_paths"][(period, start.weekday())][path] += 1
+    tables["pair_paths"][pair][path] += 1
+    if place != "":
+        tables["place_paths"][place][path] += 1
+        tables["place_last_seen"][place] = max(tables["place_last_seen"].get(place, activity["start_ts"]),
+                                               activity["start_ts"])
+    tables["last_start"] = activity["start_ts"]
+
+
+def build_recommendation_tables(activities, places):
+    """一次扫描全部历史构建推荐计数表（活动已按开始时间排序，places为对应的规范地点）
+
+    时间字段用NumPy批量解析，各表用Counter对元组流计数，避免逐条更新字典。
+    """
+    tables = _new_recommendation_tables()
+    if not activities:
+        return tables
+    
+    hours, weekdays = start_hours_weekdays(activities)
+    periods = [HOUR_PERIODS[hour] for hour in hours]
+    paths = activity_paths(activities)
+    pairs = [(path[0], path[2]) for path in paths]
+    
+    for (period, path), count in Counter(zip(periods, paths)).items():
+        tables["period_paths"][period][path] = count
+    for (period, weekday, path), count in Counter(zip(periods, weekdays, paths)).items():
+        tables["period_weekday_paths"][(period, weekday)][path] = count
+    for (pair, path), count in Counter(zip(pairs, paths)).items():
+        tables["pair_paths"][pair][path] = count
+    for (place, path), count in Counter(zip(places, paths)).items():
+        if place != "":
+            tables["place_paths"][place][path] = count
+    # 活动按时间排序，后写入的就是最近一次；按UTC时间戳比较，不受各活动记录时所在时区影响
+    starts = number_column(activities, "start_ts").tolist()
+    tables["place_last_seen"] = {place: start for place, start in zip(places, starts) if place != ""}
+    tables["last_start"] = activities[-1]["start_ts"]
+    return tables
+
+
+def add_to_recommendation_tables(tables, activity, place):
+    """增量计入新活动；插入到历史中间时无法维护“最近”信息，返回False要求重建"""
+    if tables["last_start"] is not None and activity["start_ts"] < tables["last_start"]:
+        return False
+    _count_activity(tables, activity, place)
+    return True
+
+
+
+# 下一活动预测：分类路径上的n元语法模型，按时间段和所在地点加权
+def new_next_activity_model():
+    return {
+        "paths": [],                       # 状态编号 → 分类路径
+        "vocab": {},                       # 分类路径 → 状态编号
+        "unigram": Counter(),
+        "bigram": defaultdict(Counter),    # 上一状态 → 下一状态计数
+        "trigram": defaultdict(Counter),   # (前两个状态) → 下一状态计数
+        "period": defaultdict(Counter),    # 下一活动所在时间段 → 状态计数
+        "place": defaultdict(Counter),     # 上一活动所在地点 → 下一状态计数
+        "history": [],                     # 最近 NGRAM_ORDER-1 个状态
+        "last_place": "",
+        "last_start": None,
+    }
+
+
+def train_next_activity_model(model, activity, place):
+    """用一条（时间上最新的）活动更新模型"""
+    path = activity_path(activity)
+    state = model["vocab"].get(path)
+    if state is None:
+        state = model["vocab"][path] = len(model["paths"])
+        model["paths"].append(path)
+    
+    history = model["history"]
+    period = HOUR_PERIODS[datetime.datetime.fromisoformat(activity["start_time"]).hour]
+    model["unigram"][state] += 1
+    model["period"][period][state] += 1
+    if history:
+        model["bigram"][history[-1]][state] += 1
+        model["place"][model["last_place"]][state] += 1
+    if len(history) >= 2:
+        model["trigram"][tuple(history[-2:])][state] += 1
+    
+    model["history"] = (history + [state])[-(NGRAM_ORDER - 1):]
+    model["last_place"] = place
+    model["last_start"] = activity["start_ts"]
+
+
+def build_next_activity_model(activities, places):
+    """按时间顺序批量训练模型，places为与活动一一对应的规范地点
+
+    结果与逐条调用train_next_activity_model相同，但各阶计数直接用Counter
+    对错位拼接的状态序列计数。
+    """
+    model = new_next_activity_model()
+    if not activities:
+        return model
+    
+    vocab = model["vocab"]
+    states = [vocab.setdefault(path, len(vocab)) for path in activity_paths(activities)]
+    model["paths"] = list(vocab)
+    periods = [HOUR_PERIODS[hour] for hour in start_hours_weekdays(activities)[0]]
+    
+    model["unigram"] = Counter(states)
+    for (period, state), count in Counter(zip(periods, states)).items():
+        model["period"][period][state] = count
+    for (prev, state), count in Counter(zip(states, states[1:])).items():
+        model["bigram"][prev][state] = count
+    for (prev2, prev1, state), count in Counter(zip(states, states[1:], states[2:])).items():
+        model["trigram"][(prev2, prev1)][state] = count
+    for (place, state), count in Counter(zip(places, states[1:])).items():
+        model["place"][place][state] = count
+    
+    model["history"] = states[-(NGRAM_ORDER - 1):]
+    model["last_place"] = places[-1]
+    model["last_start"] = activities[-1]["start_ts"]
+    return model
+
+
+def predict_next_activities(model, k, period, place=None):
+    """预测下一个活动，返回前k个 (分类路径, 概率)
+
+    各上下文的条件分布线性插值；上下文未出现过时去掉对应分量并重新归一化权重。
+    """
+    history = model["history"]
+    place = model["last_place"] if place is None else place
+    components = [
+        ("trigram", model["trigram"].get(tuple(history[-2:])) if len(history) >= 2 else None),
+        ("bigram", model["bigram"].get(history[-1]) if history else None),
+        ("period", model["period"].get(period)),
+        ("place", model["place"].get(place)),
+        ("unigram", model["unigram"]),
+    ]
+    components = [(NEXT_ACTIVITY_WEIGHTS[name], counts) for name, counts in components if counts]
+    weight_sum = sum(weight for weight, _ in components)
+    
+    scores = Counter()
+    for weight, counts in components:
+        total = sum(counts.values())
+        for state, count in counts.items():
+            scores[state] += weight / weight_sum * count / total
+    return [(model["paths"][state], probability) for state, probability in scores.most_common(k)]
+
+
+def evaluate_next_activity_model(activities, places, holdout_days=14, k=3):
+    """离线评估：用留出的最后若干天逐条预测，统计 hit@1 与 hit@k
+
+    训练集是留出日期之前的全部活动；测试时每预测一条就把真实活动加入模型，
+    与实际使用时的增量训练一致。同时给出“总是推荐最常见活动”的基线。
+    """
+    if not activities:
+        return None
+    last = activities[-1]
+    last_date = datetime.date.fromisoformat(last["start_time"][:10])
+    cutoff = datetime.datetime.combine(last_date - timedelta(days=holdout_days - 1), datetime.time())
+    split = int(np.searchsorted(number_column(activities, "start_ts"), local_to_epoch(cutoff, last["tz"])))
+    if split == 0 or split == len(activities):
+        return None
+    
+    model = build_next_activity_model(activities[:split], places[:split])
+    hits_top1 = hits_topk = baseline_hits = 0
+    for activity, place in zip(activities[split:], places[split:]):
+        period = HOUR_PERIODS[datetime.datetime.fromisoformat(activity["start_time"]).hour]
+        predicted = [path for path, _ in predict_next_activities(model, k, period)]
+        baseline = [model["paths"][state] for state, _ in model["unigram"].most_common(k)]
+        truth = activity_path(activity)
+        hits_top1 += bool(predicted) and predicted[0] == truth
+        hits_topk += truth in predicted
+        baseline_hits += truth in baseline
+        train_next_activity_model(model, activity, place)
+    
+    n_test = len(activities) - split
+    return {
+        "train_size": split,
+        "test_size": n_test,
+        "hit@1": hits_top1 / n_test,
+        f"hit@{k}": hits_topk / n_test,
+        f"baseline_hit@{k}": baseline_hits / n_test,
+    }
+
+
+def common_location(location_index, place_index, demand, activity):
+    """该(需求, 活动)最常去的地点名称，没有记录时为空字符串"""
+    ranked = rank_locations(location_index, place_index, demand, activity)
+    return ranked[0][0] if ranked else ""
+
+
+def recommend_by_time(tables, location_index, place_index, current_hour, current_weekday, ignored):
+    """基于时间推荐模板"""
+    recommendations = []
+    
+    # 找到当前时间段，同一星期几的样本足够时优先使用
+    current_period = HOUR_PERIODS[current_hour]
+    activity_combinations = tables["period_weekday_paths"].get((current_period, current_weekday))
+    if not activity_combinations or sum(activity_combinations.values()) < MIN_WEEKDAY_SAMPLES:
+        activity_combinations = tables["period_paths"].get(current_period)
+    
+    if activity_combinations:
+        period_total = sum(activity_combinations.values())
+        for (demand, project, activity, behavior), count in activity_combinations.most_common(2):
+            template_name = f"{current_period}_{demand}_{activity}"
+            if template_name not in ignored:
+                score = min(count / period_total * 100, 95)
+                recommendations.append({
+                    "name": template_name,
+                    "score": score,
+                    "data": {
+                        "demand": demand,
+                        "project": project,
+                        "activity": activity,
+                        "behavior": behavior,
+                        "location_name": common_location(location_index, place_index, demand, activity)
+                    }
+                })
+    
+    return recommendations
+
+
+def recommend_by_pattern(model, location_index, place_index, current_hour, ignored):
+    """基于下一活动预测模型推荐"""
+    recommendations = []
+    if not model["history"]:
+        return recommendations
+    
+    current_period = HOUR_PERIODS[current_hour]
+    for (demand, project, activity, behavior), probability in predict_next_activities(model, 2, current_period):
+        template_name = f"序列推荐_{demand}_{activity}"
+        if template_name not in ignored:
+            recommendations.append({
+                "name": template_name,
+                "score": min(probability * 100, 90),
+                "data": {
+                    "demand": demand,
+                    "project": project,
+                    "activity": activity,
+                    "behavior": behavior,
+                    "location_name": common_location(location_index, place_index, demand, activity)
+                }
+            })
+    
+    return recommendations
+
+
+def recommend_by_location(tables, place_index, ignored):
+    """基于地点推荐模板"""
+    recommendations = []
+    
+    # 最近使用的3个规范地点
+    recent_places = heapq.nlargest(3, tables["place_last_seen"], key=tables["place_last_seen"].get)
+    
+    # 为每个地点推荐常见活动
+    for place in recent_places:
+        activity_count = tables["place_paths"][place]
+        location = place_display_name(place_index, place)
+        for (demand, project, activity, behavior), count in activity_count.most_common(1):
+            template_name = f"地点_{location}_{activity}"
+            if template_name not in ignored:
+                score = min(count / sum(activity_count.values()) * 100, 85)
+                recommendations.append({
+                    "name": template_name,
+                    "score": score,
+                    "data": {
+                        "demand": demand,
+                        "project": project,
+                        "activity": activity,
+                        "behavior": behavior,
+                        "location_name": location
+                    }
+                })
+    
+    return recommendations
+
+
+# 地点习惯索引：(需求, 活动) → 规范地点的次数与时间衰减权重
+def _decay_exponent(index, start_ts):
+    return (start_ts / 86400 - index["reference_day"]) / LOCATION_HALF_LIFE_DAYS
+
+
+def build_location_index(activities, places):
+    """统计每个(需求, 活动)在各规范地点的次数和衰减权重
+
+    衰减权重存为 2^((t - 参考时间)/半衰期) 之和：与按“当前时间”衰减只差一个
+    公共因子，排序结果相同，新增活动时只需累加一项。
+    """
+    index = {"counts": defaultdict(Counter), "weights": defaultdict(Counter), "reference_day": 0.0}
+    if not activities:
+        return index
+    days = ts_array(activities) / 86400
+    index["reference_day"] = float(days.max())
+    weights = np.exp2((days - index["reference_day"]) / LOCATION_HALF_LIFE_DAYS)
+    
+    key_ids = {}
+    ids = [key_ids.setdefault(((path[0], path[2]), place), len(key_ids))
+           for path, place in zip(activity_paths(activities), places)]
+    counts = np.bincount(ids)
+    sums = np.bincount(ids, weights=weights)
+    for (pair, place), key_id in key_ids.items():
+        if place != "":
+            index["counts"][pair][place] = int(counts[key_id])
+            index["weights"][pair][place] = float(sums[key_id])
+    return index
+
+
+def add_to_location_index(index, activity, place):
+    if place == "":
+        return
+    exponent = _decay_exponent(index, activity["start_ts"])
+    if exponent * LOCATION_HALF_LIFE_DAYS > LOCATION_REBASE_DAYS:
+        scale = 2.0 ** -exponent
+        for weights in index["weights"].values():
+            for key in weights:
+                weights[key] *= scale
+        index["reference_day"] += exponent * LOCATION_HALF_LIFE_DAYS
+        exponent = 0.0
+    pair = (activity["demand"], activity["activity"])
+    index["counts"][pair][place] += 1
+    index["weights"][pair][place] += 2.0 ** exponent
+
+
+def rank_locations(index, place_index, demand, activity, decay=True):
+    """该(需求, 活动)常去的地点名称，按衰减权重（或全部历史次数）从高到低排列"""
+    table = index["weights" if decay else "counts"].get((demand, activity))
+    if not table:
+        return []
+    return [(place_display_name(place_index, place), weight) for place, weight in table.most_common()]
+
+
+# 模板使用统计：按四级分类路径维护的计数索引
+def build_usage_index(activities):
+    """按分类路径统计使用次数、最近使用时间和每周使用次数"""
+    index = {"counts": Counter(), "last_used": {}, "weekly": defaultdict(Counter)}
+    if not activities:
+        return index
+    paths = activity_paths(activities)
+    start_times = field_values(activities, "start_time")
+    days = time_column(activities, "start_time").astype("datetime64[D]")
+    weeks = (days - ((days.astype("int64") + 3) % 7)).astype(str).tolist()  # 所在周的周一
+    index["counts"] = Counter(paths)
+    for path, start_time in zip(paths, start_times):
+        if start_time > index["last_used"].get(path, ""):
+            index["last_used"][path] = start_time
+    for (path, week), count in Counter(zip(paths, weeks)).items():
+        index["weekly"][path][week] = count
+    return index
+
+
+def add_to_usage_index(index, activity):
+    path = activity_path(activity)
+    start = datetime.datetime.fromisoformat(activity["start_time"])
+    week = (start.date() - timedelta(days=start.weekday())).isoformat()
+    index["counts"][path] += 1
+    index["weekly"][path][week] += 1
+    if activity["start_time"] > index["last_used"].get(path, ""):
+        index["last_used"][path] = activity["start_time"]
+
+
+def remove_from_usage_index(index, activity, activities):
+    """删除活动（调用时仍在 activities 中）后按差量扣除
+
+    只有被删除的是该路径最近一次使用时，才按列查找其余同路径活动中最近的开始时间。
+    """
+    path = activity_path(activity)
+    start = datetime.datetime.fromisoformat(activity["start_time"])
+    week = (start.date() - timedelta(days=start.weekday())).isoformat()
+    index["counts"][path] -= 1
+    if not index["counts"][path]:
+        del index["counts"][path], index["weekly"][path], index["last_used"][path]
+        return
+    index["weekly"][path][week] -= 1
+    if not index["weekly"][path][week]:
+        del index["weekly"][path][week]
+    if activity["start_time"] == index["last_used"][path]:
+        others = zip(activity_paths(activities), number_column(activities, "id").tolist(),
+                     field_values(activities, "start_time"))
+        index["last_used"][path] = max(start_time for other, other_id, start_time in others
+                                       if other == path and other_id != activity["id"])
+
+
+def template_path(template_data):
+    return (template_data["demand"], template_data["project"], template_data["activity"], template_data["behavior"])
+
+
+def get_template_usage_stats(index, template_data, today=None):
+    """模板的使用次数、最近使用时间和近几周相对之前几周的使用变化"""
+    path = template_path(template_data)
+    today = today or datetime.date.today()
+    this_monday = today - timedelta(days=today.weekday())
+    weekly = index["weekly"].get(path, {})
+    recent = sum(weekly.get((this_monday - timedelta(weeks=i)).isoformat(), 0)
+                 for i in range(USAGE_TREND_WEEKS))
+    previous = sum(weekly.get((this_monday - timedelta(weeks=i)).isoformat(), 0)
+                   for i in range(USAGE_TREND_WEEKS, USAGE_TREND_WEEKS * 2))
+    return {
+        "count": index["counts"][path],
+        "last_used": index["last_used"].get(path),
+        "recent": recent,
+        "previous": previous,
+    }
@@ -0,0 +1,111 @@
+# core/reports.py
+"""批量报表：为一个数据目录计算概览指标、每日时间预算和每日轨迹统计
+
+结果是只含基本类型的行（字典列表），可以在进程池中计算后直接交给写出端。
+各表的列及其类型见 REPORT_COLUMNS，写出 Parquet 时据此建立固定的表结构。
+"""
+from .aggregations import compute_mobility_metrics, compute_overview_stats
+from .history import field_values
+from .intervals import daily_minutes_by
+from .places import build_place_index, count_canonical_places
+from .queries import build_interval_index, covered_minutes
+from .store import load_store
+
+REPORT_COLUMNS = {
+    "summary": [
+        ("user", "str"), ("activities", "int"), ("total_hours", "float"), ("projects", "int"),
+        ("places", "int"), ("avg_duration_min", "float"), ("first_date", "str"), ("last_date", "str"),
+        ("days_span", "int"), ("coverage_pct", "float"), ("daily_activities", "float"),
+        ("daily_hours", "float"), ("demands", "int"), ("activity_types", "int"), ("behaviors", "int"),
+        ("daytime_pct", "float"), ("trips", "int"), ("avg_daily_distance_km", "float"),
+        ("avg_daily_radius_km", "float"), ("avg_daily_area_km2", "float"), ("overall_radius_km", "float"),
+        ("impossible_trips", "int"),
+    ],
+    "daily_budget": [("user", "str"), ("date", "str"), ("demand", "str"), ("minutes", "int")],
+    "daily_trajectory": [
+        ("user", "str"), ("date", "str"), ("trips", "int"), ("distance_km", "float"),
+        ("places", "int"), ("radius_km", "float"), ("area_km2", "float"),
+    ],
+}
+
+_EMPTY_VALUES = {"str": "", "int": 0, "float": 0.0}
+
+
+def summary_row(user, activities):
+    """数据概览页的指标集，与界面中的计算方式一致"""
+    row = {name: _EMPTY_VALUES[kind] for name, kind in REPORT_COLUMNS["summary"]}
+    row["user"] = user
+    if not activities:
+        return row
+
+    stats = compute_overview_stats(activities)
+    total = stats["total_duration"]
+    days_span = (stats["last_date"] - stats["first_date"]).days + 1
+    row.update(
+        activities=stats["total_activities"],
+        total_hours=total / 60,
+        projects=stats["level_counts"]["project"],
+        places=count_canonical_places(build_place_index(activities)),
+        avg_duration_min=total / stats["total_activities"],
+        first_date=stats["first_date"].isoformat(),
+        last_date=stats["last_date"].isoformat(),
+        days_span=days_span,
+        coverage_pct=min(covered_minutes(build_interval_index(activities)) / (days_span * 1440) * 100, 100),
+        daily_activities=stats["total_activities"] / days_span,
+        daily_hours=total / 60 / days_span,
+        demands=stats["level_counts"]["demand"],
+        activity_types=stats["level_counts"]["activity"],
+        behaviors=stats["level_counts"]["behavior"],
+        daytime_pct=stats["daytime_minutes"] / total * 100 if total > 0 else 0.0,
+    )
+    return row
+
+
+def daily_budget_rows(user, activities):
+    """每个有记录的日期各需求类型的分钟数（按本地日期精确拆分，跨午夜的活动分摊到两天）"""
+    if not activities:
+        return []
+    days, demands, minutes = daily_minutes_by(activities, field_values(activities, "demand"))
+    return [{"user": user, "date": day, "demand": demand, "minutes": value}
+            for day, demand, value in zip(days.astype(str).tolist(), demands, minutes.tolist())]
+
+
+def daily_trajectory_rows(user, mobility):
+    """每天的出行次数、出行距离和活动空间"""
+    trips = mobility["trips"]
+    trip_counts = trips.groupby("日期").size() if not trips.empty else {}
+    rows = []
+    for day in mobility["daily_space"].itertuples(index=False):
+        date = day[0]
+        rows.append({
+            "user": user,
+            "date": date.strftime("%Y-%m-%d"),
+            "trips": int(trip_counts.get(date, 0)),
+            "distance_km": float(mobility["daily_distance"].get(date, 0.0)),
+            "places": int(day[1]),
+            "radius_km": float(day[2]),
+            "area_km2": float(day[3]),
+        })
+    return rows
+
+
+def user_report(data_dir, user=None):
+    """读取一个数据目录并计算全部报表，返回 {表名: 行列表}"""
+    user = user or data_dir
+    activities = load_store(data_dir)["activities"]
+    report = {"summary": [summary_row(user, activities)], "daily_budget": [], "daily_trajectory": []}
+    if not activities:
+        return report
+
+    mobility = compute_mobility_metrics(activities)
+    report["summary"][0].update(
+        trips=len(mobility["trips"]),
+        avg_daily_distance_km=mobility["avg_daily_distance"],
+        avg_daily_radius_km=mobility["avg_daily_radius"],
+        avg_daily_area_km2=mobility["avg_daily_area"],
+        overall_radius_km=mobility["overall_radius"],
+        impossible_trips=mobility["impossible_trips"],
+    )
+    report["daily_budget"] = daily_budget_rows(user, activities)
+    report["daily_trajectory"] = daily_trajectory_rows(user, mobility)
+    return report
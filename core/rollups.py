@@ -0,0 +1,144 @@
+# core/rollups.py
+"""按日、ISO周和月的汇总表
+
+每个周期一个桶，记录活动数、总时长、各需求/企划/地点大类的时长和各规范地点
+的活动数（用于去重计数）。活动数和地点按开始日期归入周期，时长按本地日期
+拆分后分别计入（跨午夜的活动分摊到两天）；新增和删除活动时按差量更新，
+长时间跨度的图表只需读取几百个桶而不是全部历史。周期键是可按字符串
+排序的 "2024-01-05"、"2024-W01"、"2024-01"，日期范围查询直接二分。
+"""
+import bisect
+import datetime
+from collections import Counter
+
+import pandas as pd
+
+from .history import field_values
+from .intervals import split_by_day
+
+ROLLUP_LEVELS = ("day", "week", "month")
+ROLLUP_DIMENSIONS = ("demand", "project", "location_category")
+
+
+def period_key(level, date):
+    """日期所在周期的键"""
+    if level == "day":
+        return date.isoformat()
+    if level == "week":
+        year, week, _ = date.isocalendar()
+        return f"{year}-W{week:02d}"
+    return f"{date.year}-{date.month:02d}"
+
+
+def _new_rollups():
+    return {level: {"buckets": {}, "keys": []} for level in ROLLUP_LEVELS}
+
+
+def _new_bucket():
+    bucket = {"count": 0, "minutes": 0, "places": Counter()}
+    for dimension in ROLLUP_DIMENSIONS:
+        bucket[dimension] = Counter()
+    return bucket
+
+
+def _apply(rollups, activity, pieces, place, sign, levels=ROLLUP_LEVELS):
+    """把一条活动按 sign（+1 / -1）计入或扣出各粒度的桶
+
+    pieces 为活动按本地日期拆分的 [(日期, 分钟数), ...]，第一段是开始日期。
+    """
+    for level in levels:
+        table = rollups[level]
+        for i, (date, minutes) in enumerate(pieces):
+            key = period_key(level, date)
+            bucket = table["buckets"].get(key)
+            if bucket is None:
+                bucket = table["buckets"][key] = _new_bucket()
+                bisect.insort(table["keys"], key)
+            minutes *= sign
+            bucket["minutes"] += minutes
+            touched = [(bucket[dimension], activity.get(dimension, "")) for dimension in ROLLUP_DIMENSIONS]
+            for counter, name in touched:
+                counter[name] += minutes
+            if i == 0:
+                bucket["count"] += sign
+                if place not in (None, ""):
+                    bucket["places"][place] += sign
+                    touched.append((bucket["places"], place))
+            if sign < 0:
+                # 计数器不会自动清除零值，扣除后手动删掉，保证地点去重计数准确
+                for counter, name in touched:
+                    if counter[name] <= 0:
+                        del counter[name]
+                if bucket["count"] <= 0 and bucket["minutes"] <= 0:
+                    del table["buckets"][key]
+                    table["keys"].pop(bisect.bisect_left(table["keys"], key))
+
+
+def _day_pieces(activities):
+    """每条活动按本地日期拆分后的 [(日期, 分钟数), ...]"""
+    pieces = [[] for _ in range(len(activities))]
+    if activities:
+        rows, days, minutes = split_by_day(activities)
+        for row, day, value in zip(rows.tolist(), days.tolist(), minutes.tolist()):
+            pieces[row].append((day, value))
+    return pieces
+
+
+def build_rollups(activities, places):
+    """一次拆分建立日汇总表，周和月由日桶合并得到，places为与活动对应的规范地点"""
+    rollups = _new_rollups()
+    dimensions = zip(*(field_values(activities, dimension, "") for dimension in ROLLUP_DIMENSIONS))
+    for values, pieces, place in zip(dimensions, _day_pieces(activities), places):
+        _apply(rollups, dict(zip(ROLLUP_DIMENSIONS, values)), pieces, place, 1, ("day",))
+
+    days = rollups["day"]
+    for level in ("week", "month"):
+        groups = {}
+        for day in days["keys"]:
+            groups.setdefault(period_key(level, datetime.date.fromisoformat(day)), []).append(days["buckets"][day])
+        rollups[level] = {"buckets": {key: merge_buckets(buckets) for key, buckets in groups.items()},
+                          "keys": sorted(groups)}
+    return rollups
+
+
+def add_to_rollups(rollups, activity, place):
+    """新增活动后按差量更新汇总表，与插入顺序无关"""
+    _apply(rollups, activity, _day_pieces([activity])[0], place, 1)
+
+
+def remove_from_rollups(rollups, activity, place):
+    """删除活动后按差量扣除，桶中不再有活动和时长时移除该周期"""
+    _apply(rollups, activity, _day_pieces([activity])[0], place, -1)
+
+
+def query_rollups(rollups, level, start_date=None, end_date=None):
+    """日期范围内的 (周期键, 桶) 列表，首尾周期只要与范围相交就整体包含"""
+    table = rollups[level]
+    keys = table["keys"]
+    lo = bisect.bisect_left(keys, period_key(level, start_date)) if start_date else 0
+    hi = bisect.bisect_right(keys, period_key(level, end_date)) if end_date else len(keys)
+    return [(key, table["buckets"][key]) for key in keys[lo:hi]]
+
+
+def merge_buckets(buckets):
+    """合并多个桶，地点按并集去重"""
+    total = _new_bucket()
+    for bucket in buckets:
+        total["count"] += bucket["count"]
+        total["minutes"] += bucket["minutes"]
+        total["places"].update(bucket["places"])
+        for dimension in ROLLUP_DIMENSIONS:
+            total[dimension].update(bucket[dimension])
+    return total
+
+
+def rollup_frame(rollups, level, start_date=None, end_date=None, dimension=None):
+    """汇总表转为每周期一行的表格；指定维度时附加该维度各取值的时长（小时）列"""
+    rows = []
+    for key, bucket in query_rollups(rollups, level, start_date, end_date):
+        row = {"周期": key, "活动数": bucket["count"], "时长(小时)": bucket["minutes"] / 60,
+               "地点数": len(bucket["places"])}
+        if dimension:
+            row.update({name: minutes / 60 for name, minutes in bucket[dimension].items()})
+        rows.append(row)
+    return pd.DataFrame(rows, columns=None if rows else ["周期", "活动数", "时长(小时)", "地点数"]).fillna(0)
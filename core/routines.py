@@ -0,0 +1,146 @@
+# core/routines.py
+"""常规日程挖掘：(星期几, 小时窗口, 分类路径, 地点) 频繁模式
+
+按时间顺序一次扫描统计每个候选模式出现的天数，支持度和置信度达到阈值的
+模式视为常规日程，可以据此为某一天生成活动草稿。
+"""
+import datetime
+from collections import Counter
+from datetime import timedelta
+
+from .history import field_values, number_column, time_column
+from .places import place_display_name
+from .queries import activity_path, activity_paths, find_overlaps
+from .timezones import DEFAULT_TIMEZONE, local_to_epoch
+
+ROUTINE_MIN_DAYS = 3          # 模式至少出现的天数
+ROUTINE_MIN_SUPPORT = 0.5     # 出现天数 / 该星期几有记录的天数
+ROUTINE_MIN_CONFIDENCE = 0.5  # 该窗口内的活动中属于此模式的比例
+
+
+def _new_routine_index():
+    return {
+        "weekday_days": Counter(),    # 星期几 → 有记录的天数
+        "window_counts": Counter(),   # (星期几, 小时) → 活动数
+        "patterns": {},               # (星期几, 小时, 分类路径, 地点) → 统计
+        "last_date": "",
+        "last_start": None,           # 最近一次活动的UTC开始时间戳
+    }
+
+
+def _count_routine(index, fields, date, weekday, minute_of_day, place):
+    """把一条活动计入常规模式统计，活动须按时间顺序到达
+
+    fields 为 (分类路径, 时长, 地点大类, 地点名称, UTC开始时间戳)。
+    """
+    path, duration, category, name, start_ts = fields
+    hour = minute_of_day // 60
+    if date != index["last_date"]:
+        index["weekday_days"][weekday] += 1
+        index["last_date"] = date
+    index["window_counts"][(weekday, hour)] += 1
+    key = (weekday, hour, path, place)
+    stats = index["patterns"].get(key)
+    if stats is None:
+        stats = index["patterns"][key] = {"days": 0, "count": 0, "last_date": "", "start_sum": 0,
+                                          "duration_sum": 0, "categories": Counter(), "names": Counter()}
+    if stats["last_date"] != date:
+        stats["days"] += 1
+        stats["last_date"] = date
+    stats["count"] += 1
+    stats["start_sum"] += minute_of_day
+    stats["duration_sum"] += duration
+    stats["categories"][category] += 1
+    stats["names"][name] += 1
+    index["last_start"] = start_ts
+
+
+def build_routine_index(activities, places):
+    """按时间顺序一次扫描统计全部候选模式，places为与活动对应的规范地点"""
+    index = _new_routine_index()
+    if not activities:
+        return index
+    starts = time_column(activities, "start_time")
+    days = starts.astype("datetime64[D]")
+    minutes = (starts - days).astype("int64").tolist()
+    weekdays = ((days.astype("int64") + 3) % 7).tolist()  # 1970-01-01是周四
+    fields = zip(activity_paths(activities), number_column(activities, "duration").tolist(),
+                 field_values(activities, "location_category", ""), field_values(activities, "location_name", ""),
+                 number_column(activities, "start_ts").tolist())
+    for row, date, weekday, minute, place in zip(fields, days.astype(str).tolist(), weekdays, minutes, places):
+        _count_routine(index, row, date, weekday, minute, place)
+    return index
+
+
+def add_to_routine_index(index, activity, place):
+    """增量计入新活动；插入到历史中间时“按天去重”无法维护，返回False要求重建"""
+    if index["last_start"] is not None and activity["start_ts"] < index["last_start"]:
+        return False
+    start = datetime.datetime.fromisoformat(activity["start_time"])
+    fields = (activity_path(activity), activity["duration"], activity.get("location_category", ""),
+              activity.get("location_name", ""), activity["start_ts"])
+    _count_routine(index, fields, start.date().isoformat(), start.weekday(), start.hour * 60 + start.minute, place)
+    return True
+
+
+def mine_routines(index, weekday=None, min_days=ROUTINE_MIN_DAYS,
+                  min_support=ROUTINE_MIN_SUPPORT, min_confidence=ROUTINE_MIN_CONFIDENCE):
+    """筛选满足支持度和置信度阈值的常规模式，按支持度从高到低排列
+
+    先按 (星期几, 小时窗口) 剪枝：窗口本身出现的天数不足时其下的模式都不可能频繁。
+    """
+    routines = []
+    for (day, hour, path, place), stats in index["patterns"].items():
+        if weekday is not None and day != weekday:
+            continue
+        observed_days = index["weekday_days"][day]
+        if observed_days < min_days or stats["days"] < min_days:
+            continue
+        support = stats["days"] / observed_days
+        confidence = stats["count"] / index["window_counts"][(day, hour)]
+        if support >= min_support and confidence >= min_confidence:
+            routines.append({
+                "weekday": day, "hour": hour, "path": path, "place": place,
+                "support": support, "confidence": confidence,
+                "start_minute": round(stats["start_sum"] / stats["count"]),
+                "duration": round(stats["duration_sum"] / stats["count"]),
+                "location_category": stats["categories"].most_common(1)[0][0],
+                "location_name": stats["names"].most_common(1)[0][0],
+            })
+    return sorted(routines, key=lambda r: (r["support"], r["confidence"]), reverse=True)
+
+
+def draft_routine_day(routine_index, place_index, interval_index, date, tz_name=DEFAULT_TIMEZONE):
+    """根据常规模式生成某天（tz_name时区）的活动草稿，跳过彼此冲突或与已有记录冲突的模式"""
+    day_start = datetime.datetime.combine(date, datetime.time())
+    now = datetime.datetime.now().isoformat()
+    
+    drafts, taken = [], []
+    for routine in mine_routines(routine_index, date.weekday()):
+        start_dt = day_start + timedelta(minutes=routine["start_minute"])
+        end_dt = start_dt + timedelta(minutes=max(routine["duration"], 1))
+        start_min = local_to_epoch(start_dt, tz_name) // 60
+        end_min = start_min + max(routine["duration"], 1)
+        if any(s < end_min and start_min < e for s, e in taken) or find_overlaps(interval_index, start_min, end_min):
+            continue
+        taken.append((start_min, end_min))
+        
+        place = routine["place"]
+        location_name = place_display_name(place_index, place) if isinstance(place, int) else routine["location_name"]
+        coordinates = ({"lat": place_index["places"][place]["lat"], "lng": place_index["places"][place]["lng"]}
+                       if isinstance(place, int) else None)
+        demand, project, activity, behavior = routine["path"]
+        drafts.append({
+            "start_time": start_dt.isoformat(),
+            "end_time": end_dt.isoformat(),
+            "tz": tz_name,
+            "duration": max(routine["duration"], 1),
+            "location_category": routine["location_category"],
+            "location_tag": "",
+            "location_name": location_name,
+            "coordinates": coordinates,
+            "demand": demand, "project": project, "activity": activity, "behavior": behavior,
+            "description": f"常规日程（支持度 {routine['support'] * 100:.0f}%）",
+            "created_at": now,
+        })
+    return sorted(drafts, key=lambda x: x["start_time"])
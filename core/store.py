@@ -0,0 +1,204 @@
+# core/store.py
+"""JSON数据存储：数据文件读写、默认数据、活动的批量写入和删除
+
+数据以与界面会话状态同名的键组织（activities、classification_system、
+location_categories、activity_templates），批处理脚本可以直接把
+load_store() 返回的字典当作状态传给 core.indexes 中的函数。
+
+活动保存为列式文件（见 core.columnar）：字符串字段按列字典编码，数值和
+时间为定长数组，读取时内存映射为按需物化的 ActivityHistory（见 core.history）。
+旧版的 activities.json（活动列表，或分类路径按路径表编码的格式）在没有列式
+文件时照常读取，下次保存时转为列式文件；JSON仍用于其余数据和导出。
+"""
+import copy
+import json
+import os
+
+import numpy as np
+
+from . import history, indexes
+from .classification import CLASSIFICATION_LEVELS
+from .history import number_column, sort_by_start, take
+from .timezones import DEFAULT_TIMEZONE, migrate_activities, normalize_activity
+
+STORE_FILES = {
+    "activities": "activities.bin",
+    "classification_system": "classification_system.json",
+    "location_categories": "location_categories.json",
+    "activity_templates": "activity_templates.json",
+}
+LEGACY_STORE_FILES = {"activities": "activities.json"}
+
+DEFAULT_LOCATION_CATEGORIES = {
+    "居住场所": ['家', '宿舍', '酒店', '民宿', '亲友家'],
+    "工作场所": ['办公室', '工厂', '店铺', '工地', '实验室'],
+    "商业场所": ['超市', '商场', '餐厅', '银行', '理发店'],
+    "教育场所": ['学校', '图书馆', '培训机构', '幼儿园', '大学'],
+    "医疗场所": ['医院', '诊所', '药店', '体检中心', '康复中心'],
+    "娱乐场所": ['电影院', 'KTV', '健身房', '游乐园', '咖啡厅'],
+    "交通场所": ['地铁站', '公交站', '火车站', '机场', '停车场'],
+    "公共场所": ['公园', '广场', '政府机关', '社区中心', '邮局'],
+    "自然场所": ['山地', '海边', '森林', '湖泊', '河流'],
+    "其他场所": ['未分类', '临时场所', '特殊场所']
+}
+
+DEFAULT_CLASSIFICATION_SYSTEM = {
+    "个人": {
+        "个人生理": {
+            "睡觉休息": {"睡觉": ["夜间睡眠", "午睡", "小憩"], "休息": ["放松", "冥想", "发呆"]},
+            "进食": {"用餐": ["早餐", "午餐", "晚餐", "零食"], "饮水": ["喝水", "饮茶", "饮料"]},
+            "个人健康维护": {"洗漱": ["刷牙", "洗脸", "洗澡"], "健康检查": ["体检", "看医生"], "调理身体": ["按摩", "理疗", "泡脚"]}
+        },
+        "个人休闲": {
+            "娱乐消遣": {"看电视": ["电视剧", "电影", "综艺"], "游戏": ["手机游戏", "电脑游戏", "主机游戏"]},
+            "阅读学习": {"阅读": ["看书", "看新闻", "看杂志"], "学习": ["在线课程", "技能提升", "语言学习"]},
+            "运动锻炼": {"做操": ["太极", "八段锦", "广播体操"], "健身": ["跑步", "游泳", "器械训练"]}
+        }
+    },
+    "家庭": {
+        "家庭空间维护": {
+            "清洁打扫": {"打扫": ["扫地", "拖地", "整理"], "洗涤": ["洗衣", "晾衣", "熨烫"]}
+        },
+        "照顾家人": {
+            "照顾孩子": {"接送": ["上学接送", "活动接送"], "陪伴": ["陪玩", "作业辅导", "亲子时光"]}
+        }
+    },
+    "工作": {
+        "办公": {
+            "日常工作": {"会议": ["团队会议", "项目讨论", "客户会议"], "文档处理": ["报告编写", "邮件处理", "资料整理"]}
+        }
+    },
+    "移动": {
+        "交通出行": {
+            "通勤": {"上班通勤": ["地铁", "公交", "开车", "骑行"], "日常出行": ["步行", "打车", "骑车"]}
+        }
+    }
+}
+
+_DEFAULTS = {
+    "activities": [],
+    "classification_system": DEFAULT_CLASSIFICATION_SYSTEM,
+    "location_categories": DEFAULT_LOCATION_CATEGORIES,
+    "activity_templates": {},
+}
+
+
+def default_data(key):
+    """某项数据的默认值（深拷贝，可放心修改）"""
+    return copy.deepcopy(_DEFAULTS[key])
+
+
+def load_json_file(file_path, default_data):
+    """从JSON文件加载数据，文件不存在时返回默认数据；读取或解析失败时抛出异常"""
+    if not os.path.exists(file_path):
+        return default_data
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_json_file(file_path, data):
+    """保存数据到JSON文件"""
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def decode_activities(data):
+    """旧版JSON活动文件还原为活动列表：活动列表原样返回，路径表格式按路径编号还原"""
+    if isinstance(data, list):
+        return data
+    paths = [dict(zip(CLASSIFICATION_LEVELS, path)) for path in data["paths"]]
+    activities = data["activities"]
+    for activity in activities:
+        activity.update(paths[activity.pop("path_code")])
+    return activities
+
+
+_JSON_DECODERS = {"activities": decode_activities}
+_FILE_FORMATS = {"activities": (history.open_history, history.save_history)}
+
+
+def load_data_file(file_path, key):
+    """读取一项数据；没有列式活动文件时读取同目录下的旧版JSON，都不存在时返回默认数据"""
+    if key in _FILE_FORMATS and os.path.exists(file_path):
+        return _FILE_FORMATS[key][0](file_path)
+    if key in LEGACY_STORE_FILES:
+        file_path = os.path.join(os.path.dirname(file_path), LEGACY_STORE_FILES[key])
+    if not os.path.exists(file_path):
+        return default_data(key)
+    data = load_json_file(file_path, None)
+    return _JSON_DECODERS[key](data) if key in _JSON_DECODERS else data
+
+
+def save_data_file(file_path, key, data):
+    """按该项数据的存储格式写入文件"""
+    if key in _FILE_FORMATS:
+        _FILE_FORMATS[key][1](file_path, data)
+    else:
+        save_json_file(file_path, data)
+
+
+def is_data_dir(path):
+    """目录中是否有活动文件（列式或旧版JSON）"""
+    return any(os.path.isfile(os.path.join(path, name))
+               for name in (STORE_FILES["activities"], LEGACY_STORE_FILES["activities"]))
+
+
+def load_store(data_dir, default_tz=DEFAULT_TIMEZONE):
+    """读取数据目录中的全部数据，缺少UTC时间戳的旧活动按default_tz补齐"""
+    state = {key: load_data_file(os.path.join(data_dir, name), key) for key, name in STORE_FILES.items()}
+    migrate_activities(state["activities"], default_tz)
+    renumber_duplicate_ids(state["activities"])
+    return state
+
+
+def save_store(state, data_dir):
+    """把状态中的全部数据写回数据目录"""
+    os.makedirs(data_dir, exist_ok=True)
+    for key, name in STORE_FILES.items():
+        save_data_file(os.path.join(data_dir, name), key, state[key])
+
+
+def next_activity_id(activities):
+    """下一个可用的活动编号（删除记录后按数量编号会产生重复）"""
+    return int(number_column(activities, "id").max()) + 1 if len(activities) else 1
+
+
+def renumber_duplicate_ids(activities):
+    """旧数据迁移：早期按活动数量编号留下的重复编号，除第一条外改为新的编号，返回改动的活动数
+
+    删除、分类改名等都按编号定位活动，编号必须唯一。只读取编号列，只物化重复的活动。
+    """
+    ids = number_column(activities, "id")
+    _, first = np.unique(ids, return_index=True)
+    if len(first) == len(ids):
+        return 0
+    duplicates = np.setdiff1d(np.arange(len(ids)), first)
+    next_id = int(ids.max()) + 1
+    for offset, activity in enumerate(take(activities, duplicates)):
+        activity["id"] = next_id + offset
+    return len(duplicates)
+
+
+def add_activities(state, new_activities):
+    """批量写入活动：统一编号、换算UTC时间戳、一次排序并增量更新已构建的派生索引
+
+    未指定时区的活动使用 state["timezone"]（默认 DEFAULT_TIMEZONE）。
+    """
+    next_id = next_activity_id(state["activities"])
+    default_tz = state.get("timezone", DEFAULT_TIMEZONE)
+    for offset, activity in enumerate(new_activities):
+        activity["id"] = next_id + offset
+        normalize_activity(activity, default_tz)
+    state["activities"].extend(new_activities)
+    sort_by_start(state["activities"])
+    for activity in new_activities:
+        indexes.on_activity_added(state, activity)
+
+
+def remove_activity(state, activity_id):
+    """按编号删除一条活动，返回被删除的活动（不存在时返回None）"""
+    positions = np.flatnonzero(number_column(state["activities"], "id") == activity_id)
+    if not len(positions):
+        return None
+    indexes.on_activity_removed(state, state["activities"][int(positions[0])])
+    return state["activities"].pop(int(positions[0]))
@@ -0,0 +1,75 @@
+# core/timezones.py
+"""时区与UTC时间戳
+
+每条活动除了活动所在时区的本地时间字符串 start_time / end_time（用于显示和
+按本地日期、时刻统计）外，还保存写入时换算好的UTC秒级时间戳 start_ts /
+end_ts 和时区名 tz。排序、区间重叠和日期范围查询都用整数时间戳完成，
+跨时区出行和夏令时切换不会打乱顺序；旧数据加载时按默认时区补齐。
+"""
+import datetime
+from functools import lru_cache
+
+import pytz
+
+from .history import incomplete_activities, number_column, sort_by_start
+
+DEFAULT_TIMEZONE = "Asia/Shanghai"
+MAX_UTC_OFFSET_SECONDS = 14 * 3600  # 各时区与UTC的最大偏移，按日期查询时用于放宽时间戳范围
+EPOCH_DATE = datetime.date(1970, 1, 1)
+
+
+@lru_cache(maxsize=None)
+def get_zone(name):
+    return pytz.timezone(name)
+
+
+def local_to_epoch(local, tz_name):
+    """某时区的本地时间（无时区datetime）转换为UTC秒级时间戳
+
+    夏令时回拨造成的重复时刻取标准时间，拨快造成的不存在时刻按拨快前的偏移换算。
+    """
+    return int(get_zone(tz_name).localize(local, is_dst=False).timestamp())
+
+
+def epoch_to_local(ts, tz_name):
+    """UTC时间戳转换为某时区的本地时间（无时区datetime）"""
+    return datetime.datetime.fromtimestamp(ts, get_zone(tz_name)).replace(tzinfo=None)
+
+
+def date_to_epoch(date):
+    """日期在UTC下的零点时间戳，配合 MAX_UTC_OFFSET_SECONDS 粗定位任意时区的本地日期"""
+    return (date - EPOCH_DATE).days * 86400
+
+
+def set_activity_times(activity, start, end, tz_name):
+    """按本地开始、结束时间和时区写入活动的时间字段"""
+    activity["start_time"] = start.isoformat()
+    activity["end_time"] = end.isoformat()
+    activity["tz"] = tz_name
+    activity["start_ts"] = local_to_epoch(start, tz_name)
+    activity["end_ts"] = local_to_epoch(end, tz_name)
+    return activity
+
+
+def normalize_activity(activity, default_tz=DEFAULT_TIMEZONE):
+    """为缺少UTC时间戳的活动补齐时区和时间戳，返回是否有修改"""
+    if "start_ts" in activity and "end_ts" in activity and activity.get("tz"):
+        return False
+    tz_name = activity.get("tz") or default_tz
+    set_activity_times(activity, datetime.datetime.fromisoformat(activity["start_time"]),
+                       datetime.datetime.fromisoformat(activity["end_time"]), tz_name)
+    return True
+
+
+def migrate_activities(activities, default_tz=DEFAULT_TIMEZONE):
+    """旧数据迁移：补齐时间戳后按UTC开始时间重新排序，返回补齐的活动数"""
+    migrated = sum(normalize_activity(activity, default_tz)
+                   for activity in incomplete_activities(activities, ("start_ts", "end_ts", "tz")))
+    if migrated:
+        sort_by_start(activities)
+    return migrated
+
+
+def ts_array(activities, field="start_ts"):
+    """活动时间戳的int64数组"""
+    return number_column(activities, field)
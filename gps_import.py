@@ -0,0 +1,253 @@
+# gps_import.py
+"""GPS轨迹导入：流式解析GPX/CSV/Google Takeout文件，识别停留与移动
+
+本模块不依赖Streamlit，解析函数可以在进程池中并行处理多个文件。
+所有解析器都是生成器，逐点读取，内存占用与文件大小无关。
+"""
+import csv
+import datetime
+import json
+import math
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import pytz
+
+from core.timezones import DEFAULT_TIMEZONE
+
+DEFAULT_SAMPLE_SECONDS = 30     # 降采样：两个保留点之间的最小时间间隔
+DEFAULT_STAY_RADIUS_M = 200     # 停留点半径
+DEFAULT_MIN_STAY_MINUTES = 20   # 停留的最短时长
+EARTH_RADIUS_M = 6371008.8
+
+LAT_FIELDS = ("lat", "latitude", "纬度")
+LNG_FIELDS = ("lng", "lon", "long", "longitude", "经度")
+TIME_FIELDS = ("time", "timestamp", "datetime", "date_time", "时间")
+
+
+def distance_m(lat1, lng1, lat2, lng2):
+    """两点间的球面距离（米）"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def parse_gps_time(value):
+    """解析轨迹时间
+
+    支持ISO字符串（含Z或时区偏移）和毫秒/秒级Unix时间戳。带时区的时间
+    保持带时区，时区换算推迟到识别出片段之后，避免对每个点做换算；
+    不带时区的字符串视为已经是本地时间。
+    """
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+        seconds = float(value)
+        if seconds > 1e11:  # 毫秒时间戳
+            seconds /= 1000
+        return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc)
+    value = value.strip().replace(" ", "T", 1)
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    return datetime.datetime.fromisoformat(value)
+
+
+def to_local_time(moment, tz):
+    """带时区的时间换算为本地时区的无时区datetime"""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(tz).replace(tzinfo=None)
+
+
+def iter_gpx_points(path):
+    """流式读取GPX中的轨迹点，已处理的元素立即清理"""
+    for _, elem in ET.iterparse(path, events=("end",)):
+        tag = elem.tag.rsplit("}", 1)[-1]
+        if tag in ("trkpt", "rtept", "wpt"):
+            time_text = None
+            for child in elem:
+                if child.tag.rsplit("}", 1)[-1] == "time":
+                    time_text = child.text
+                    break
+            if time_text:
+                yield parse_gps_time(time_text), float(elem.get("lat")), float(elem.get("lon"))
+            elem.clear()
+        elif tag in ("trkseg", "trk", "rte"):
+            elem.clear()
+
+
+def _pick_field(fieldnames, candidates):
+    lowered = {name.strip().lower(): name for name in fieldnames}
+    for candidate in candidates:
+        if candidate in lowered:
+            return lowered[candidate]
+    return None
+
+
+def iter_csv_points(path):
+    """流式读取CSV轨迹，自动识别经纬度和时间列"""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        fields = reader.fieldnames or []
+        lat_field = _pick_field(fields, LAT_FIELDS)
+        lng_field = _pick_field(fields, LNG_FIELDS)
+        time_field = _pick_field(fields, TIME_FIELDS)
+        if not (lat_field and lng_field and time_field):
+            raise ValueError(f"CSV缺少经纬度或时间列: {fields}")
+        for row in reader:
+            try:
+                yield (parse_gps_time(row[time_field]),
+                       float(row[lat_field]), float(row[lng_field]))
+            except (TypeError, ValueError):
+                continue
+
+
+def _iter_json_array_items(f, key, chunk_size=1 << 20):
+    """在不整体加载文件的情况下逐个读取JSON对象中某个数组的元素"""
+    decoder = json.JSONDecoder()
+    marker = f'"{key}"'
+    buffer = ""
+    # 定位数组起点
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        buffer += chunk
+        pos = buffer.find(marker)
+        if pos < 0:
+            buffer = buffer[-len(marker):]
+            continue
+        bracket = buffer.find("[", pos + len(marker))
+        if bracket >= 0:
+            buffer = buffer[bracket + 1:]
+            break
+        buffer = buffer[pos:]
+
+    # 用偏移量推进而不是切片，避免每个元素都复制整个缓冲区
+    pos = 0
+    eof = False
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            item, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                return
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield item
+
+
+def iter_takeout_points(path):
+    """流式读取Google Takeout位置记录（Records.json）"""
+    with open(path, "r", encoding="utf-8") as f:
+        for item in _iter_json_array_items(f, "locations"):
+            if "latitudeE7" not in item or "longitudeE7" not in item:
+                continue
+            stamp = item.get("timestamp") or item.get("timestampMs")
+            if stamp is None:
+                continue
+            yield parse_gps_time(stamp), item["latitudeE7"] / 1e7, item["longitudeE7"] / 1e7
+
+
+def detect_track_format(path):
+    """根据扩展名判断轨迹格式"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".gpx":
+        return "gpx"
+    if ext == ".csv":
+        return "csv"
+    if ext == ".json":
+        return "takeout"
+    raise ValueError(f"不支持的轨迹文件格式: {ext}")
+
+
+TRACK_READERS = {
+    "gpx": iter_gpx_points,
+    "csv": iter_csv_points,
+    "takeout": iter_takeout_points,
+}
+
+
+def downsample_points(points, min_interval_seconds):
+    """按时间降采样，丢弃乱序和间隔过短的点"""
+    last_time = None
+    step = datetime.timedelta(seconds=min_interval_seconds)
+    for point in points:
+        if last_time is None or point[0] >= last_time + step:
+            last_time = point[0]
+            yield point
+
+
+def detect_stays_and_moves(points, radius_m=DEFAULT_STAY_RADIUS_M, min_stay_minutes=DEFAULT_MIN_STAY_MINUTES):
+    """在线识别停留与移动，只保留当前候选停留的常数级状态
+
+    点持续落在候选中心的半径内即视为同一次停留候选；离开后若持续时间达到
+    阈值则输出一次停留，两次停留之间的部分输出为一次移动。
+    """
+    min_stay = datetime.timedelta(minutes=min_stay_minutes)
+    candidate = None  # [开始时间, 最后时间, 中心纬度, 中心经度, 点数]
+    last_stay_end = None
+    move_distance = 0.0
+    prev_point = None
+
+    def close_candidate():
+        nonlocal last_stay_end, move_distance
+        if candidate and candidate[1] - candidate[0] >= min_stay:
+            if last_stay_end is not None:
+                yield {"type": "move", "start": last_stay_end[0], "end": candidate[0],
+                       "from": last_stay_end[1], "to": (candidate[2], candidate[3]),
+                       "distance_m": move_distance}
+            yield {"type": "stay", "start": candidate[0], "end": candidate[1],
+                   "lat": candidate[2], "lng": candidate[3], "points": candidate[4]}
+            last_stay_end = (candidate[1], (candidate[2], candidate[3]))
+            move_distance = 0.0
+
+    for time_point, lat, lng in points:
+        if prev_point is not None:
+            move_distance += distance_m(prev_point[0], prev_point[1], lat, lng)
+        prev_point = (lat, lng)
+
+        if candidate and distance_m(candidate[2], candidate[3], lat, lng) <= radius_m:
+            count = candidate[4] + 1
+            candidate[1] = time_point
+            candidate[2] += (lat - candidate[2]) / count
+            candidate[3] += (lng - candidate[3]) / count
+            candidate[4] = count
+            continue
+
+        yield from close_candidate()
+        candidate = [time_point, time_point, lat, lng, 1]
+
+    yield from close_candidate()
+
+
+def read_track_segments(path, fmt=None, timezone=DEFAULT_TIMEZONE,
+                        sample_seconds=DEFAULT_SAMPLE_SECONDS,
+                        radius_m=DEFAULT_STAY_RADIUS_M,
+                        min_stay_minutes=DEFAULT_MIN_STAY_MINUTES):
+    """解析一个轨迹文件，返回按时间排列的停留/移动片段列表"""
+    tz = pytz.timezone(timezone)
+    reader = TRACK_READERS[fmt or detect_track_format(path)]
+    points = downsample_points(reader(path), sample_seconds)
+    segments = list(detect_stays_and_moves(points, radius_m, min_stay_minutes))
+    for segment in segments:
+        segment["start"] = to_local_time(segment["start"], tz)
+        segment["end"] = to_local_time(segment["end"], tz)
+        segment["source"] = os.path.basename(path)
+    return segments
+
+
+def read_tracks_parallel(paths, workers=None, **options):
+    """多个轨迹文件分发到进程池并行解析，单个文件时直接在当前进程处理"""
+    if len(paths) <= 1 or workers == 1:
+        return [read_track_segments(path, **options) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(read_track_segments, path, **options) for path in paths]
+        return [future.result() for future in futures]
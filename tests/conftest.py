@@ -0,0 +1,16 @@
+# tests/conftest.py
+"""测试共用的合成历史和索引状态"""
+import pytest
+
+from helpers import make_history
+
+
+@pytest.fixture
+def history():
+    return make_history()
+
+
+@pytest.fixture
+def state(history):
+    """与界面会话状态结构相同的索引状态，派生索引按需构建"""
+    return {"activities": history}
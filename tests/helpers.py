@@ -0,0 +1,69 @@
+# tests/helpers.py
+"""按日程生成的合成活动历史"""
+import datetime
+from datetime import timedelta
+
+from core.timezones import DEFAULT_TIMEZONE, set_activity_times
+
+# 地点名称 → (地点类型, 地点标签, 坐标)，地铁没有坐标
+PLACES = {
+    "家": ("居住场所", "家", (31.2304, 121.4737)),
+    "公司": ("工作场所", "办公室", (31.2397, 121.4998)),
+    "健身房": ("娱乐场所", "健身房", (31.2150, 121.4450)),
+    "地铁": ("交通场所", "地铁站", None),
+}
+SLEEP = ("个人", "个人生理", "睡觉休息", "睡觉")
+COMMUTE = ("移动", "交通出行", "通勤", "上班通勤")
+# (开始时刻, 分钟数, 分类路径, 地点)
+WEEKDAY_PLAN = [
+    ("00:00", 420, SLEEP, "家"),
+    ("07:30", 30, ("个人", "个人生理", "进食", "用餐"), "家"),
+    ("08:20", 40, COMMUTE, "地铁"),
+    ("09:00", 180, ("工作", "办公", "日常工作", "会议"), "公司"),
+    ("13:00", 300, ("工作", "办公", "日常工作", "文档处理"), "公司"),
+    ("18:30", 40, COMMUTE, "地铁"),
+    ("19:30", 60, ("个人", "个人休闲", "运动锻炼", "健身"), "健身房"),
+    ("22:00", 120, SLEEP, "家"),
+]
+WEEKEND_PLAN = [
+    ("00:00", 540, SLEEP, "家"),
+    ("10:00", 120, ("家庭", "家庭空间维护", "清洁打扫", "打扫"), "家"),
+    ("14:00", 180, ("个人", "个人休闲", "阅读学习", "阅读"), "家"),
+    ("22:00", 120, SLEEP, "家"),
+]
+FIRST_DAY = datetime.date(2024, 3, 4)  # 周一
+
+
+def make_activity(activity_id, start, minutes, path, place="家", jitter=0.0, tz=DEFAULT_TIMEZONE, **fields):
+    """一条活动记录，字段与记录表单写入的一致；start 是 tz 时区的本地时间"""
+    category, tag, coords = PLACES[place]
+    activity = {
+        "id": activity_id,
+        "duration": minutes,
+        "location_category": category,
+        "location_tag": tag,
+        "location_name": place,
+        "coordinates": {"lat": coords[0] + jitter, "lng": coords[1] - jitter} if coords else None,
+        "demand": path[0],
+        "project": path[1],
+        "activity": path[2],
+        "behavior": path[3],
+        "description": "",
+        "created_at": start.isoformat(),
+    }
+    set_activity_times(activity, start, start + timedelta(minutes=minutes), tz)
+    activity.update(fields)
+    return activity
+
+
+def make_history(days=28, first_day=FIRST_DAY):
+    """按工作日/周末日程生成的历史，按开始时间排序；坐标带约10米的抖动"""
+    activities = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        plan = WEEKDAY_PLAN if day.weekday() < 5 else WEEKEND_PLAN
+        for n, (clock, minutes, path, place) in enumerate(plan):
+            start = datetime.datetime.combine(day, datetime.time.fromisoformat(clock))
+            jitter = ((offset * 7 + n) % 5 - 2) * 0.0001
+            activities.append(make_activity(len(activities) + 1, start, minutes, path, place, jitter))
+    return activities
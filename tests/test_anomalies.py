@@ -0,0 +1,54 @@
+# tests/test_anomalies.py
+"""异常日：稳健基线评分找出偏离日程的日期，跨天增量评分与整体计算一致"""
+import datetime
+
+import numpy as np
+
+from core import indexes
+from core.anomalies import (build_anomaly_report, day_anomaly_features, extend_anomaly_report, rank_anomalies,
+                            score_anomalies)
+from core.places import activity_places
+
+UNUSUAL_DAY = "2024-03-20"  # 周三，没有去公司
+
+
+def report_for(state, closed_before):
+    return build_anomaly_report(state["activities"], indexes.get_place_index(state),
+                                indexes.get_routine_index(state), closed_before)
+
+
+def test_unusual_day_ranks_first(state, history):
+    state["activities"] = [a for a in history
+                           if not (a["start_time"].startswith(UNUSUAL_DAY) and a["location_name"] == "公司")]
+    report = report_for(state, datetime.date(2024, 4, 1))
+    assert len(report["dates"]) == 28
+    ranked = rank_anomalies(report)
+    assert ranked.iloc[0]["日期"] == UNUSUAL_DAY
+    assert "工作日未到工作地偏多" in ranked.iloc[0]["主要偏离"]
+
+
+def test_too_few_days_has_no_baseline(state):
+    assert report_for(state, datetime.date(2024, 3, 10))["dates"] is None
+
+
+def test_extend_scores_new_days_against_cached_baseline(state, history):
+    report = report_for(state, datetime.date(2024, 3, 25))
+    first_scores = report["scores"].copy()
+    place_index = indexes.get_place_index(state)
+    extend_anomaly_report(report, history, place_index, datetime.date(2024, 4, 1))
+
+    full = report_for(state, datetime.date(2024, 4, 1))
+    assert np.array_equal(report["dates"], full["dates"])
+    assert np.array_equal(report["scores"][:len(first_scores)], first_scores)
+    new = [a for a in history if a["start_time"] >= "2024-03-25"]
+    _, features, _ = day_anomaly_features(new, activity_places(place_index, new), report["context"])
+    z, _ = score_anomalies(full["dates"][-7:], features, report["baseline"])
+    assert np.allclose(report["z"][-7:], z)
+
+
+def test_backdated_activity_drops_report(state, history):
+    indexes.get_anomaly_report(state, today=datetime.date(2024, 4, 1))
+    backdated = dict(history[10], id=999)
+    state["activities"].append(backdated)
+    indexes.on_activity_added(state, backdated)
+    assert "anomaly_report" not in state
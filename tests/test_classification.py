@@ -0,0 +1,115 @@
+# tests/test_classification.py
+"""分类树索引：不读取活动的树索引、按需建立的倒排表和按编号改写活动"""
+from core import columnar, indexes, store
+from core.classification import (child_names, count_activities, delete_node, restore_orphans)
+from core.history import open_history, save_history
+
+
+def system():
+    return {
+        "学习": {"课程": {"上课": {"听讲": ["笔记"], "讨论": []}}},
+        "工作": {"项目": {"开发": {"编码": [], "评审": []}}},
+    }
+
+
+def activity(i, path):
+    fields = dict(zip(("demand", "project", "activity", "behavior", "segment"), path))
+    return dict({"id": i, "start_ts": i * 60, "description": ""}, **fields)
+
+
+def sample():
+    return [
+        activity(1, ("学习", "课程", "上课", "听讲", "笔记")),
+        activity(2, ("学习", "课程", "上课", "讨论")),
+        activity(3, ("工作", "项目", "开发", "编码")),
+        activity(4, ("工作", "项目", "开发", "评审")),
+        activity(5, ("运动", "跑步", "户外", "慢跑")),
+    ]
+
+
+def history_state(tmp_path, activities):
+    path = str(tmp_path / "activities.bin")
+    columnar.write_activities(path, activities)
+    history = open_history(path)
+    return path, {"activities": history, "classification_system": system(), "activity_templates": {}}
+
+
+def test_tree_index_does_not_read_activities(tmp_path):
+    _, state = history_state(tmp_path, sample())
+    index = indexes.get_classification_index(state)
+    assert child_names(index, ()) == ["学习", "工作"]
+    assert child_names(index, ("学习", "课程", "上课")) == ["听讲", "讨论"]
+    assert index["members"] is None
+    assert not state["activities"]._loaded
+
+
+def test_members_count_and_orphans(tmp_path):
+    _, state = history_state(tmp_path, sample())
+    index = indexes.get_classification_index(state, members=True)
+    assert count_activities(index, ("学习",)) == 2
+    assert count_activities(index, ("工作", "项目", "开发", "评审")) == 1
+    assert index["orphans"] == {5: ("运动", "跑步", "户外", "慢跑")}
+    assert not delete_node(index, state["classification_system"], ("学习",))
+    assert not state["activities"]._loaded
+
+
+def test_rename_rewrites_only_affected_activities(tmp_path):
+    path, state = history_state(tmp_path, sample())
+    state["activity_templates"] = {"开发": activity(0, ("工作", "项目", "开发", "编码"))}
+    assert indexes.rename_classification(state, ("工作", "项目"), "产品") == 2
+    history = state["activities"]
+    assert sorted(history._loaded) == [2, 3]
+    assert state["activity_templates"]["开发"]["project"] == "产品"
+
+    save_history(path, history)
+    reopened = open_history(path)
+    assert reopened.field_values("project") == ["课程", "课程", "产品", "产品", "跑步"]
+    index = indexes.get_classification_index(state, members=True)
+    assert count_activities(index, ("工作", "产品", "开发")) == 2
+
+
+def test_merge_moves_members_and_orphans():
+    activities = sample() + [activity(6, ("工作", "运营", "开发", "评审"))]
+    classification_system = system()
+    state = {"activities": activities, "classification_system": classification_system, "activity_templates": {}}
+    index = indexes.get_classification_index(state, members=True)
+    assert index["orphans"][6] == ("工作", "运营", "开发", "评审")
+
+    changed = indexes.merge_classification(state, ("学习",), ("工作",))
+    assert changed == 2
+    assert classification_system["工作"]["课程"]["上课"]["听讲"] == ["笔记"]
+    assert [a["demand"] for a in activities] == ["工作", "工作", "工作", "工作", "运动", "工作"]
+    assert count_activities(index, ("工作",)) == 4
+    assert count_activities(index, ("工作", "课程", "上课", "听讲", "笔记")) == 1
+
+    assert restore_orphans(index, classification_system) == 2
+    assert index["orphans"] == {}
+    assert count_activities(index, ("工作", "运营")) == 1
+    assert "运动" in classification_system
+
+
+def test_incremental_updates_with_and_without_members():
+    activities = sample()
+    state = {"activities": activities, "classification_system": system(), "activity_templates": {}}
+    indexes.get_classification_index(state)
+    new = activity(7, ("学习", "课程", "上课", "讨论"))
+    activities.append(new)
+    indexes.on_activity_added(state, new)
+    assert state["classification_index"]["members"] is None
+
+    index = indexes.get_classification_index(state, members=True)
+    assert count_activities(index, ("学习", "课程", "上课", "讨论")) == 2
+    indexes.on_activity_removed(state, new)
+    activities.remove(new)
+    assert count_activities(index, ("学习", "课程", "上课", "讨论")) == 1
+
+
+def test_rename_with_duplicate_ids_from_old_data():
+    # 早期按活动数量编号，删除记录后新活动会与已有活动同号
+    activities = [activity(1, ("学习", "课程")), activity(2, ("工作", "项目")), activity(2, ("学习", "课程"))]
+    assert store.renumber_duplicate_ids(activities) == 1
+    assert [a["id"] for a in activities] == [1, 2, 3]
+
+    state = {"activities": activities, "classification_system": system(), "activity_templates": {}}
+    assert indexes.rename_classification(state, ("工作",), "职业") == 1
+    assert [a["demand"] for a in activities] == ["学习", "职业", "学习"]
@@ -0,0 +1,140 @@
+# tests/test_columnar.py
+"""列式活动文件的读写往返：编码 → 写入 → 映射 → 物化"""
+import os
+
+import numpy as np
+import pytest
+
+from core import columnar
+
+
+def activity(i, **fields):
+    record = {
+        "id": i,
+        "demand": "学习",
+        "description": f"第{i}条",
+        "start_time": f"2024-03-0{i % 9 + 1}T08:30:00",
+        "end_time": f"2024-03-0{i % 9 + 1}T09:15:00",
+        "start_ts": 1709253000 + i * 3600,
+        "coordinates": {"lat": 31.2 + i / 100, "lng": 121.4},
+    }
+    record.update(fields)
+    return record
+
+
+def round_trip(tmp_path, activities):
+    path = str(tmp_path / "activities.bin")
+    columnar.write_activities(path, activities)
+    return columnar.read_activities(path)
+
+
+def test_round_trip_column_kinds(tmp_path):
+    activities = [activity(i) for i in range(5)]
+    table_path = str(tmp_path / "activities.bin")
+    columnar.write_activities(table_path, activities)
+    columns = columnar.read_columns(table_path)["columns"]
+    assert {name: column["kind"] for name, column in columns.items()} == {
+        "id": "int", "demand": "str", "description": "str", "start_time": "time",
+        "end_time": "time", "start_ts": "int", "coordinates": "point"}
+    assert isinstance(columns["id"]["data"], np.memmap)
+    assert columnar.read_activities(table_path) == activities
+
+
+def test_missing_fields_stay_missing(tmp_path):
+    activities = [activity(0), activity(1, segment="阅读"), activity(2, coordinates=None)]
+    del activities[0]["description"]
+    restored = round_trip(tmp_path, activities)
+    assert restored == activities
+    assert "description" not in restored[0] and "segment" not in restored[0]
+
+
+def test_mixed_values_fall_back_to_json(tmp_path):
+    activities = [activity(0, extra=1), activity(1, extra="a"), activity(2, extra=[1, {"k": None}]),
+                  activity(3, coordinates={"lat": 1.0, "lng": 2.0, "alt": 3.0})]
+    path = str(tmp_path / "activities.bin")
+    columnar.write_activities(path, activities)
+    columns = columnar.read_columns(path)["columns"]
+    assert columns["extra"]["kind"] == "json"
+    assert columns["coordinates"]["kind"] == "json"
+    assert columnar.read_activities(path) == activities
+
+
+def test_sub_second_and_irregular_times(tmp_path):
+    activities = [activity(0, start_time="2024-03-01T08:30:00.250000"),
+                  activity(1, start_time="2024-03-01T08:30:00")]
+    path = str(tmp_path / "activities.bin")
+    columnar.write_activities(path, activities)
+    column = columnar.read_columns(path)["columns"]["start_time"]
+    assert (column["kind"], column["unit"]) == ("time", "us")
+    assert columnar.read_activities(path) == activities
+
+    # 不是 isoformat() 原样输出的字符串按字符串保存
+    odd = [activity(0, start_time="2024-03-01 08:30"), activity(1)]
+    assert round_trip(tmp_path, odd) == odd
+
+
+def test_empty_table(tmp_path):
+    path = str(tmp_path / "activities.bin")
+    columnar.write_activities(path, [])
+    assert columnar.read_columns(path) == {"rows": 0, "columns": {}}
+    assert columnar.read_activities(path) == []
+
+
+def test_columns_are_aligned(tmp_path):
+    path = str(tmp_path / "activities.bin")
+    columnar.write_activities(path, [activity(i, note="x" * i) for i in range(7)])
+    data_path = columnar.data_file(path)
+    with open(data_path, "rb") as f:
+        f.seek(len(columnar.MAGIC))
+        header_length = int.from_bytes(f.read(8), "little")
+    base = len(columnar.MAGIC) + 8 + header_length
+    assert base % columnar.ALIGNMENT == 0
+    for column in columnar.read_columns(path)["columns"].values():
+        assert column["offset"] % columnar.ALIGNMENT == 0
+
+
+def test_save_keeps_old_mapping_readable(tmp_path):
+    path = str(tmp_path / "activities.bin")
+    columnar.write_activities(path, [activity(i) for i in range(3)])
+    old = columnar.read_columns(path)
+
+    columnar.write_activities(path, [activity(i, demand="工作") for i in range(4)])
+    assert columnar.materialize(old) == [activity(i) for i in range(3)]
+    assert len(columnar.read_activities(path)) == 4
+
+    # 指针之外只留下当前版本
+    versions = [name for name in os.listdir(tmp_path) if name != "activities.bin"]
+    assert versions == [os.path.basename(columnar.data_file(path))]
+
+
+def test_reads_data_file_without_pointer(tmp_path):
+    # 版本文件本身也是完整的列式文件，可以直接读取
+    path = str(tmp_path / "activities.bin")
+    columnar.write_activities(path, [activity(0)])
+    os.replace(columnar.data_file(path), path)
+    assert columnar.data_file(path) == path
+    assert columnar.read_activities(path) == [activity(0)]
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "activities.bin"
+    path.write_bytes(b"[]")
+    with pytest.raises(ValueError):
+        columnar.read_columns(str(path))
+
+
+def test_json_vocab_parsed_once_without_shared_values(tmp_path):
+    activities = [activity(i, extra=[i % 2]) for i in range(4)] + [activity(4, extra=1), activity(5, extra="a")]
+    path = str(tmp_path / "activities.bin")
+    columnar.write_activities(path, activities)
+    table = columnar.read_columns(path)
+    column = table["columns"]["extra"]
+    assert columnar.decode_column(column, np.array([5, 0])) == ["a", [0]]
+    assert column["parsed"] == [[0], [1], 1, "a"]
+
+    # 同一个列表值在每条活动中是独立的对象，缓存也不写入新的头部
+    first, third = columnar.materialize(table, np.array([0, 2]))
+    first["extra"].append(9)
+    assert third["extra"] == [0] and column["parsed"][0] == [0]
+    header, _ = columnar.patch_column(column, np.arange(6), [], [])
+    assert "parsed" not in header
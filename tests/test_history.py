@@ -0,0 +1,97 @@
+# tests/test_history.py
+"""按需物化的活动历史：共享映射、按行解码、编辑后按列重新编码保存"""
+import numpy as np
+
+from core import columnar
+from core.history import open_history, save_history
+
+
+def activity(i, **fields):
+    record = {
+        "id": i,
+        "demand": "学习",
+        "description": f"第{i}条",
+        "start_time": f"2024-03-0{i % 9 + 1}T08:30:00",
+        "end_time": f"2024-03-0{i % 9 + 1}T09:15:00",
+        "start_ts": 1709253000 + i * 3600,
+        "coordinates": {"lat": 31.2 + i / 100, "lng": 121.4},
+    }
+    record.update(fields)
+    return record
+
+
+def test_empty_history(tmp_path):
+    path = str(tmp_path / "activities.bin")
+    columnar.write_activities(path, [])
+    history = open_history(path)
+    assert len(history) == 0 and list(history) == []
+
+
+def test_patch_column_reuses_and_compacts_vocab(tmp_path):
+    path = str(tmp_path / "activities.bin")
+    columnar.write_activities(path, [activity(i, demand=name) for i, name in enumerate(["学习", "工作", "学习"])])
+    column = columnar.read_columns(path)["columns"]["demand"]
+    header, data = columnar.patch_column(column, np.arange(3), [1], ["休息"])
+    assert header["vocab"] == ["学习", "休息"]
+    assert data.tolist() == [0, 1, 0]
+
+    header, data = columnar.patch_column(column, np.arange(3), [0, 2], [columnar.ABSENT, "工作"])
+    assert header["vocab"] == ["工作"]
+    assert data.tolist() == [-1, 0, 0]
+
+    # 取值不符合列类型时由调用方整列重新编码
+    assert columnar.patch_column(column, np.arange(3), [1], [5]) is None
+    start_ts = columnar.read_columns(path)["columns"]["start_ts"]
+    assert columnar.patch_column(start_ts, np.arange(3), [0], ["9"]) is None
+
+
+def test_history_save_after_edits(tmp_path):
+    path = str(tmp_path / "activities.bin")
+    activities = [activity(i) for i in range(6)]
+    columnar.write_activities(path, activities)
+
+    history = open_history(path)
+    history[1]["demand"] = "工作"                      # 原有列的新词
+    history[2]["start_ts"] = "未知"                    # 整数列改变类型
+    history[3]["start_time"] = "2024-03-04T08:30:00.5"  # 秒级时间列出现小数秒
+    del history[4]["description"]                       # 字段变为缺失
+    history[0]["segment"] = "阅读"                      # 文件中没有的新列
+    del history[5]
+    history.append(activity(9, coordinates=None))
+    expected = list(history)
+    save_history(path, history)
+
+    assert columnar.read_activities(path) == expected
+    reopened = open_history(path)
+    assert list(reopened) == expected
+    assert reopened.field_values("segment") == ["阅读"] + [None] * 5
+    assert reopened.field_values("start_ts")[2] == "未知"
+
+
+def test_rows_are_decoded_on_access_and_columns_read_whole(tmp_path):
+    path = str(tmp_path / "activities.bin")
+    activities = [activity(i) for i in range(8)]
+    columnar.write_activities(path, activities)
+    history = open_history(path)
+    assert open_history(path)._table is history._table  # 同一版本在进程内只映射一次
+
+    assert history.number_column("start_ts").tolist() == [a["start_ts"] for a in activities]
+    assert history.field_values("demand") == ["学习"] * 8
+    assert not history._loaded
+    assert history[3] == activities[3] and history[-1] == activities[7]
+    assert sorted(history._loaded) == [3, 7]
+    assert list(history.window(2, 5)) == activities[2:5]
+
+
+def test_reversed_decodes_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr("core.history.ITER_CHUNK", 4)
+    path = str(tmp_path / "activities.bin")
+    activities = [activity(i) for i in range(10)]
+    columnar.write_activities(path, activities)
+    history = open_history(path)
+
+    newest = reversed(history)
+    assert [next(newest)["id"] for _ in range(3)] == [9, 8, 7]
+    assert sorted(history._loaded) == [6, 7, 8, 9]
+    assert list(reversed(history.window(2, 7))) == activities[6:1:-1]
+    assert list(reversed(history)) == activities[::-1]
@@ -0,0 +1,76 @@
+# tests/test_intervals.py
+"""区间拆分：跨午夜、跨多天和夏令时切换日的活动按本地时间分摊"""
+import datetime
+
+import numpy as np
+
+from core import indexes, store
+from core.intervals import (covered_dates, daily_minutes_by, hour_of_day_minutes, minutes_on_dates,
+                            split_by_day, split_intervals)
+from core.queries import activities_overlapping
+from helpers import SLEEP, make_activity
+
+NIGHT = make_activity(1, datetime.datetime(2024, 3, 4, 23), 480, SLEEP)  # 23:00–次日07:00
+
+
+def test_split_across_midnight():
+    rows, days, minutes = split_by_day([NIGHT])
+    assert rows.tolist() == [0, 0]
+    assert days.astype(str).tolist() == ["2024-03-04", "2024-03-05"]
+    assert minutes.tolist() == [60, 420]
+    hours = hour_of_day_minutes([NIGHT])
+    assert hours[23] == 60 and hours[:7].tolist() == [60] * 7 and hours.sum() == 480
+
+
+def test_split_spanning_several_bins_and_zero_length():
+    starts = np.array([90, 100, 30])
+    ends = np.array([400, 100, 60])
+    rows, bins, minutes = split_intervals(starts, ends, 120)
+    assert rows.tolist() == [0, 0, 0, 0, 1, 2]
+    assert bins.tolist() == [0, 1, 2, 3, 0, 0]
+    assert minutes.tolist() == [30, 120, 120, 40, 0, 30]
+
+
+def test_dst_day_is_counted_by_wall_clock():
+    # 纽约 2024-03-10 02:00 拨快一小时：01:00–04:00 实际只过了2小时，按墙上时间计3小时
+    activity = make_activity(1, datetime.datetime(2024, 3, 9, 22), 360, SLEEP, tz="America/New_York")
+    assert activity["end_ts"] - activity["start_ts"] == 5 * 3600
+    _, days, minutes = split_by_day([activity])
+    assert dict(zip(days.astype(str).tolist(), minutes.tolist())) == {"2024-03-09": 120, "2024-03-10": 240}
+
+
+def test_minutes_on_dates_and_daily_labels():
+    morning = make_activity(2, datetime.datetime(2024, 3, 5, 8), 60, ("个人", "个人生理", "进食", "用餐"))
+    activities = [NIGHT, morning]
+    assert minutes_on_dates(activities, datetime.date(2024, 3, 5), datetime.date(2024, 3, 5)).tolist() == [420, 60]
+    dates, labels, totals = daily_minutes_by(activities, [a["activity"] for a in activities])
+    assert list(zip(dates.astype(str).tolist(), labels, totals.tolist())) == [
+        ("2024-03-04", "睡觉休息", 60), ("2024-03-05", "睡觉休息", 420), ("2024-03-05", "进食", 60)]
+    assert covered_dates(activities) == [datetime.date(2024, 3, 4), datetime.date(2024, 3, 5)]
+
+
+def test_overlapping_includes_activity_from_previous_night(history):
+    activities = history + [dict(NIGHT, id=999)]
+    activities.sort(key=lambda a: a["start_ts"])
+    overlapping = activities_overlapping(activities, datetime.date(2024, 3, 5), datetime.date(2024, 3, 5), 480)
+    assert overlapping[0]["id"] == 999
+    assert all(a["start_time"] >= "2024-03-05" for a in overlapping[1:])
+
+
+def test_rollups_split_minutes_and_match_rebuild_after_add_and_remove(state):
+    rollups = indexes.get_rollups(state)
+    late = make_activity(0, datetime.datetime(2024, 3, 31, 23), 480, SLEEP)
+    store.add_activities(state, [late])
+    day = rollups["day"]["buckets"]["2024-04-01"]
+    assert (day["count"], day["minutes"], len(day["places"])) == (0, 420, 0)
+    assert rollups["month"]["buckets"]["2024-04"]["minutes"] == 420
+
+    store.remove_activity(state, late["id"])
+    assert "2024-04-01" not in rollups["day"]["buckets"]
+    assert rollups["month"]["keys"] == ["2024-03"]
+    incremental = {level: {key: (b["count"], b["minutes"], dict(b["demand"])) for key, b in table["buckets"].items()}
+                   for level, table in rollups.items()}
+    indexes.invalidate_activity_indexes(state)
+    rebuilt = {level: {key: (b["count"], b["minutes"], dict(b["demand"])) for key, b in table["buckets"].items()}
+               for level, table in indexes.get_rollups(state).items()}
+    assert incremental == rebuilt
@@ -0,0 +1,57 @@
+# tests/test_places.py
+"""地点聚类、锚点识别和地点索引的增量维护"""
+import datetime
+
+import pytest
+
+from core.places import (activity_place_key, add_to_place_index, build_place_index, count_canonical_places,
+                         place_anchors, place_display_name)
+from helpers import SLEEP, make_activity
+
+
+def place_summary(index):
+    """按显示名称排列的各地点统计，用于比较两个索引"""
+    return {place_display_name(index, place["id"]): (place["count"], place["minutes"], place["night_minutes"],
+                                                        place["work_minutes"], dict(place["names"]))
+            for place in index["places"]}
+
+
+def test_jittered_coordinates_collapse_to_places(history):
+    index = build_place_index(history)
+    assert sorted(place_summary(index)) == ["健身房", "公司", "家"]
+    # 没有坐标的地铁站按名称计为一个地点
+    assert count_canonical_places(index) == 4
+
+
+def test_distant_coordinates_stay_separate():
+    start = datetime.datetime(2024, 3, 4, 22)
+    near = make_activity(1, start, 60, SLEEP, jitter=0.0005)   # 约60米
+    far = make_activity(2, start, 60, SLEEP, jitter=0.01)      # 约1.4公里
+    index = build_place_index([make_activity(0, start, 60, SLEEP), near, far])
+    assert len(index["places"]) == 2
+    assert activity_place_key(index, near) == activity_place_key(index, make_activity(3, start, 60, SLEEP))
+
+
+def test_anchors_are_home_and_work(history):
+    index = build_place_index(history)
+    anchors = place_anchors(index)
+    assert place_display_name(index, anchors["home"]) == "家"
+    assert place_display_name(index, anchors["work"]) == "公司"
+
+
+def test_activities_without_coordinates_resolve_by_name(history):
+    index = build_place_index(history)
+    office = make_activity(0, datetime.datetime(2024, 4, 1, 9), 60, SLEEP, "公司", coordinates=None)
+    assert place_display_name(index, activity_place_key(index, office)) == "公司"
+    subway = make_activity(0, datetime.datetime(2024, 4, 1, 9), 60, SLEEP, "地铁")
+    assert activity_place_key(index, subway) == "地铁"
+
+
+def test_incremental_add_matches_rebuild(history):
+    index = build_place_index(history[:-12])
+    for activity in history[-12:]:
+        add_to_place_index(index, activity)
+    fresh = build_place_index(history)
+    assert place_summary(index) == place_summary(fresh)
+    for place, rebuilt in zip(index["places"], fresh["places"]):
+        assert (place["lat"], place["lng"]) == pytest.approx((rebuilt["lat"], rebuilt["lng"]), abs=1e-4)
@@ -0,0 +1,18 @@
+# tests/test_queries.py
+"""按日期范围和条件筛选活动"""
+import datetime
+
+from core.queries import activities_between, activity_dates
+
+
+def test_activities_between_matches_scan(history):
+    start, end = datetime.date(2024, 3, 9), datetime.date(2024, 3, 12)
+    expected = [a for a in history if "2024-03-09" <= a["start_time"][:10] <= "2024-03-12"]
+    assert activities_between(history, start, end) == expected
+    assert activities_between(history, datetime.date(2024, 5, 1), datetime.date(2024, 5, 2)) == []
+
+
+def test_activity_dates(history):
+    dates = activity_dates(history)
+    assert len(dates) == 28
+    assert dates[0] == datetime.date(2024, 3, 4) and dates[-1] == datetime.date(2024, 3, 31)
@@ -0,0 +1,111 @@
+# tests/test_recommenders.py
+"""推荐计数表：增量计入与整体重建一致"""
+import datetime
+
+from core import indexes, store
+from core.places import activity_place_key, build_place_index
+from core.recommenders import (build_next_activity_model, evaluate_next_activity_model, new_next_activity_model,
+                               predict_next_activities, recommend_by_location, recommend_by_time,
+                               train_next_activity_model)
+from helpers import make_activity
+
+
+def snapshot(tables):
+    """计数表转换为普通字典，便于比较"""
+    return {key: {k: dict(v) if isinstance(v, dict) else v for k, v in value.items()}
+            if isinstance(value, dict) else value for key, value in tables.items()}
+
+
+def test_added_activities_match_rebuild(state, history):
+    state["activities"] = history[:-10]
+    indexes.get_recommendation_tables(state)
+    for activity in history[-10:]:
+        state["activities"].append(activity)
+        indexes.on_activity_added(state, activity)
+    incremental = snapshot(state["recommendation_tables"])
+
+    indexes.invalidate_activity_indexes(state)
+    assert incremental == snapshot(indexes.get_recommendation_tables(state))
+
+
+def test_backdated_activity_drops_tables(state):
+    indexes.get_recommendation_tables(state)
+    backdated = make_activity(999, datetime.datetime(2024, 3, 5, 12), 30, ("个人", "个人生理", "进食", "用餐"))
+    state["activities"].append(backdated)
+    indexes.on_activity_added(state, backdated)
+    assert "recommendation_tables" not in state
+
+
+def test_recommend_by_time_follows_routine(state):
+    def recommend(ignored):  # 周一上午
+        return recommend_by_time(indexes.get_recommendation_tables(state), indexes.get_location_index(state),
+                                 indexes.get_place_index(state), 9, 0, ignored)
+
+    recommendations = recommend([])
+    assert recommendations[0]["data"]["activity"] == "日常工作"
+    assert recommendations[0]["data"]["location_name"] == "公司"
+    ignored = [recommendations[0]["name"]]
+    assert all(r["name"] not in ignored for r in recommend(ignored))
+
+
+def trained_model(activities, places):
+    model = new_next_activity_model()
+    for activity, place in zip(activities, places):
+        train_next_activity_model(model, activity, place)
+    return model
+
+
+def test_next_activity_model_build_matches_training(history):
+    index = build_place_index(history)
+    places = [activity_place_key(index, a) for a in history]
+    built = build_next_activity_model(history, places)
+    assert snapshot(built) == snapshot(trained_model(history, places))
+
+
+def test_next_activity_prediction_and_evaluation(history):
+    index = build_place_index(history)
+    places = [activity_place_key(index, a) for a in history]
+    model = build_next_activity_model(history, places)
+    predictions = predict_next_activities(model, 3, "夜间休息")
+    # 周日读书、睡觉之后是周一零点的睡眠
+    assert predictions[0][0] == ("个人", "个人生理", "睡觉休息", "睡觉")
+    assert sum(p for _, p in predictions) <= 1 + 1e-9
+
+    result = evaluate_next_activity_model(history, places, holdout_days=7)
+    assert result["train_size"] + result["test_size"] == len(history)
+    assert result["hit@3"] >= result["baseline_hit@3"]
+
+
+def test_recent_places_ordered_by_utc_start(state, history):
+    # 檀香山晚上的健身比上海当晚22点的睡觉晚开始，尽管本地时间字符串更小
+    last_day = datetime.datetime.fromisoformat(history[-1]["start_time"]).date()
+    workout = make_activity(999, datetime.datetime.combine(last_day, datetime.time(20)), 60,
+                            ("个人", "个人休闲", "运动锻炼", "健身"), "健身房", tz="Pacific/Honolulu")
+    assert workout["start_time"] < history[-1]["start_time"] and workout["start_ts"] > history[-1]["start_ts"]
+
+    def recent_places():
+        recommendations = recommend_by_location(indexes.get_recommendation_tables(state),
+                                                indexes.get_place_index(state), [])
+        return [r["data"]["location_name"] for r in recommendations]
+
+    indexes.get_recommendation_tables(state)
+    state["activities"].append(workout)
+    indexes.on_activity_added(state, workout)
+    assert recent_places()[0] == "健身房"
+    indexes.invalidate_activity_indexes(state)
+    assert recent_places()[0] == "健身房"
+
+
+def test_removed_activities_match_usage_rebuild(state, history):
+    reading = make_activity(999, datetime.datetime(2024, 3, 30, 9), 30, ("学习", "课程", "上课", "听讲"))
+    history.append(reading)
+    indexes.get_usage_index(state)
+    # 唯一一次使用、某路径最近一次使用（同一周还有其他使用）和中间的一次使用
+    last_workout = next(a for a in reversed(history) if a["behavior"] == "健身")
+    for activity in (reading, last_workout, history[10]):
+        store.remove_activity(state, activity["id"])
+    assert "usage_index" in state
+    incremental = snapshot(state["usage_index"])
+
+    indexes.invalidate_activity_indexes(state)
+    assert incremental == snapshot(indexes.get_usage_index(state))
@@ -0,0 +1,67 @@
+# tests/test_rollups.py
+"""日/周/月汇总表：新增和删除按差量更新后与整体重建一致"""
+import datetime
+
+from core import indexes, store
+from core.places import place_display_name
+from core.rollups import query_rollups, rollup_frame
+from helpers import SLEEP, make_activity
+
+
+def snapshot(state):
+    """各粒度的桶转换为普通字典，规范地点换成显示名称，便于与重建后的编号无关地比较"""
+    place_index = indexes.get_place_index(state)
+    tables = {}
+    for level, table in indexes.get_rollups(state).items():
+        assert table["keys"] == sorted(table["buckets"])
+        tables[level] = {key: dict({name: dict(value) if isinstance(value, dict) else value
+                                    for name, value in bucket.items()},
+                                   places={place_display_name(place_index, place): count
+                                           for place, count in bucket["places"].items()})
+                         for key, bucket in table["buckets"].items()}
+    return tables
+
+
+def rebuilt(state):
+    indexes.invalidate_activity_indexes(state)
+    return snapshot(state)
+
+
+def test_added_activities_match_rebuild(state, history):
+    state["activities"] = history[:-20]
+    indexes.get_rollups(state)
+    # 包括一条补录到历史中间、落在新的一周的活动
+    backdated = make_activity(0, datetime.datetime(2024, 2, 28, 23), 30, SLEEP)
+    store.add_activities(state, history[-20:] + [backdated])
+    assert snapshot(state) == rebuilt(state)
+
+
+def test_removed_activities_match_rebuild(state, history):
+    indexes.get_rollups(state)
+    for activity in history[::9]:
+        store.remove_activity(state, activity["id"])
+    assert "rollups" in state
+    incremental = snapshot(state)
+    assert incremental == rebuilt(state)
+
+
+def test_removing_last_activity_drops_period(state):
+    lone = make_activity(0, datetime.datetime(2024, 5, 6, 8), 30, SLEEP)
+    store.add_activities(state, [lone])
+    rollups = indexes.get_rollups(state)
+    assert "2024-05" in rollups["month"]["buckets"]
+    store.remove_activity(state, lone["id"])
+    assert "2024-05" not in rollups["month"]["buckets"]
+    assert "2024-W19" not in rollups["week"]["keys"]
+
+
+def test_range_queries(state):
+    rollups = indexes.get_rollups(state)
+    weeks = query_rollups(rollups, "week", datetime.date(2024, 3, 6), datetime.date(2024, 3, 12))
+    assert [key for key, _ in weeks] == ["2024-W10", "2024-W11"]
+    assert weeks[0][1]["count"] == 5 * 8 + 2 * 4
+    assert weeks[0][1]["places"] and len(weeks[0][1]["places"]) == 4
+
+    frame = rollup_frame(rollups, "day", datetime.date(2024, 3, 9), datetime.date(2024, 3, 9), "demand")
+    assert frame["活动数"].tolist() == [4]
+    assert frame["时长(小时)"].tolist() == [16.0]
@@ -0,0 +1,52 @@
+# tests/test_routines.py
+"""常规日程：增量计入与整体重建一致，按星期几挖掘模式并生成草稿"""
+import datetime
+
+from core import indexes
+from core.routines import draft_routine_day, mine_routines
+
+
+def snapshot(index):
+    """常规日程索引转换为普通字典，便于比较"""
+    patterns = {key: dict(stats, categories=dict(stats["categories"]), names=dict(stats["names"]))
+                for key, stats in index["patterns"].items()}
+    return dict(index, weekday_days=dict(index["weekday_days"]),
+                window_counts=dict(index["window_counts"]), patterns=patterns)
+
+
+def test_added_activities_match_rebuild(state, history):
+    state["activities"] = history[:-10]
+    indexes.get_routine_index(state)
+    for activity in history[-10:]:
+        state["activities"].append(activity)
+        indexes.on_activity_added(state, activity)
+    incremental = snapshot(state["routine_index"])
+
+    indexes.invalidate_activity_indexes(state)
+    assert incremental == snapshot(indexes.get_routine_index(state))
+
+
+def test_weekday_routines(state):
+    routines = mine_routines(indexes.get_routine_index(state), weekday=0)
+    meeting = next(r for r in routines if r["path"][3] == "会议")
+    assert (meeting["hour"], meeting["start_minute"], meeting["duration"]) == (9, 540, 180)
+    assert meeting["location_name"] == "公司"
+    assert meeting["support"] == 1.0
+    # 周末日程不会出现在周一的模式里
+    assert all(r["path"][3] != "打扫" for r in routines)
+
+
+def draft(state, date):
+    return draft_routine_day(indexes.get_routine_index(state), indexes.get_place_index(state),
+                             indexes.get_interval_index(state), date)
+
+
+def test_draft_routine_day(state):
+    drafts = draft(state, datetime.date(2024, 4, 1))  # 历史之后的周一
+    starts = [d["start_time"] for d in drafts]
+    assert starts == sorted(starts)
+    meeting = next(d for d in drafts if d["behavior"] == "会议")
+    assert meeting["start_time"] == "2024-04-01T09:00:00"
+    assert meeting["location_name"] == "公司"
+    # 已有记录的日子不会生成冲突草稿
+    assert draft(state, datetime.date(2024, 3, 4)) == []
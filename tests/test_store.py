@@ -0,0 +1,45 @@
+# tests/test_store.py
+"""数据目录的读写、旧数据迁移和按编号删除"""
+import json
+
+from core import indexes, store
+from core.history import ActivityHistory
+from helpers import make_history
+
+
+def legacy_dir(tmp_path, activities):
+    """只有旧版 activities.json 的数据目录"""
+    with open(tmp_path / "activities.json", "w", encoding="utf-8") as f:
+        json.dump(activities, f, ensure_ascii=False)
+    return str(tmp_path)
+
+
+def test_load_renumbers_duplicate_ids(tmp_path):
+    history = make_history(days=2)
+    history[5]["id"] = history[9]["id"] = history[3]["id"]
+    for activity in history:
+        del activity["start_ts"], activity["end_ts"], activity["tz"]
+    state = store.load_store(legacy_dir(tmp_path, history))
+    ids = [a["id"] for a in state["activities"]]
+    assert len(set(ids)) == len(ids)
+    assert ids[3] == 4 and ids[5] == ids[9] - 1 == len(history) + 1
+    assert "start_ts" in state["activities"][0]
+
+    # 保存为列式文件后再读取不再有改动
+    store.save_store(state, str(tmp_path))
+    reloaded = store.load_store(str(tmp_path))
+    assert isinstance(reloaded["activities"], ActivityHistory)
+    assert store.renumber_duplicate_ids(reloaded["activities"]) == 0
+    assert [a["id"] for a in reloaded["activities"]] == ids
+
+
+def test_remove_activity_after_renumbering():
+    history = make_history(days=2)
+    history[9]["id"] = history[3]["id"]
+    state = {"activities": history}
+    store.renumber_duplicate_ids(history)
+    duplicate = history[9]
+    assert store.remove_activity(state, duplicate["id"]) is duplicate
+    assert len(history) == 15 and history[3]["id"] == 4
+    assert store.remove_activity(state, 999) is None
+    indexes.get_rollups(state)
@@ -0,0 +1,56 @@
+# tests/test_timezones.py
+"""本地时间与UTC时间戳的换算、夏令时边界和旧数据迁移"""
+import datetime
+
+from core.queries import activities_between
+from core.timezones import epoch_to_local, local_to_epoch, migrate_activities
+from helpers import SLEEP, make_activity
+
+NEW_YORK = "America/New_York"
+
+
+def utc(*args):
+    return int(datetime.datetime(*args, tzinfo=datetime.timezone.utc).timestamp())
+
+
+def test_local_to_epoch_round_trip():
+    local = datetime.datetime(2024, 3, 4, 8, 0)
+    assert local_to_epoch(local, "Asia/Shanghai") == utc(2024, 3, 4, 0, 0)
+    assert epoch_to_local(utc(2024, 3, 4, 0, 0), "Asia/Shanghai") == local
+    assert local_to_epoch(local, NEW_YORK) == utc(2024, 3, 4, 13, 0)
+
+
+def test_dst_gap_uses_offset_before_the_change():
+    # 2024-03-10 02:00 纽约拨快到 03:00，02:30 不存在，按拨快前的 UTC-5 换算
+    assert local_to_epoch(datetime.datetime(2024, 3, 10, 2, 30), NEW_YORK) == utc(2024, 3, 10, 7, 30)
+    assert (local_to_epoch(datetime.datetime(2024, 3, 10, 3, 0), NEW_YORK)
+            - local_to_epoch(datetime.datetime(2024, 3, 10, 1, 0), NEW_YORK)) == 3600
+
+
+def test_dst_fold_takes_standard_time():
+    # 2024-11-03 02:00 纽约回拨到 01:00，01:30 出现两次，取标准时间（UTC-5）那一次
+    assert local_to_epoch(datetime.datetime(2024, 11, 3, 1, 30), NEW_YORK) == utc(2024, 11, 3, 6, 30)
+    assert epoch_to_local(utc(2024, 11, 3, 5, 30), NEW_YORK) == datetime.datetime(2024, 11, 3, 1, 30)
+
+
+def test_migration_fills_timestamps_and_sorts_by_utc():
+    shanghai = make_activity(1, datetime.datetime(2024, 3, 5, 8), 60, SLEEP)
+    new_york = make_activity(2, datetime.datetime(2024, 3, 4, 22), 60, SLEEP, tz=NEW_YORK)
+    for activity in (shanghai, new_york):
+        del activity["start_ts"], activity["end_ts"]
+    del shanghai["tz"]
+    # 本地时间字符串顺序与真实先后相反：纽约 22:00 是上海次日 11:00
+    activities = [new_york, shanghai]
+    assert migrate_activities(activities) == 2
+    assert activities == [shanghai, new_york]
+    assert shanghai["tz"] == "Asia/Shanghai"
+    assert new_york["start_ts"] - shanghai["start_ts"] == 3 * 3600
+    assert migrate_activities(activities) == 0
+
+
+def test_date_range_uses_local_dates_across_zones():
+    shanghai = make_activity(1, datetime.datetime(2024, 3, 5, 8), 60, SLEEP)
+    new_york = make_activity(2, datetime.datetime(2024, 3, 4, 22), 60, SLEEP, tz=NEW_YORK)
+    activities = [shanghai, new_york]
+    assert activities_between(activities, datetime.date(2024, 3, 4), datetime.date(2024, 3, 4)) == [new_york]
+    assert activities_between(activities, datetime.date(2024, 3, 5), datetime.date(2024, 3, 5)) == [shanghai]
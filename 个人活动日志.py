@@ -4,18 +4,37 @@ import pandas as pd
 import json
 import datetime
 from datetime import timedelta
-import pytz
-import folium
-from streamlit_folium import st_folium
-import plotly.express as px
-import plotly.graph_objects as go
 import os
 import time
-import requests
-from geopy.geocoders import Nominatim
-import math
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
 from collections import Counter, defaultdict
 import numpy as np
+import pytz
+from core import geocoding, indexes, store
+from core.aggregations import (DAY_MATRIX_LEVELS, cluster_day_types, compute_mobility_metrics,
+                               compute_overview_stats, day_similarity, recorded_day_mask,
+                               typical_day_profile, weekday_weekend_budget)
+from core.anomalies import ANOMALY_MIN_DAYS, rank_anomalies
+from core.places import (activity_place_key, activity_places, count_canonical_places, place_anchors,
+                         place_display_name)
+from core.classification import (CLASSIFICATION_LEVEL_NAMES, add_node, child_names, classification_path,
+                                 count_activities, delete_node, resolve_path, restore_orphans)
+from core.hierarchy import hierarchy_frame
+from core.history import coordinate_columns, field_values, window
+from core.intervals import covered_dates, minutes_on_dates
+from core.queries import (activities_overlapping, covered_minutes, filter_activities, find_gaps,
+                          find_overlaps)
+from core.recommenders import (USAGE_TREND_WEEKS, evaluate_next_activity_model, get_template_usage_stats,
+                               rank_locations, recommend_by_location, recommend_by_pattern,
+                               recommend_by_time, template_path)
+from core.rollups import rollup_frame
+from core.routines import draft_routine_day
+from core.timezones import (DEFAULT_TIMEZONE, epoch_to_local, local_to_epoch, migrate_activities,
+                            set_activity_times)
+# 地图、绘图、地理编码和轨迹解析依赖较重，只在用到它们的页面函数内导入
 
 # 页面配置
 st.set_page_config(
@@ -27,102 +46,129 @@ st.set_page_config(
 
 # 数据存储路径
 DATA_DIR = "data"
-ACTIVITIES_FILE = os.path.join(DATA_DIR, "activities.json")
-CLASSIFICATION_FILE = os.path.join(DATA_DIR, "classification_system.json")
-LOCATION_CATEGORIES_FILE = os.path.join(DATA_DIR, "location_categories.json")
-TEMPLATES_FILE = os.path.join(DATA_DIR, "activity_templates.json")
+DATA_FILES = {key: os.path.join(DATA_DIR, name) for key, name in store.STORE_FILES.items()}
 
 # 确保数据目录存在
 os.makedirs(DATA_DIR, exist_ok=True)
 
-def load_json_file(file_path, default_data):
-    """从JSON文件加载数据，如果文件不存在则返回默认数据"""
+# 汇总表粒度
+ROLLUP_LEVEL_NAMES = {"日": "day", "周": "week", "月": "month"}
+
+# 性能分析：可选的分段计时与内存分配统计，在侧边栏开启或设置环境变量 ACTIVITY_LOG_PROFILE=1
+PROFILE_TRACE_FILE = os.path.join(DATA_DIR, "profile_traces.jsonl")
+
+def profiling_enabled():
+    return st.session_state.get("profiling", os.environ.get("ACTIVITY_LOG_PROFILE") == "1")
+
+@st.cache_resource
+def tracemalloc_sessions():
+    """进程内开启了内存统计的会话数；tracemalloc 是进程级的，最后一个会话关闭分析时才停止"""
+    return {"lock": threading.Lock(), "count": 0}
+
+def hold_tracemalloc(hold):
+    """本会话开始（hold=True）或结束对 tracemalloc 的使用，每个会话最多计数一次"""
+    if st.session_state.get("profile_tracing", False) == hold:
+        return
+    sessions = tracemalloc_sessions()
+    with sessions["lock"]:
+        sessions["count"] += 1 if hold else -1
+        if hold and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not hold and sessions["count"] == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+    st.session_state.profile_tracing = hold
+
+@contextmanager
+def profile_section(name):
+    """记录一段代码的耗时、内存净增和分配块数，未开启分析时没有额外开销"""
+    if not profiling_enabled():
+        yield
+        return
+    hold_tracemalloc(True)
+    records = st.session_state.setdefault("profile_records", [])
+    record = {"section": name, "depth": st.session_state.get("profile_depth", 0)}
+    records.append(record)
+    st.session_state.profile_depth = record["depth"] + 1
+    memory_before = tracemalloc.get_traced_memory()[0]
+    blocks_before = sys.getallocatedblocks()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record["ms"] = round((time.perf_counter() - start) * 1000, 2)
+        record["alloc_kb"] = round((tracemalloc.get_traced_memory()[0] - memory_before) / 1024, 1)
+        record["blocks"] = sys.getallocatedblocks() - blocks_before
+        st.session_state.profile_depth = record["depth"]
+
+def build_chart(builder, *args, **kwargs):
+    """调用plotly.express的绘图函数并计入分析"""
+    with profile_section(f"图表构建 {builder.__name__}: {kwargs.get('title', '')}"):
+        return builder(*args, **kwargs)
+
+def show_plotly(fig):
+    """渲染plotly图表并计入分析"""
+    with profile_section(f"plotly_chart: {fig.layout.title.text or ''}"):
+        st.plotly_chart(fig, use_container_width=True)
+
+def start_profile_run():
+    """每次重新运行开始时清空上一轮的分析记录"""
+    st.session_state.profile_records = []
+    st.session_state.profile_depth = 0
+    if not profiling_enabled():
+        hold_tracemalloc(False)
+
+def show_profile_report(page):
+    """在侧边栏显示本轮各段耗时，按需追加写入JSONL追踪文件"""
+    records = st.session_state.get("profile_records", [])
+    with st.sidebar:
+        st.markdown("---")
+        st.checkbox("⏱️ 性能分析", value=profiling_enabled(), key="profiling")
+        if not records:
+            return
+        dump = st.checkbox("记录到追踪文件", key="profile_dump")
+        total = sum(r["ms"] for r in records if r["depth"] == 0)
+        with st.expander(f"本轮耗时 {total:.0f} ms"):
+            st.dataframe(pd.DataFrame([{
+                "分段": "　" * r["depth"] + r["section"],
+                "耗时(ms)": r["ms"],
+                "内存净增(KB)": r["alloc_kb"],
+                "分配块": r["blocks"],
+            } for r in records]), use_container_width=True, hide_index=True)
+    if dump:
+        with open(PROFILE_TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"time": datetime.datetime.now().isoformat(), "page": page,
+                                "sections": records}, ensure_ascii=False) + "\n")
+
+def load_data_file(key):
+    """从数据文件加载一项数据，如果文件不存在则返回默认数据"""
     try:
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+        return store.load_data_file(DATA_FILES[key], key)
     except Exception as e:
-        st.error(f"加载文件 {file_path} 时出错: {e}")
-    return default_data
+        st.error(f"加载文件 {DATA_FILES[key]} 时出错: {e}")
+    return store.default_data(key)
 
-def save_json_file(file_path, data):
-    """保存数据到JSON文件"""
+def save_data_file(key):
+    """保存一项数据到数据文件"""
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        store.save_data_file(DATA_FILES[key], key, st.session_state[key])
         return True
     except Exception as e:
-        st.error(f"保存文件 {file_path} 时出错: {e}")
+        st.error(f"保存文件 {DATA_FILES[key]} 时出错: {e}")
         return False
 
 # 初始化数据
 def initialize_data():
-    """初始化所有数据"""
-    # 活动数据
-    if 'activities' not in st.session_state:
-        st.session_state.activities = load_json_file(ACTIVITIES_FILE, [])
-    
-    # 地点分类
-    default_location_categories = {
-        "居住场所": ['家', '宿舍', '酒店', '民宿', '亲友家'],
-        "工作场所": ['办公室', '工厂', '店铺', '工地', '实验室'],
-        "商业场所": ['超市', '商场', '餐厅', '银行', '理发店'],
-        "教育场所": ['学校', '图书馆', '培训机构', '幼儿园', '大学'],
-        "医疗场所": ['医院', '诊所', '药店', '体检中心', '康复中心'],
-        "娱乐场所": ['电影院', 'KTV', '健身房', '游乐园', '咖啡厅'],
-        "交通场所": ['地铁站', '公交站', '火车站', '机场', '停车场'],
-        "公共场所": ['公园', '广场', '政府机关', '社区中心', '邮局'],
-        "自然场所": ['山地', '海边', '森林', '湖泊', '河流'],
-        "其他场所": ['未分类', '临时场所', '特殊场所']
-    }
-    
-    if 'location_categories' not in st.session_state:
-        st.session_state.location_categories = load_json_file(
-            LOCATION_CATEGORIES_FILE, default_location_categories
-        )
-    
-    # 分类系统
-    default_classification_system = {
-        "个人": {
-            "个人生理": {
-                "睡觉休息": {"睡觉": ["夜间睡眠", "午睡", "小憩"], "休息": ["放松", "冥想", "发呆"]},
-                "进食": {"用餐": ["早餐", "午餐", "晚餐", "零食"], "饮水": ["喝水", "饮茶", "饮料"]},
-                "个人健康维护": {"洗漱": ["刷牙", "洗脸", "洗澡"], "健康检查": ["体检", "看医生"], "调理身体": ["按摩", "理疗", "泡脚"]}
-            },
-            "个人休闲": {
-                "娱乐消遣": {"看电视": ["电视剧", "电影", "综艺"], "游戏": ["手机游戏", "电脑游戏", "主机游戏"]},
-                "阅读学习": {"阅读": ["看书", "看新闻", "看杂志"], "学习": ["在线课程", "技能提升", "语言学习"]},
-                "运动锻炼": {"做操": ["太极", "八段锦", "广播体操"], "健身": ["跑步", "游泳", "器械训练"]}
-            }
-        },
-        "家庭": {
-            "家庭空间维护": {
-                "清洁打扫": {"打扫": ["扫地", "拖地", "整理"], "洗涤": ["洗衣", "晾衣", "熨烫"]}
-            },
-            "照顾家人": {
-                "照顾孩子": {"接送": ["上学接送", "活动接送"], "陪伴": ["陪玩", "作业辅导", "亲子时光"]}
-            }
-        },
-        "工作": {
-            "办公": {
-                "日常工作": {"会议": ["团队会议", "项目讨论", "客户会议"], "文档处理": ["报告编写", "邮件处理", "资料整理"]}
-            }
-        },
-        "移动": {
-            "交通出行": {
-                "通勤": {"上班通勤": ["地铁", "公交", "开车", "骑行"], "日常出行": ["步行", "打车", "骑车"]}
-            }
-        }
-    }
-    
-    if 'classification_system' not in st.session_state:
-        st.session_state.classification_system = load_json_file(
-            CLASSIFICATION_FILE, default_classification_system
-        )
-    
-    # 活动模板
-    if 'activity_templates' not in st.session_state:
-        st.session_state.activity_templates = load_json_file(TEMPLATES_FILE, {})
+    """初始化所有数据（活动、地点分类、分类系统、活动模板）"""
+    if 'timezone' not in st.session_state:
+        st.session_state.timezone = DEFAULT_TIMEZONE
+    for key in DATA_FILES:
+        if key not in st.session_state:
+            st.session_state[key] = load_data_file(key)
+            # 旧数据只有本地时间字符串，按当前时区补齐UTC时间戳；早期数据的重复编号重新编号；有改动时写回
+            if key == "activities":
+                migrated = migrate_activities(st.session_state.activities, st.session_state.timezone)
+                if store.renumber_duplicate_ids(st.session_state.activities) or migrated:
+                    save_data_file(key)
     
     # 初始化地图中心
     if 'map_center' not in st.session_state:
@@ -131,29 +177,135 @@ def initialize_data():
 # 保存数据
 def save_all_data():
     """保存所有数据到文件"""
-    save_json_file(ACTIVITIES_FILE, st.session_state.activities)
-    save_json_file(LOCATION_CATEGORIES_FILE, st.session_state.location_categories)
-    save_json_file(CLASSIFICATION_FILE, st.session_state.classification_system)
-    save_json_file(TEMPLATES_FILE, st.session_state.activity_templates)
+    for key in DATA_FILES:
+        save_data_file(key)
 
 # 地点搜索功能
 def search_location(query):
     """使用Nominatim搜索地点"""
     try:
-        geolocator = Nominatim(user_agent="personal_activity_tracker")
-        location = geolocator.geocode(query, addressdetails=True, country_codes='cn')
-        
-        if location:
-            return {
-                "name": location.address,
-                "lat": location.latitude,
-                "lng": location.longitude
-            }
+        return geocoding.search_location(query)
     except Exception as e:
         st.error(f"地点搜索失败: {e}")
-    
     return None
 
+def local_now():
+    """当前时区的现在"""
+    return datetime.datetime.now(pytz.timezone(st.session_state.timezone))
+
+def local_today():
+    """当前时区的今天"""
+    return local_now().date()
+
+# 派生索引：缓存在会话状态中，由 core.indexes 构建和增量维护
+indexes.set_build_profiler(profile_section)
+
+def get_day_matrix(slot_minutes=15, level="需求"):
+    return indexes.get_day_matrix(st.session_state, slot_minutes, level)
+
+def get_interval_index():
+    return indexes.get_interval_index(st.session_state)
+
+def get_place_index():
+    return indexes.get_place_index(st.session_state)
+
+def get_recommendation_tables():
+    return indexes.get_recommendation_tables(st.session_state)
+
+def get_next_activity_model():
+    return indexes.get_next_activity_model(st.session_state)
+
+def get_location_index():
+    return indexes.get_location_index(st.session_state)
+
+def get_routine_index():
+    return indexes.get_routine_index(st.session_state)
+
+def get_usage_index():
+    return indexes.get_usage_index(st.session_state)
+
+def get_anomaly_report():
+    return indexes.get_anomaly_report(st.session_state, local_today())
+
+def get_rollups():
+    return indexes.get_rollups(st.session_state)
+
+def get_classification_index(members=False):
+    return indexes.get_classification_index(st.session_state, members)
+
+def get_hierarchy_cube():
+    return indexes.get_hierarchy_cube(st.session_state)
+
+def invalidate_activity_indexes():
+    """活动被删除、导入或清空后丢弃派生索引"""
+    indexes.invalidate_activity_indexes(st.session_state)
+
+def add_activities(new_activities):
+    """批量写入活动：统一编号、一次排序、增量更新索引并只保存一次"""
+    store.add_activities(st.session_state, new_activities)
+    save_all_data()
+
+# GPS轨迹转活动草稿
+MOVE_CLASSIFICATION = ("移动", "交通出行", "通勤", "日常出行")
+
+def gps_segments_to_drafts(segments):
+    """把停留/移动片段转换为活动草稿
+
+    停留点并入已有的规范地点，并沿用该地点最常见的分类和地点大类；
+    移动片段使用默认的移动分类（如果分类系统中存在）。
+    """
+    place_index = get_place_index()
+    place_habits = defaultdict(Counter)
+    activities = st.session_state.activities
+    # 按列读取坐标、地点和分类，不物化历史活动
+    lats, _ = coordinate_columns(activities)
+    habits = zip(*(field_values(activities, name, "")
+                   for name in ("location_category", "demand", "project", "activity", "behavior")))
+    for place, has_coordinates, habit in zip(activity_places(place_index, activities), ~np.isnan(lats), habits):
+        if has_coordinates:
+            place_habits[place][habit] += 1
+
+    move_known = resolve_path(get_classification_index(), MOVE_CLASSIFICATION) is not None
+    now = datetime.datetime.now().isoformat()
+
+    drafts = []
+    for segment in segments:
+        duration = max(1, int((segment["end"] - segment["start"]).total_seconds() / 60))
+        draft = {
+            "start_time": segment["start"].isoformat(),
+            "end_time": segment["end"].isoformat(),
+            "tz": st.session_state.timezone,
+            "duration": duration,
+            "location_category": "",
+            "location_tag": "",
+            "location_name": "",
+            "coordinates": None,
+            "demand": "", "project": "", "activity": "", "behavior": "",
+            "description": f"GPS导入: {segment['source']}",
+            "created_at": now,
+        }
+        if segment["type"] == "stay":
+            lat, lng = round(segment["lat"], 6), round(segment["lng"], 6)
+            draft["coordinates"] = {"lat": lat, "lng": lng}
+            place = activity_place_key(place_index, {"coordinates": draft["coordinates"]})
+            if isinstance(place, int):
+                draft["location_name"] = place_display_name(place_index, place)
+                if place_habits[place]:
+                    habit = place_habits[place].most_common(1)[0][0]
+                    (draft["location_category"], draft["demand"], draft["project"],
+                     draft["activity"], draft["behavior"]) = habit
+            else:
+                draft["location_category"] = "其他场所"
+                draft["location_name"] = f"停留点 {lat:.4f},{lng:.4f}"
+        else:
+            draft["location_category"] = "交通场所"
+            draft["location_name"] = "途中"
+            draft["description"] += f"，移动约 {segment['distance_m'] / 1000:.1f} km"
+            if move_known:
+                draft["demand"], draft["project"], draft["activity"], draft["behavior"] = MOVE_CLASSIFICATION
+        drafts.append(draft)
+    return drafts
+
 # 样式配置
 def apply_custom_css():
     """应用自定义CSS样式"""
@@ -246,6 +398,8 @@ def quick_actions():
 # 智能地图组件
 def smart_map_selector():
     """智能地图选择器"""
+    import folium
+    from streamlit_folium import st_folium
     st.markdown("**🗺️ 地点选择**")
     
     # 地点搜索
@@ -289,7 +443,8 @@ def smart_map_selector():
         ).add_to(m)
     
     # 显示地图
-    map_data = st_folium(m, width=700, height=400, key="smart_map")
+    with profile_section("st_folium: 地点选择"):
+        map_data = st_folium(m, width=700, height=400, key="smart_map")
     
     # 处理地图点击
     coordinates = None
@@ -304,21 +459,60 @@ def smart_map_selector():
     
     return coordinates, searched_location, selected_common_location
 
+def select_template(name, data):
+    """选用模板：记下名称和数据，记录表单据此预填充"""
+    st.session_state.template_name = name
+    st.session_state.template_data = data
+
+def clear_template_selection():
+    for key in ('template_name', 'template_data'):
+        st.session_state.pop(key, None)
+
+def classification_selectbox(label, parent_path, default=""):
+    """级联分类下拉框：选项为 parent_path 下一级的名称，由分类索引直接给出"""
+    options = child_names(get_classification_index(), parent_path)
+    return st.selectbox(label, options=[""] + options,
+                        index=options.index(default) + 1 if default in options else 0)
+
+def routine_drafts_panel():
+    """根据挖掘出的常规日程为今天生成草稿，确认后一次性添加"""
+    today = local_today()
+    drafts = draft_routine_day(get_routine_index(), get_place_index(), get_interval_index(), today,
+                               st.session_state.timezone) if st.session_state.activities else []
+    if not drafts:
+        return
+    
+    with st.expander(f"🔁 今日常规草稿（{len(drafts)} 项）"):
+        draft_df = pd.DataFrame([{
+            "添加": True,
+            "开始": d["start_time"][11:16],
+            "结束": d["end_time"][11:16],
+            "活动": f"{d['demand']} → {d['project']} → {d['activity']} → {d['behavior']}",
+            "地点": d["location_name"],
+            "说明": d["description"],
+        } for d in drafts])
+        edited = st.data_editor(draft_df, use_container_width=True, hide_index=True,
+                                disabled=["开始", "结束", "活动", "地点", "说明"], key="routine_draft_editor")
+        if st.button("✅ 确认添加选中草稿", use_container_width=True):
+            selected = [draft for draft, keep in zip(drafts, edited["添加"]) if keep]
+            if selected:
+                add_activities(selected)
+                st.success(f"已添加 {len(selected)} 项常规活动")
+                st.rerun()
+
 # 活动记录表单
 def activity_form():
     """活动记录表单"""
     st.markdown('<div class="sub-header">📝 记录新活动</div>', unsafe_allow_html=True)
     
-    # 检查是否有模板数据要填充
+    # 检查是否有模板数据要填充（按使用时记下的模板名称直接定位）
     prefilled_data = st.session_state.get('template_data', {})
-    if prefilled_data:
-        template_name = None
-        for name, data in st.session_state.activity_templates.items():
-            if data == prefilled_data:
-                template_name = name
-                break
-        if template_name:
-            st.info(f"正在使用模板: {template_name}")
+    template_name = st.session_state.get('template_name')
+    if prefilled_data and template_name:
+        st.info(f"正在使用模板: {template_name}")
+    
+    # 常规日程草稿
+    routine_drafts_panel()
     
     # 将地图选择器移出表单
     coordinates, searched_location, common_location = smart_map_selector()
@@ -328,31 +522,33 @@ def activity_form():
         # 时间信息
         col1, col2, col3 = st.columns(3)
         with col1:
-            start_date = st.date_input("开始日期*", value=datetime.date.today())
+            start_date = st.date_input("开始日期*", value=local_today())
             start_time = st.time_input("开始时间*", value=datetime.time(9, 0))
             start_datetime = datetime.datetime.combine(start_date, start_time)
             
         with col2:
-            end_date = st.date_input("结束日期*", value=datetime.date.today())
+            end_date = st.date_input("结束日期*", value=local_today())
             end_time = st.time_input("结束时间*", value=datetime.time(10, 0))
             end_datetime = datetime.datetime.combine(end_date, end_time)
             
         with col3:
-            # 自动计算持续时间
-            if start_datetime and end_datetime:
-                duration_minutes = max(1, int((end_datetime - start_datetime).total_seconds() / 60))
-            else:
-                duration_minutes = 60
-                
-            duration = st.number_input("持续时间(分钟)*", min_value=1, max_value=1440, 
-                                     value=duration_minutes)
+            # 持续时间由起止时间决定，提交时计算，避免两者不一致
+            st.caption("持续时间按起止时间自动计算")
+            activity_tz = st.selectbox("时区", pytz.common_timezones,
+                                       index=pytz.common_timezones.index(st.session_state.timezone)
+                                       if st.session_state.timezone in pytz.common_timezones else 0)
+            allow_overlap = st.checkbox("允许与已有活动时间重叠")
         
         # 地点信息
         st.markdown("**📍 地点信息**")
         loc_col1, loc_col2, loc_col3 = st.columns(3)
         with loc_col1:
+            category_options = list(st.session_state.location_categories.keys())
+            default_category = prefilled_data.get('location_category', '')
             location_category = st.selectbox("地点大类*", 
-                                           options=[""] + list(st.session_state.location_categories.keys()))
+                                           options=[""] + category_options,
+                                           index=(category_options.index(default_category) + 1
+                                                  if default_category in category_options else 0))
         with loc_col2:
             location_tags = st.session_state.location_categories.get(location_category, [])
             location_tag = st.selectbox("地点标签", options=[""] + location_tags)
@@ -374,32 +570,19 @@ def activity_form():
         class_col1, class_col2 = st.columns(2)
         with class_col1:
             # 使用模板数据预填充
-            default_demand = prefilled_data.get('demand', '')
-            demand_type = st.selectbox("需求类型*", 
-                                     options=[""] + list(st.session_state.classification_system.keys()),
-                                     index=(list(st.session_state.classification_system.keys()).index(default_demand) + 1 
-                                           if default_demand in st.session_state.classification_system else 0))
+            demand_type = classification_selectbox("需求类型*", (), prefilled_data.get('demand', ''))
         with class_col2:
-            projects = list(st.session_state.classification_system.get(demand_type, {}).keys())
-            default_project = prefilled_data.get('project', '')
-            project_type = st.selectbox("企划类型*", options=[""] + projects,
-                                      index=(projects.index(default_project) + 1 
-                                           if default_project in projects else 0))
+            project_type = classification_selectbox("企划类型*", (demand_type,), prefilled_data.get('project', ''))
         
         class_col3, class_col4 = st.columns(2)
         with class_col3:
-            activities = list(st.session_state.classification_system.get(demand_type, {}).get(project_type, {}).keys())
-            default_activity = prefilled_data.get('activity', '')
-            activity_type = st.selectbox("活动类型*", options=[""] + activities,
-                                       index=(activities.index(default_activity) + 1 
-                                            if default_activity in activities else 0))
+            activity_type = classification_selectbox("活动类型*", (demand_type, project_type),
+                                                     prefilled_data.get('activity', ''))
         with class_col4:
-            behaviors_dict = st.session_state.classification_system.get(demand_type, {}).get(project_type, {}).get(activity_type, {})
-            behaviors = list(behaviors_dict.keys()) if behaviors_dict else []
-            default_behavior = prefilled_data.get('behavior', '')
-            behavior_type = st.selectbox("行为类型*", options=[""] + behaviors,
-                                       index=(behaviors.index(default_behavior) + 1 
-                                            if default_behavior in behaviors else 0))
+            behavior_type = classification_selectbox("行为类型*", (demand_type, project_type, activity_type),
+                                                     prefilled_data.get('behavior', ''))
+        segment_type = classification_selectbox("片段", (demand_type, project_type, activity_type, behavior_type),
+                                                prefilled_data.get('segment', ''))
         
         # 活动描述
         activity_description = st.text_area("活动描述", 
@@ -418,20 +601,31 @@ def activity_form():
     
     if submitted:
         # 验证必填字段
-        if not all([start_datetime, end_datetime, duration, location_category, location_name, 
+        if not all([start_datetime, end_datetime, location_category, location_name, 
                    demand_type, project_type, activity_type, behavior_type]):
             st.error("请填写所有必填字段（标*的字段）")
             return
         
+        # 起止时间按所选时区换算为UTC时间戳，时长按真实经过的时间计算（跨夏令时切换也正确）
+        start_ts, end_ts = local_to_epoch(start_datetime, activity_tz), local_to_epoch(end_datetime, activity_tz)
+        duration = (end_ts - start_ts) // 60
         if duration <= 0:
-            st.error("持续时间必须大于0")
+            st.error("结束时间必须晚于开始时间")
+            return
+        
+        # 时间重叠检查：只查询索引中可能相交的区间
+        overlaps = find_overlaps(get_interval_index(), start_ts // 60, end_ts // 60)
+        if overlaps and not allow_overlap:
+            conflicts = "、".join(
+                f"{epoch_to_local(s * 60, activity_tz).strftime('%m-%d %H:%M')}-"
+                f"{epoch_to_local(e * 60, activity_tz).strftime('%m-%d %H:%M')}"
+                for s, e, _ in overlaps[:5])
+            st.error(f"与 {len(overlaps)} 条已有活动时间重叠（{conflicts}），如确属同时进行请勾选“允许与已有活动时间重叠”")
             return
         
         # 创建活动对象
         activity = {
-            "id": len(st.session_state.activities) + 1,
-            "start_time": start_datetime.isoformat(),
-            "end_time": end_datetime.isoformat(),
+            "id": store.next_activity_id(st.session_state.activities),
             "duration": duration,
             "location_category": location_category,
             "location_tag": location_tag,
@@ -441,20 +635,17 @@ def activity_form():
             "project": project_type,
             "activity": activity_type,
             "behavior": behavior_type,
+            "segment": segment_type,
             "description": activity_description,
             "created_at": datetime.datetime.now().isoformat()
         }
+        set_activity_times(activity, start_datetime, end_datetime, activity_tz)
         
-        # 添加到活动列表
-        st.session_state.activities.append(activity)
-        st.session_state.activities.sort(key=lambda x: x["start_time"])
-        
-        # 保存数据
-        save_all_data()
+        # 添加到活动列表并保存
+        add_activities([activity])
         
         # 清除模板数据
-        if 'template_data' in st.session_state:
-            del st.session_state.template_data
+        clear_template_selection()
         
         st.success("🎉 活动添加成功！")
         
@@ -471,6 +662,8 @@ def activity_form():
             "project": project_type,
             "activity": activity_type,
             "behavior": behavior_type,
+            "segment": segment_type,
+            "location_category": location_category,
             "location_name": location_name
         }
         save_all_data()
@@ -479,13 +672,13 @@ def activity_form():
     
     if clear_form:
         # 清除模板数据
-        if 'template_data' in st.session_state:
-            del st.session_state.template_data
+        clear_template_selection()
         st.rerun()
 
 # 增强的数据概览
 def data_overview():
     """增强的数据概览面板"""
+    import plotly.express as px
     st.markdown('<div class="sub-header">📊 数据概览</div>', unsafe_allow_html=True)
     
     if not st.session_state.activities:
@@ -493,19 +686,15 @@ def data_overview():
         return
     
     # 计算统计指标
-    total_activities = len(st.session_state.activities)
-    total_duration = sum(activity["duration"] for activity in st.session_state.activities)
+    stats = compute_overview_stats(st.session_state.activities, local_today())
+    total_activities = stats["total_activities"]
+    total_duration = stats["total_duration"]
     total_hours = total_duration / 60
-    unique_projects = len(set(activity["project"] for activity in st.session_state.activities))
-    unique_locations = len(set(activity["location_name"] for activity in st.session_state.activities))
+    unique_projects = stats["level_counts"]["project"]
+    place_index = get_place_index()
+    unique_locations = count_canonical_places(place_index)
     avg_duration = total_duration / total_activities
     
-    # 今日统计
-    today = datetime.date.today()
-    today_activities = [a for a in st.session_state.activities 
-                       if datetime.datetime.fromisoformat(a["start_time"]).date() == today]
-    today_duration = sum(a["duration"] for a in today_activities)
-    
     # 显示指标卡片
     col1, col2, col3, col4, col5, col6 = st.columns(6)
     
@@ -515,7 +704,7 @@ def data_overview():
         (unique_projects, "涉及企划数"),
         (unique_locations, "访问地点数"),
         (f"{avg_duration:.0f}", "平均时长(分钟)"),
-        (len(today_activities), "今日活动数")
+        (stats["today_activities"], "今日活动数")
     ]
     
     for i, (value, label) in enumerate(metrics):
@@ -537,40 +726,38 @@ def data_overview():
     with col1:
         # 需求类型分布
         st.markdown("**🎯 需求类型分布**")
-        demand_data = {}
-        for activity in st.session_state.activities:
-            demand = activity["demand"]
-            duration = activity["duration"]
-            demand_data[demand] = demand_data.get(demand, 0) + duration
+        demand_data = stats["demand_minutes"]
         
         if demand_data:
-            fig_demand = px.pie(
+            fig_demand = build_chart(px.pie,
                 values=list(demand_data.values()),
                 names=list(demand_data.keys()),
                 title="各需求类型时间分布"
             )
-            st.plotly_chart(fig_demand, use_container_width=True)
+            show_plotly(fig_demand)
     
     with col2:
-        # 时间趋势分析
+        # 时间趋势分析：读取按日/周/月的汇总表，跨度再长也只有几百行
         st.markdown("**📅 活动时间趋势**")
-        date_data = {}
-        for activity in st.session_state.activities:
-            date = datetime.datetime.fromisoformat(activity["start_time"]).date()
-            date_str = date.isoformat()
-            date_data[date_str] = date_data.get(date_str, 0) + 1
+        rollups = get_rollups()
+        trend_col1, trend_col2 = st.columns(2)
+        with trend_col1:
+            level_name = st.radio("粒度", list(ROLLUP_LEVEL_NAMES), horizontal=True, key="trend_level")
+        with trend_col2:
+            trend_range = st.date_input("日期范围", value=(stats["first_date"], stats["last_date"]),
+                                        min_value=stats["first_date"], max_value=stats["last_date"],
+                                        key="trend_range")
+        start_date, end_date = (trend_range if len(trend_range) == 2 else (trend_range[0], trend_range[0]))
+        trend = rollup_frame(rollups, ROLLUP_LEVEL_NAMES[level_name], start_date, end_date)
         
-        if date_data:
-            dates = sorted(date_data.keys())
-            counts = [date_data[date] for date in dates]
-            
-            fig_trend = px.line(
-                x=dates, y=counts,
-                title="每日活动数量趋势",
-                labels={"x": "日期", "y": "活动数量"}
+        if not trend.empty:
+            fig_trend = build_chart(px.line,
+                trend, x="周期", y="活动数",
+                title=f"每{level_name}活动数量趋势",
+                hover_data=["时长(小时)", "地点数"]
             )
             fig_trend.update_traces(line=dict(color="#1f77b4", width=3))
-            st.plotly_chart(fig_trend, use_container_width=True)
+            show_plotly(fig_trend)
     
     # 第二行图表：时间段分布和持续时间分析
     col3, col4 = st.columns(2)
@@ -578,29 +765,9 @@ def data_overview():
     with col3:
         # 时间段分布
         st.markdown("**⏰ 时间段分布**")
-        time_slots = {
-            "深夜(0-6)": 0, "早晨(6-9)": 0, "上午(9-12)": 0,
-            "中午(12-14)": 0, "下午(14-18)": 0, "晚上(18-24)": 0
-        }
-        
-        for activity in st.session_state.activities:
-            start_time = datetime.datetime.fromisoformat(activity["start_time"])
-            hour = start_time.hour
-            
-            if 0 <= hour < 6:
-                time_slots["深夜(0-6)"] += activity["duration"]
-            elif 6 <= hour < 9:
-                time_slots["早晨(6-9)"] += activity["duration"]
-            elif 9 <= hour < 12:
-                time_slots["上午(9-12)"] += activity["duration"]
-            elif 12 <= hour < 14:
-                time_slots["中午(12-14)"] += activity["duration"]
-            elif 14 <= hour < 18:
-                time_slots["下午(14-18)"] += activity["duration"]
-            else:
-                time_slots["晚上(18-24)"] += activity["duration"]
+        time_slots = stats["slot_minutes"]
         
-        fig_time = px.bar(
+        fig_time = build_chart(px.bar,
             x=list(time_slots.keys()),
             y=list(time_slots.values()),
             title="各时间段活动时长分布",
@@ -608,22 +775,35 @@ def data_overview():
             color=list(time_slots.values()),
             color_continuous_scale="viridis"
         )
-        st.plotly_chart(fig_time, use_container_width=True)
+        show_plotly(fig_time)
     
     with col4:
         # 持续时间分布
         st.markdown("**⏱️ 活动持续时间分布**")
-        durations = [activity["duration"] for activity in st.session_state.activities]
+        durations = stats["durations"]
         
-        if durations:
-            fig_duration = px.histogram(
+        if len(durations):
+            fig_duration = build_chart(px.histogram,
                 x=durations,
                 title="活动持续时间分布",
                 labels={"x": "持续时间(分钟)", "y": "活动数量"},
                 nbins=20
             )
             fig_duration.update_traces(marker_color="#ff7f0e")
-            st.plotly_chart(fig_duration, use_container_width=True)
+            show_plotly(fig_duration)
+    
+    # 每小时占用：各时刻在记录跨度内被活动占用的比例，跨午夜的活动按实际时段拆分
+    st.markdown("**🕐 每小时占用**")
+    span_days = (stats["last_date"] - stats["first_date"]).days + 1
+    fig_hours = build_chart(px.bar,
+        x=[f"{hour:02d}时" for hour in range(24)],
+        y=stats["hour_minutes"] / (span_days * 60) * 100,
+        title="一天中各小时的平均占用率",
+        labels={"x": "时刻", "y": "占用率(%)"},
+        color=stats["hour_minutes"],
+        color_continuous_scale="blues"
+    )
+    show_plotly(fig_hours)
     
     # 第三行图表：地点分析和分类详情
     col5, col6 = st.columns(2)
@@ -631,13 +811,10 @@ def data_overview():
     with col5:
         # 地点类型分析
         st.markdown("**📍 地点类型分析**")
-        location_data = {}
-        for activity in st.session_state.activities:
-            category = activity["location_category"]
-            location_data[category] = location_data.get(category, 0) + activity["duration"]
+        location_data = stats["location_minutes"]
         
         if location_data:
-            fig_location = px.bar(
+            fig_location = build_chart(px.bar,
                 x=list(location_data.keys()),
                 y=list(location_data.values()),
                 title="各地点类型时间分布",
@@ -645,30 +822,54 @@ def data_overview():
                 color=list(location_data.values()),
                 color_continuous_scale="plasma"
             )
-            st.plotly_chart(fig_location, use_container_width=True)
+            show_plotly(fig_location)
     
     with col6:
         # 活动类型详情
         st.markdown("**🔍 活动类型详情**")
-        activity_data = {}
-        for activity in st.session_state.activities:
-            key = f"{activity['demand']} - {activity['activity']}"
-            activity_data[key] = activity_data.get(key, 0) + 1
+        sorted_activities = stats["top_activities"]  # 前10个最多的活动类型
         
-        if activity_data:
-            # 取前10个最多的活动类型
-            sorted_activities = sorted(activity_data.items(), key=lambda x: x[1], reverse=True)[:10]
+        if sorted_activities:
             activity_names = [item[0] for item in sorted_activities]
             activity_counts = [item[1] for item in sorted_activities]
             
-            fig_activity = px.bar(
+            fig_activity = build_chart(px.bar,
                 x=activity_counts,
                 y=activity_names,
                 orientation='h',
                 title="最频繁的活动类型",
                 labels={"x": "出现次数", "y": "活动类型"}
             )
-            st.plotly_chart(fig_activity, use_container_width=True)
+            show_plotly(fig_activity)
+    
+    # 分类层级下钻：各节点的汇总矩阵已缓存，换日期范围只需切片求和，展开折叠在图表内完成
+    st.markdown("---")
+    st.markdown("### 🌳 分类层级下钻")
+    drill_col1, drill_col2, drill_col3, drill_col4 = st.columns(4)
+    with drill_col1:
+        drill_chart = st.radio("图表", ["旭日图", "矩形树图"], horizontal=True, key="drill_chart")
+    with drill_col2:
+        drill_measure = st.radio("指标", ["时长(分钟)", "活动数"], horizontal=True, key="drill_measure")
+    with drill_col3:
+        drill_depth = st.slider("显示层数", 1, len(CLASSIFICATION_LEVEL_NAMES), 2, key="drill_depth",
+                                help="点击扇区或方块可展开该分类，点击中心或顶部返回上一级")
+    with drill_col4:
+        drill_range = st.date_input("日期范围", value=(stats["first_date"], stats["last_date"]),
+                                    min_value=stats["first_date"], max_value=stats["last_date"],
+                                    key="drill_range")
+    drill_start, drill_end = (drill_range if len(drill_range) == 2 else (drill_range[0], drill_range[0]))
+    hierarchy = hierarchy_frame(get_hierarchy_cube(), drill_start, drill_end, CLASSIFICATION_LEVEL_NAMES)
+    
+    if hierarchy.empty:
+        st.info("所选日期范围内没有活动记录")
+    else:
+        fig_hierarchy = build_chart(px.sunburst if drill_chart == "旭日图" else px.treemap,
+            hierarchy, ids="id", parents="parent", names="名称", values=drill_measure,
+            branchvalues="total", maxdepth=drill_depth,
+            hover_data=["层级", "时长(分钟)", "活动数"],
+            title=f"{drill_start} 至 {drill_end} 分类层级{drill_measure.split('(')[0]}分布"
+        )
+        show_plotly(fig_hierarchy)
     
     # 高级统计信息
     st.markdown("---")
@@ -679,22 +880,24 @@ def data_overview():
     with col7:
         st.markdown("**📅 时间统计**")
         if st.session_state.activities:
-            first_date = min(datetime.datetime.fromisoformat(a["start_time"]).date() 
-                           for a in st.session_state.activities)
-            last_date = max(datetime.datetime.fromisoformat(a["start_time"]).date() 
-                          for a in st.session_state.activities)
+            recorded_days = rollups["day"]["keys"]
+            first_date = datetime.date.fromisoformat(recorded_days[0])
+            last_date = datetime.date.fromisoformat(recorded_days[-1])
             days_span = (last_date - first_date).days + 1
             
-            st.metric("记录时间跨度", f"{days_span} 天")
+            coverage = min(covered_minutes(get_interval_index()) / (days_span * 1440) * 100, 100)
+            
+            st.metric("记录时间跨度", f"{days_span} 天", help=f"其中 {len(recorded_days)} 天有记录")
+            st.metric("时间覆盖率", f"{coverage:.1f}%", help="有活动记录的时间占记录跨度内全部时间的比例")
             st.metric("日均活动数", f"{total_activities/days_span:.1f} 个")
             st.metric("日均时长", f"{total_hours/days_span:.1f} 小时")
     
     with col8:
         st.markdown("**🎯 分类统计**")
-        demand_count = len(set(a["demand"] for a in st.session_state.activities))
-        project_count = len(set(a["project"] for a in st.session_state.activities))
-        activity_count = len(set(a["activity"] for a in st.session_state.activities))
-        behavior_count = len(set(a["behavior"] for a in st.session_state.activities))
+        demand_count = stats["level_counts"]["demand"]
+        project_count = stats["level_counts"]["project"]
+        activity_count = stats["level_counts"]["activity"]
+        behavior_count = stats["level_counts"]["behavior"]
         
         st.metric("需求类型", demand_count)
         st.metric("企划类型", project_count)
@@ -704,9 +907,7 @@ def data_overview():
     with col9:
         st.markdown("**📈 效率指标**")
         # 计算活动密度（白天活动时间占比）
-        daytime_activities = [a for a in st.session_state.activities 
-                            if 6 <= datetime.datetime.fromisoformat(a["start_time"]).hour <= 22]
-        daytime_duration = sum(a["duration"] for a in daytime_activities)
+        daytime_duration = stats["daytime_minutes"]
         daytime_ratio = (daytime_duration / total_duration * 100) if total_duration > 0 else 0
         
         # 计算连续活动指标
@@ -714,7 +915,66 @@ def data_overview():
         st.metric("活动多样性", f"{activity_count} 种")
         st.metric("地点多样性", f"{unique_locations} 处")
 
+    # 异常日检测
+    st.markdown("---")
+    st.markdown("### 🔎 异常日检测")
+    anomaly_report = get_anomaly_report()
+    if anomaly_report["dates"] is None:
+        st.info(f"至少需要 {ANOMALY_MIN_DAYS} 个已结束的记录日才能建立基线")
+    else:
+        st.caption("每天的时间预算、出行距离、陌生地点、锚点和常规日程与同类日（工作日/周末）基线的稳健偏离，按异常分排序")
+        st.dataframe(rank_anomalies(anomaly_report), use_container_width=True, hide_index=True)
+
+    # 出行与活动空间
+    st.markdown("---")
+    st.markdown("### 🚶 出行与活动空间")
+
+    mobility = compute_mobility_metrics(st.session_state.activities)
+    if mobility["trips"].empty and mobility["daily_space"].empty:
+        st.info("活动缺少坐标信息，无法计算出行指标")
+        return
+
+    col10, col11, col12, col13 = st.columns(4)
+    with col10:
+        st.metric("日均出行距离", f"{mobility['avg_daily_distance']:.1f} km")
+    with col11:
+        st.metric("日均回转半径", f"{mobility['avg_daily_radius']:.2f} km")
+    with col12:
+        st.metric("日均活动空间", f"{mobility['avg_daily_area']:.2f} km²")
+    with col13:
+        st.metric("速度异常出行", f"{mobility['impossible_trips']} 次")
+
+    if len(mobility["daily_distance"]):
+        fig_distance = build_chart(px.bar,
+            x=mobility["daily_distance"].index.astype(str),
+            y=mobility["daily_distance"].values,
+            title="每日出行距离",
+            labels={"x": "日期", "y": "距离(km)"}
+        )
+        show_plotly(fig_distance)
+
+    # 规范地点与锚点
+    anchors = place_anchors(place_index)
+    anchor_labels = {anchors.get("home"): "🏠 家", anchors.get("work"): "🏢 工作地"}
+    top_places = sorted((p for p in place_index["places"] if p["count"] > 0),
+                        key=lambda p: p["minutes"], reverse=True)[:10]
+    if top_places:
+        st.markdown("**📍 常去地点（按坐标聚类合并）**")
+        st.dataframe(pd.DataFrame([{
+            "地点": place_display_name(place_index, place["id"]),
+            "锚点": anchor_labels.get(place["id"], ""),
+            "记录数": place["count"],
+            "停留时长(小时)": round(place["minutes"] / 60, 1),
+            "使用过的名称": "、".join(name for name, _ in place["names"].most_common(5)),
+        } for place in top_places]), use_container_width=True, hide_index=True)
+
+    if mobility["impossible_trips"]:
+        with st.expander("⚠️ 速度异常的出行（可能是时间或坐标录入错误）"):
+            st.dataframe(mobility["trips"][mobility["trips"]["速度异常"]], use_container_width=True)
+
 # 活动记录列表
+RECORDS_PAGE_SIZE = 50  # 每页显示的活动数，只解码当前页
+
 def activity_records():
     """活动记录列表"""
     st.markdown('<div class="sub-header">📋 活动记录</div>', unsafe_allow_html=True)
@@ -728,7 +988,7 @@ def activity_records():
     with col1:
         search_term = st.text_input("🔍 搜索活动描述")
     with col2:
-        demand_options = [""] + list(set(a["demand"] for a in st.session_state.activities))
+        demand_options = [""] + list(set(field_values(st.session_state.activities, "demand")))
         demand_filter = st.selectbox("筛选需求类型", demand_options)
     with col3:
         date_filter = st.date_input("筛选日期")
@@ -741,21 +1001,29 @@ def activity_records():
                 st.warning("删除功能待实现")
     
     # 筛选活动
-    filtered_activities = st.session_state.activities
-    
-    if search_term:
-        filtered_activities = [a for a in filtered_activities 
-                             if search_term.lower() in a.get("description", "").lower()]
-    
-    if demand_filter:
-        filtered_activities = [a for a in filtered_activities if a["demand"] == demand_filter]
+    filtered_activities = filter_activities(st.session_state.activities, search_term, demand_filter, date_filter)
     
+    # 当日未记录的时段（按当前时区的一天，夏令时切换日可能是23或25小时）
     if date_filter:
-        filtered_activities = [a for a in filtered_activities 
-                             if datetime.datetime.fromisoformat(a["start_time"]).date() == date_filter]
-    
-    # 显示活动记录
-    for activity in reversed(filtered_activities):
+        tz = st.session_state.timezone
+        midnight = datetime.datetime.combine(date_filter, datetime.time())
+        day_start = local_to_epoch(midnight, tz) // 60
+        day_end = local_to_epoch(midnight + timedelta(days=1), tz) // 60
+        gaps = find_gaps(get_interval_index(), day_start, day_end, min_gap=15)
+        gap_minutes = sum(e - s for s, e in gaps)
+        if gaps and gap_minutes < day_end - day_start:
+            with st.expander(f"⏳ {date_filter} 有 {len(gaps)} 段未记录时间，共 {gap_minutes / 60:.1f} 小时"):
+                for s, e in gaps:
+                    st.write(f"{epoch_to_local(s * 60, tz).strftime('%H:%M')} - "
+                             f"{epoch_to_local(e * 60, tz).strftime('%H:%M') if e < day_end else '24:00'}"
+                             f"（{e - s} 分钟）")
+    
+    # 显示活动记录：最新的在前，分页后只取出当前页
+    pages = max(1, -(-len(filtered_activities) // RECORDS_PAGE_SIZE))
+    page = st.number_input(f"页码（共 {pages} 页，{len(filtered_activities)} 条）",
+                           min_value=1, max_value=pages, value=1) if pages > 1 else 1
+    stop = len(filtered_activities) - (page - 1) * RECORDS_PAGE_SIZE
+    for activity in reversed(window(filtered_activities, max(0, stop - RECORDS_PAGE_SIZE), stop)):
         with st.container():
             start_time = datetime.datetime.fromisoformat(activity["start_time"])
             end_time = datetime.datetime.fromisoformat(activity["end_time"])
@@ -766,7 +1034,7 @@ def activity_records():
                 <div class="activity-card">
                     <div style="font-weight: bold; color: #1f77b4; margin-bottom: 0.5rem;">
                         🕒 {start_time.strftime('%Y-%m-%d %H:%M')} - {end_time.strftime('%H:%M')} 
-                        ({activity['duration']}分钟)
+                        ({activity['duration']}分钟){f" · {activity['tz']}" if activity.get('tz') != st.session_state.timezone else ""}
                     </div>
                     <div style="margin-bottom: 0.5rem;">
                         📍 {activity['location_category']} / 
@@ -775,14 +1043,14 @@ def activity_records():
                         {f"<br><small>坐标: {activity['coordinates']['lat']:.4f}, {activity['coordinates']['lng']:.4f}</small>" if activity.get('coordinates') else ""}
                     </div>
                     <div style="background: #e3f2fd; padding: 0.5rem; border-radius: 5px; font-size: 0.9rem;">
-                        {activity['demand']} → {activity['project']} → {activity['activity']} → {activity['behavior']}
+                        {' → '.join(classification_path(activity))}
                     </div>
                     {f"<div style='margin-top: 0.5rem; color: #666;'>{activity['description']}</div>" if activity['description'] else ""}
                 </div>
                 """, unsafe_allow_html=True)
             with col2:
                 if st.button("删除", key=f"del_{activity['id']}", type="secondary"):
-                    st.session_state.activities = [a for a in st.session_state.activities if a['id'] != activity['id']]
+                    store.remove_activity(st.session_state, activity['id'])
                     save_all_data()
                     st.success("活动已删除")
                     st.rerun()
@@ -800,8 +1068,7 @@ def spatiotemporal_analysis():
     col1, col2, col3 = st.columns(3)
     with col1:
         # 选择日期查看轨迹
-        dates = sorted(set(datetime.datetime.fromisoformat(a["start_time"]).date() 
-                          for a in st.session_state.activities))
+        dates = covered_dates(st.session_state.activities)
         selected_date = st.selectbox("选择查看日期", options=dates)
     
     with col2:
@@ -813,22 +1080,25 @@ def spatiotemporal_analysis():
     with col3:
         # 可视化类型
         viz_type = st.selectbox("可视化类型", 
-                               ["轨迹地图", "热力图", "时间轴", "分类视图"])
+                               ["轨迹地图", "热力图", "时间轴", "分类视图", "日程对比"])
     
-    # 筛选活动
+    # 日程对比基于全部历史，不受日期筛选影响
+    if viz_type == "日程对比":
+        show_day_pattern_view()
+        return
+    
+    # 筛选活动：包括前一天开始、跨午夜延续到所选日期的活动
     if multi_day:
         # 显示多日轨迹
         end_date = selected_date
         start_date = end_date - timedelta(days=day_range-1)
-        date_range_activities = [a for a in st.session_state.activities 
-                               if start_date <= datetime.datetime.fromisoformat(a["start_time"]).date() <= end_date]
-        daily_activities = date_range_activities
         display_date = f"{start_date} 至 {end_date}"
     else:
         # 单日轨迹
-        daily_activities = [a for a in st.session_state.activities 
-                           if datetime.datetime.fromisoformat(a["start_time"]).date() == selected_date]
+        start_date = end_date = selected_date
         display_date = str(selected_date)
+    daily_activities = activities_overlapping(st.session_state.activities, start_date, end_date,
+                                              get_interval_index()["max_length"])
     
     if not daily_activities:
         st.info(f"{display_date} 没有活动记录")
@@ -840,15 +1110,16 @@ def spatiotemporal_analysis():
     elif viz_type == "热力图":
         show_heatmap(daily_activities, display_date)
     elif viz_type == "时间轴":
-        show_timeline_view(daily_activities, display_date)
+        show_timeline_view(daily_activities, display_date, start_date, end_date)
     elif viz_type == "分类视图":
-        show_category_view(daily_activities, display_date)
+        show_category_view(daily_activities, display_date, start_date, end_date)
     
     # 显示详细时间线
     show_detailed_timeline(daily_activities)
 
 def show_trajectory_map(activities, display_date):
     """显示轨迹地图"""
+    from streamlit_folium import st_folium
     st.markdown(f"**🛣️ {display_date} 的活动轨迹**")
     
     # 计算地图中心
@@ -859,13 +1130,16 @@ def show_trajectory_map(activities, display_date):
         return
     
     # 创建Folium地图
-    m = create_enhanced_map(valid_activities, display_date)
+    with profile_section("地图构建"):
+        m = create_enhanced_map(valid_activities, display_date)
     
     # 显示地图
-    st_folium(m, width=800, height=500)
+    with profile_section("st_folium: 轨迹地图"):
+        st_folium(m, width=800, height=500)
 
 def create_enhanced_map(activities, display_date):
     """创建增强的地图"""
+    import folium
     # 计算中心点
     lats = [a["coordinates"]["lat"] for a in activities]
     lngs = [a["coordinates"]["lng"] for a in activities]
@@ -937,6 +1211,7 @@ def create_enhanced_map(activities, display_date):
 
 def show_heatmap(activities, display_date):
     """显示热力图"""
+    import plotly.express as px
     st.markdown(f"**🔥 {display_date} 活动热力图**")
     
     valid_activities = [a for a in activities if a.get("coordinates")]
@@ -958,30 +1233,34 @@ def show_heatmap(activities, display_date):
     lngs = [point[1] for point in heat_data]
     weights = [point[2] for point in heat_data]
     
-    fig = px.density_mapbox(
+    fig = build_chart(px.density_mapbox,
         lat=lats, lon=lngs, z=weights,
         radius=20, zoom=12,
         mapbox_style="open-street-map",
         title=f"{display_date} 活动密度热力图"
     )
     
-    st.plotly_chart(fig, use_container_width=True)
+    show_plotly(fig)
 
-def show_timeline_view(activities, display_date):
-    """显示时间轴视图"""
+def show_timeline_view(activities, display_date, start_date, end_date):
+    """显示时间轴视图，跨出所选日期的部分截掉"""
+    import plotly.express as px
     st.markdown(f"**⏰ {display_date} 时间轴视图**")
     
     # 创建时间轴数据
+    window_start = datetime.datetime.combine(start_date, datetime.time())
+    window_end = datetime.datetime.combine(end_date + timedelta(days=1), datetime.time())
+    minutes_inside = minutes_on_dates(activities, start_date, end_date)
     timeline_data = []
-    for activity in activities:
+    for activity, minutes in zip(activities, minutes_inside.tolist()):
         start_time = datetime.datetime.fromisoformat(activity["start_time"])
         end_time = datetime.datetime.fromisoformat(activity["end_time"])
         
         timeline_data.append({
             "活动": f"{activity['demand']} - {activity['activity']}",
-            "开始时间": start_time,
-            "结束时间": end_time,
-            "时长": activity["duration"],
+            "开始时间": max(start_time, window_start),
+            "结束时间": min(end_time, window_end),
+            "时长": int(minutes),
             "地点": activity["location_name"],
             "类型": activity["demand"]
         })
@@ -989,7 +1268,7 @@ def show_timeline_view(activities, display_date):
     df = pd.DataFrame(timeline_data)
     
     # 创建甘特图样式的时间轴
-    fig = px.timeline(
+    fig = build_chart(px.timeline,
         df, 
         x_start="开始时间", 
         x_end="结束时间", 
@@ -999,10 +1278,11 @@ def show_timeline_view(activities, display_date):
     )
     
     fig.update_yaxes(autorange="reversed")
-    st.plotly_chart(fig, use_container_width=True)
+    show_plotly(fig)
 
-def show_category_view(activities, display_date):
-    """显示分类视图"""
+def show_category_view(activities, display_date, start_date, end_date):
+    """显示分类视图，时长只计落在所选日期内的部分"""
+    import plotly.express as px
     st.markdown(f"**🏷️ {display_date} 分类视图**")
     
     col1, col2 = st.columns(2)
@@ -1010,17 +1290,17 @@ def show_category_view(activities, display_date):
     with col1:
         # 需求类型分布
         demand_data = {}
-        for activity in activities:
+        for activity, minutes in zip(activities, minutes_on_dates(activities, start_date, end_date).tolist()):
             demand = activity["demand"]
-            demand_data[demand] = demand_data.get(demand, 0) + activity["duration"]
+            demand_data[demand] = demand_data.get(demand, 0) + minutes
         
         if demand_data:
-            fig = px.pie(
+            fig = build_chart(px.pie,
                 values=list(demand_data.values()),
                 names=list(demand_data.keys()),
                 title="需求类型时间分布"
             )
-            st.plotly_chart(fig, use_container_width=True)
+            show_plotly(fig)
     
     with col2:
         # 地点类型分布
@@ -1030,13 +1310,79 @@ def show_category_view(activities, display_date):
             location_data[category] = location_data.get(category, 0) + 1
         
         if location_data:
-            fig = px.bar(
+            fig = build_chart(px.bar,
                 x=list(location_data.keys()),
                 y=list(location_data.values()),
                 title="地点类型分布",
                 labels={"x": "地点类型", "y": "活动数量"}
             )
-            st.plotly_chart(fig, use_container_width=True)
+            show_plotly(fig)
+
+def show_day_pattern_view():
+    """多日日程对比：典型一天、工作日/周末预算、相似日期和日程类型"""
+    import plotly.express as px
+    st.markdown("**📆 日程对比**")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        slot_minutes = st.selectbox("时间分辨率", options=[15, 30, 60], format_func=lambda x: f"{x} 分钟")
+    with col2:
+        level = st.selectbox("编码层级", options=list(DAY_MATRIX_LEVELS.keys()))
+    
+    day_matrix = get_day_matrix(slot_minutes, level)
+    recorded = recorded_day_mask(day_matrix)
+    hours = np.arange(day_matrix["matrix"].shape[1]) * slot_minutes / 60
+    
+    # 典型一天
+    profile = typical_day_profile(day_matrix, recorded)
+    profile_df = pd.DataFrame({
+        "时刻": np.tile(hours, len(day_matrix["labels"]) - 1),
+        "类型": np.repeat(day_matrix["labels"][1:], len(hours)),
+        "比例": profile[1:].ravel()
+    })
+    fig_profile = build_chart(px.area, profile_df, x="时刻", y="比例", color="类型",
+                          title=f"典型一天（{int(recorded.sum())} 天平均）")
+    show_plotly(fig_profile)
+    
+    col3, col4 = st.columns(2)
+    with col3:
+        # 工作日与周末对比
+        budget = weekday_weekend_budget(day_matrix)
+        budget_df = budget.reset_index(names="类型").melt(id_vars="类型", var_name="日期类型", value_name="分钟")
+        fig_budget = build_chart(px.bar, budget_df, x="类型", y="分钟", color="日期类型", barmode="group",
+                            title="工作日与周末日均时间预算")
+        show_plotly(fig_budget)
+    
+    with col4:
+        # 相似日期
+        recorded_dates = day_matrix["dates"][recorded]
+        target = st.selectbox("查找与该日期相似的日子", options=list(reversed(recorded_dates.tolist())))
+        if target is not None:
+            target_idx = int((np.datetime64(target) - day_matrix["dates"][0]).astype(int))
+            scores = np.where(recorded, day_similarity(day_matrix, [target_idx])[0], -1)
+            scores[target_idx] = -1
+            best = np.argsort(scores)[::-1][:5]
+            st.dataframe(pd.DataFrame({
+                "日期": day_matrix["dates"][best].astype(str),
+                "相似度": [f"{scores[i] * 100:.0f}%" for i in best]
+            })[scores[best] >= 0], use_container_width=True, hide_index=True)
+    
+    # 日程类型聚类
+    st.markdown("**🧩 日程类型**")
+    n_clusters = st.slider("类型数量", min_value=2, max_value=8, value=4)
+    days, assignment = cluster_day_types(day_matrix, n_clusters)
+    if len(days):
+        for cluster in np.unique(assignment):
+            members = days[assignment == cluster]
+            cluster_matrix = {**day_matrix, "matrix": day_matrix["matrix"][members]}
+            dominant = typical_day_profile(cluster_matrix).argmax(axis=0)
+            summary = []
+            for hour in range(0, 24, 3):
+                code = dominant[int(hour * 60 / slot_minutes)]
+                summary.append(f"{hour:02d}时 {day_matrix['labels'][code]}")
+            with st.expander(f"类型 {cluster + 1}：{len(members)} 天"):
+                st.write(" → ".join(summary))
+                st.caption("包含日期: " + ", ".join(day_matrix["dates"][members][-10:].astype(str)))
 
 def show_detailed_timeline(activities):
     """显示详细时间线"""
@@ -1056,6 +1402,8 @@ def show_detailed_timeline(activities):
             with col2:
                 st.write(f"**时长:** {activity['duration']}分钟")
                 st.write(f"**行为:** {activity['behavior']}")
+                if activity.get('segment'):
+                    st.write(f"**片段:** {activity['segment']}")
                 st.write(f"**结束时间:** {end_time.strftime('%H:%M')}")
             
             if activity['description']:
@@ -1088,7 +1436,7 @@ def activity_templates():
                     col_btn1, col_btn2 = st.columns([3, 1])
                     with col_btn1:
                         if st.button(f"使用推荐: {template['name']}", key=f"rec_use_{template['name']}"):
-                            st.session_state.template_data = template['data']
+                            select_template(template['name'], template['data'])
                             st.success(f"已加载推荐模板: {template['name']}")
                             st.rerun()
                     with col_btn2:
@@ -1101,18 +1449,50 @@ def activity_templates():
         else:
             st.info("暂无推荐模板，继续记录活动以获得个性化推荐")
         
+        with st.expander("📈 序列推荐模型评估"):
+            eval_col1, eval_col2 = st.columns(2)
+            with eval_col1:
+                holdout_days = st.number_input("留出天数", min_value=1, max_value=365, value=14)
+            with eval_col2:
+                top_k = st.number_input("推荐个数k", min_value=1, max_value=10, value=3)
+            if st.button("运行评估"):
+                activities = st.session_state.activities
+                result = evaluate_next_activity_model(
+                    activities, activity_places(get_place_index(), activities), int(holdout_days), int(top_k))
+                if result:
+                    metric_cols = st.columns(3)
+                    metric_cols[0].metric("hit@1", f"{result['hit@1'] * 100:.1f}%")
+                    metric_cols[1].metric(f"hit@{top_k}", f"{result[f'hit@{top_k}'] * 100:.1f}%")
+                    metric_cols[2].metric(f"基线 hit@{top_k}", f"{result[f'baseline_hit@{top_k}'] * 100:.1f}%",
+                                          help="总是推荐历史上最常见的活动")
+                    st.caption(f"训练 {result['train_size']} 条，测试 {result['test_size']} 条")
+                else:
+                    st.warning("数据不足，无法划分训练集和留出集")
+        
         st.markdown("---")
         
         # 现有模板管理
         st.markdown("**💾 已保存的模板**")
         if st.session_state.activity_templates:
-            for template_name, template_data in st.session_state.activity_templates.items():
+            sort_by = st.radio("排序方式", ["默认", "使用次数", "最近使用"], horizontal=True)
+            template_stats = {name: get_template_usage_stats(get_usage_index(), data, local_today())
+                              for name, data in st.session_state.activity_templates.items()}
+            template_items = list(st.session_state.activity_templates.items())
+            if sort_by == "使用次数":
+                template_items.sort(key=lambda item: template_stats[item[0]]["count"], reverse=True)
+            elif sort_by == "最近使用":
+                template_items.sort(key=lambda item: template_stats[item[0]]["last_used"] or "", reverse=True)
+            
+            for template_name, template_data in template_items:
                 with st.container():
-                    usage_count = get_template_usage_count(template_name)
+                    stats = template_stats[template_name]
+                    usage_count = stats["count"]
+                    last_used = stats["last_used"][:10] if stats["last_used"] else "从未使用"
+                    trend = "↑" if stats["recent"] > stats["previous"] else "↓" if stats["recent"] < stats["previous"] else "→"
                     st.markdown(f"""
                     <div class="template-card">
                         <strong>{template_name}</strong>
-                        <small style="float: right; color: #666;">使用次数: {usage_count}</small><br>
+                        <small style="float: right; color: #666;">使用次数: {usage_count} · 最近: {last_used} · 近{USAGE_TREND_WEEKS}周 {stats['recent']} {trend}</small><br>
                         <small>{template_data['demand']} → {template_data['project']} → {template_data['activity']}</small><br>
                         <small>📍 {template_data.get('location_name', '无地点')}</small>
                     </div>
@@ -1121,7 +1501,7 @@ def activity_templates():
                     col_btn1, col_btn2, col_btn3 = st.columns([2, 1, 1])
                     with col_btn1:
                         if st.button(f"使用模板", key=f"use_{template_name}"):
-                            st.session_state.template_data = template_data
+                            select_template(template_name, template_data)
                             st.success(f"已加载模板: {template_name}")
                             st.rerun()
                     with col_btn2:
@@ -1161,26 +1541,23 @@ def activity_templates():
                 if suggested_name:
                     st.caption(f"💡 建议名称: {suggested_name}")
             
-            template_demand = st.selectbox("需求类型", 
-                                         options=[""] + list(st.session_state.classification_system.keys()),
-                                         index=(list(st.session_state.classification_system.keys()).index(template_data.get('demand', '')) + 1 
-                                               if template_data.get('demand') in st.session_state.classification_system else 0))
-            
-            template_project = st.selectbox("企划类型", 
-                                          options=[""] + list(st.session_state.classification_system.get(template_demand, {}).keys()),
-                                          index=(list(st.session_state.classification_system.get(template_demand, {}).keys()).index(template_data.get('project', '')) + 1 
-                                               if template_data.get('project') in st.session_state.classification_system.get(template_demand, {}) else 0))
-            
-            template_activity = st.selectbox("活动类型", 
-                                           options=[""] + list(st.session_state.classification_system.get(template_demand, {}).get(template_project, {}).keys()),
-                                           index=(list(st.session_state.classification_system.get(template_demand, {}).get(template_project, {}).keys()).index(template_data.get('activity', '')) + 1 
-                                                if template_data.get('activity') in st.session_state.classification_system.get(template_demand, {}).get(template_project, {}) else 0))
-            
-            template_behavior = st.selectbox("行为类型", 
-                                           options=[""] + list(st.session_state.classification_system.get(template_demand, {}).get(template_project, {}).get(template_activity, {}).keys()),
-                                           index=(list(st.session_state.classification_system.get(template_demand, {}).get(template_project, {}).get(template_activity, {}).keys()).index(template_data.get('behavior', '')) + 1 
-                                                if template_data.get('behavior') in st.session_state.classification_system.get(template_demand, {}).get(template_project, {}).get(template_activity, {}) else 0))
+            template_demand = classification_selectbox("需求类型", (), template_data.get('demand', ''))
+            template_project = classification_selectbox("企划类型", (template_demand,),
+                                                        template_data.get('project', ''))
+            template_activity = classification_selectbox("活动类型", (template_demand, template_project),
+                                                         template_data.get('activity', ''))
+            template_behavior = classification_selectbox("行为类型",
+                                                         (template_demand, template_project, template_activity),
+                                                         template_data.get('behavior', ''))
+            template_segment = classification_selectbox("片段", (template_demand, template_project,
+                                                                 template_activity, template_behavior),
+                                                        template_data.get('segment', ''))
             
+            category_options = list(st.session_state.location_categories.keys())
+            template_category = st.selectbox("地点大类",
+                                             options=[""] + category_options,
+                                             index=(category_options.index(template_data.get('location_category', '')) + 1
+                                                    if template_data.get('location_category') in category_options else 0))
             template_location = st.text_input("常用地点", value=template_data.get('location_name', ''))
             
             # 自动填充建议地点
@@ -1206,6 +1583,8 @@ def activity_templates():
                         "project": template_project,
                         "activity": template_activity,
                         "behavior": template_behavior,
+                        "segment": template_segment,
+                        "location_category": template_category,
                         "location_name": template_location
                     }
                     save_all_data()
@@ -1222,6 +1601,104 @@ def activity_templates():
                     st.rerun()
                 else:
                     st.error("请填写完整信息")
+    
+    # 批量记录
+    st.markdown("---")
+    batch_template_logging()
+
+def batch_template_logging():
+    """按模板一次记录一天中的多项活动"""
+    st.markdown("**🗓️ 按模板批量记录**")
+    templates = st.session_state.activity_templates
+    if not templates:
+        st.info("保存模板后可在这里一次记录一整天的常规活动")
+        return
+    
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        batch_date = st.date_input("记录日期", value=local_today(), key="batch_date")
+    with col2:
+        allow_overlap = st.checkbox("允许与已有活动时间重叠", key="batch_allow_overlap")
+    
+    default_rows = pd.DataFrame({
+        "模板": pd.Series([None] * 4, dtype="object"),
+        "开始": pd.Series([datetime.time(h, 0) for h in (7, 8, 9, 18)], dtype="object"),
+        "结束": pd.Series([datetime.time(h, 0) for h in (8, 9, 18, 19)], dtype="object"),
+        "地点": pd.Series([""] * 4, dtype="object"),
+        "地点大类": pd.Series([None] * 4, dtype="object"),
+    })
+    rows = st.data_editor(
+        default_rows, num_rows="dynamic", use_container_width=True, hide_index=True, key="batch_rows",
+        column_config={
+            "模板": st.column_config.SelectboxColumn("模板", options=list(templates.keys()), required=True),
+            "开始": st.column_config.TimeColumn("开始", format="HH:mm", step=300, required=True),
+            "结束": st.column_config.TimeColumn("结束", format="HH:mm", step=300, required=True,
+                                               help="早于开始时间表示次日结束"),
+            "地点": st.column_config.TextColumn("地点", help="留空则使用模板中的地点"),
+            "地点大类": st.column_config.SelectboxColumn("地点大类", options=list(st.session_state.location_categories.keys()),
+                                                      help="留空则使用模板中的地点大类"),
+        })
+    
+    if not st.button("✅ 批量添加", use_container_width=True):
+        return
+    
+    place_index = get_place_index()
+    interval_index = get_interval_index()
+    now = datetime.datetime.now().isoformat()
+    new_activities = []
+    for i, row in rows.iterrows():
+        if pd.isna(row["模板"]) or pd.isna(row["开始"]) or pd.isna(row["结束"]):
+            continue
+        template = templates[row["模板"]]
+        start_dt = datetime.datetime.combine(batch_date, row["开始"])
+        end_dt = datetime.datetime.combine(batch_date, row["结束"])
+        if end_dt <= start_dt:
+            end_dt += timedelta(days=1)
+        location_name = (row["地点"] if isinstance(row["地点"], str) else "").strip() or template.get("location_name", "")
+        location_category = row["地点大类"] if isinstance(row["地点大类"], str) else template.get("location_category", "")
+        if not (location_name and location_category):
+            st.error(f"第 {i + 1} 行缺少地点或地点大类，请在表格中填写或在模板中设置")
+            return
+        
+        # 地点名称对应已知的规范地点时带上其坐标
+        place = place_index["name_place"].get(location_name)
+        coordinates = ({"lat": place_index["places"][place]["lat"], "lng": place_index["places"][place]["lng"]}
+                       if place is not None else None)
+        activity = set_activity_times({}, start_dt, end_dt, st.session_state.timezone)
+        activity.update({
+            "duration": (activity["end_ts"] - activity["start_ts"]) // 60,
+            "location_category": location_category,
+            "location_tag": "",
+            "location_name": location_name,
+            "coordinates": coordinates,
+            "demand": template["demand"],
+            "project": template["project"],
+            "activity": template["activity"],
+            "behavior": template["behavior"],
+            "segment": template.get("segment", ""),
+            "description": f"批量记录: {row['模板']}",
+            "created_at": now
+        })
+        new_activities.append(activity)
+    
+    if not new_activities:
+        st.warning("没有可添加的行")
+        return
+    
+    if not allow_overlap:
+        batch = sorted(new_activities, key=lambda x: x["start_ts"])
+        for prev, nxt in zip(batch, batch[1:]):
+            if nxt["start_ts"] < prev["end_ts"]:
+                st.error(f"批量中的 {prev['start_time'][11:16]} 与 {nxt['start_time'][11:16]} 两项时间重叠")
+                return
+        for activity in batch:
+            if find_overlaps(interval_index, activity["start_ts"] // 60, activity["end_ts"] // 60):
+                st.error(f"{activity['start_time'][11:16]} 开始的 {activity['activity']} 与已有活动时间重叠")
+                return
+    
+    add_activities(new_activities)
+    st.success(f"已批量添加 {len(new_activities)} 项活动")
+    st.rerun()
 
 def get_recommended_templates():
     """获取智能推荐的模板"""
@@ -1231,7 +1708,7 @@ def get_recommended_templates():
         return recommendations
     
     # 分析当前时间和活动模式
-    current_time = datetime.datetime.now()
+    current_time = local_now()
     current_hour = current_time.hour
     current_weekday = current_time.weekday()
     
@@ -1239,15 +1716,17 @@ def get_recommended_templates():
     ignored = st.session_state.get('ignored_templates', [])
     
     # 基于时间推荐
-    time_based_templates = recommend_by_time(current_hour, current_weekday, ignored)
+    time_based_templates = recommend_by_time(get_recommendation_tables(), get_location_index(), get_place_index(),
+                                             current_hour, current_weekday, ignored)
     recommendations.extend(time_based_templates)
     
     # 基于历史模式推荐
-    pattern_based_templates = recommend_by_pattern(ignored)
+    pattern_based_templates = recommend_by_pattern(get_next_activity_model(), get_location_index(),
+                                                   get_place_index(), current_hour, ignored)
     recommendations.extend(pattern_based_templates)
     
     # 基于地点推荐
-    location_based_templates = recommend_by_location(ignored)
+    location_based_templates = recommend_by_location(get_recommendation_tables(), get_place_index(), ignored)
     recommendations.extend(location_based_templates)
     
     # 去重并排序
@@ -1260,171 +1739,12 @@ def get_recommended_templates():
     
     return sorted(unique_recommendations, key=lambda x: x['score'], reverse=True)[:3]
 
-def recommend_by_time(current_hour, current_weekday, ignored):
-    """基于时间推荐模板"""
-    recommendations = []
-    
-    # 时间段的典型活动
-    time_patterns = {
-        (6, 9): "早晨活动",    # 早晨
-        (9, 12): "上午学习",   # 上午
-        (12, 14): "午间休息",  # 中午
-        (14, 18): "下午工作",  # 下午
-        (18, 22): "晚间活动",  # 晚上
-        (22, 6): "夜间休息"    # 深夜
-    }
-    
-    # 找到当前时间段
-    current_period = None
-    for (start, end), period_name in time_patterns.items():
-        if start < end:
-            if start <= current_hour < end:
-                current_period = period_name
-                break
-        else:  # 跨天的情况
-            if current_hour >= start or current_hour < end:
-                current_period = period_name
-                break
-    
-    if current_period:
-        # 基于历史数据推荐该时间段的常见活动
-        period_activities = []
-        for activity in st.session_state.activities:
-            activity_hour = datetime.datetime.fromisoformat(activity["start_time"]).hour
-            if (current_period == "早晨活动" and 6 <= activity_hour < 9) or \
-               (current_period == "上午学习" and 9 <= activity_hour < 12) or \
-               (current_period == "午间休息" and 12 <= activity_hour < 14) or \
-               (current_period == "下午工作" and 14 <= activity_hour < 18) or \
-               (current_period == "晚间活动" and 18 <= activity_hour < 22) or \
-               (current_period == "夜间休息" and (activity_hour >= 22 or activity_hour < 6)):
-                period_activities.append(activity)
-        
-        if period_activities:
-            # 统计最常见的活动组合
-            activity_combinations = Counter()
-            for activity in period_activities:
-                key = (activity["demand"], activity["project"], activity["activity"], activity["behavior"])
-                activity_combinations[key] += 1
-            
-            for (demand, project, activity, behavior), count in activity_combinations.most_common(2):
-                template_name = f"{current_period}_{demand}_{activity}"
-                if template_name not in ignored:
-                    score = min(count / len(period_activities) * 100, 95)
-                    recommendations.append({
-                        "name": template_name,
-                        "score": score,
-                        "data": {
-                            "demand": demand,
-                            "project": project,
-                            "activity": activity,
-                            "behavior": behavior,
-                            "location_name": get_common_location(demand, activity)
-                        }
-                    })
-    
-    return recommendations
-
-def recommend_by_pattern(ignored):
-    """基于历史模式推荐模板"""
-    recommendations = []
-    
-    # 分析最近的活动模式
-    recent_activities = st.session_state.activities[-10:]  # 最近10个活动
-    
-    if len(recent_activities) >= 3:
-        # 寻找频繁出现的活动序列
-        sequence_count = defaultdict(int)
-        
-        for i in range(len(recent_activities) - 1):
-            current = recent_activities[i]
-            next_act = recent_activities[i + 1]
-            
-            sequence = (current["demand"], current["activity"], next_act["demand"], next_act["activity"])
-            sequence_count[sequence] += 1
-        
-        # 推荐频繁序列的下一个活动
-        for sequence, count in sequence_count.items():
-            if count >= 2:  # 至少出现2次
-                current_demand, current_activity, next_demand, next_activity = sequence
-                template_name = f"序列推荐_{next_demand}_{next_activity}"
-                
-                if template_name not in ignored:
-                    # 找到对应的项目和行为
-                    next_activity_data = None
-                    for activity in st.session_state.activities:
-                        if activity["demand"] == next_demand and activity["activity"] == next_activity:
-                            next_activity_data = activity
-                            break
-                    
-                    if next_activity_data:
-                        score = min(count / (len(recent_activities) - 1) * 100, 90)
-                        recommendations.append({
-                            "name": template_name,
-                            "score": score,
-                            "data": {
-                                "demand": next_demand,
-                                "project": next_activity_data["project"],
-                                "activity": next_activity,
-                                "behavior": next_activity_data["behavior"],
-                                "location_name": next_activity_data.get("location_name", "")
-                            }
-                        })
-    
-    return recommendations
-
-def recommend_by_location(ignored):
-    """基于地点推荐模板"""
-    recommendations = []
-    
-    # 获取最近使用的地点
-    recent_locations = []
-    for activity in reversed(st.session_state.activities):
-        if activity.get("location_name") and activity["location_name"] not in recent_locations:
-            recent_locations.append(activity["location_name"])
-            if len(recent_locations) >= 3:
-                break
-    
-    # 为每个地点推荐常见活动
-    for location in recent_locations:
-        location_activities = [a for a in st.session_state.activities if a.get("location_name") == location]
-        
-        if location_activities:
-            activity_count = Counter()
-            for activity in location_activities:
-                key = (activity["demand"], activity["project"], activity["activity"], activity["behavior"])
-                activity_count[key] += 1
-            
-            for (demand, project, activity, behavior), count in activity_count.most_common(1):
-                template_name = f"地点_{location}_{activity}"
-                if template_name not in ignored:
-                    score = min(count / len(location_activities) * 100, 85)
-                    recommendations.append({
-                        "name": template_name,
-                        "score": score,
-                        "data": {
-                            "demand": demand,
-                            "project": project,
-                            "activity": activity,
-                            "behavior": behavior,
-                            "location_name": location
-                        }
-                    })
-    
-    return recommendations
 
 def get_template_usage_count(template_name):
     """获取模板使用次数"""
-    count = 0
     template_data = st.session_state.activity_templates[template_name]
-    
-    for activity in st.session_state.activities:
-        if (activity["demand"] == template_data["demand"] and
-            activity["project"] == template_data["project"] and
-            activity["activity"] == template_data["activity"] and
-            activity["behavior"] == template_data["behavior"]):
-            count += 1
-    
-    return count
+    return get_usage_index()["counts"][template_path(template_data)]
+
 
 def generate_template_name():
     """生成智能模板名称"""
@@ -1437,65 +1757,33 @@ def generate_template_name():
 
 def get_suggested_location(demand, activity):
     """获取建议地点"""
-    if not st.session_state.activities:
-        return None
-    
-    # 查找相同需求和行为的最常用地点
-    location_count = {}
-    for act in st.session_state.activities:
-        if act["demand"] == demand and act["activity"] == activity:
-            location = act.get("location_name")
-            if location:
-                location_count[location] = location_count.get(location, 0) + 1
-    
-    if location_count:
-        return max(location_count.items(), key=lambda x: x[1])[0]
-    
-    return None
+    ranked = rank_locations(get_location_index(), get_place_index(), demand, activity)
+    return ranked[0][0] if ranked else None
 
 def get_common_location(demand, activity):
     """获取常用地点"""
-    locations = []
-    for act in st.session_state.activities:
-        if act["demand"] == demand and act["activity"] == activity:
-            location = act.get("location_name")
-            if location:
-                locations.append(location)
-    
-    if locations:
-        location_counter = Counter(locations)
-        return location_counter.most_common(1)[0][0]
-    
-    return ""
+    ranked = rank_locations(get_location_index(), get_place_index(), demand, activity)
+    return ranked[0][0] if ranked else ""
 
 # 分类系统管理
 def classification_management():
     """分类系统管理"""
     st.markdown('<div class="sub-header">🏷️ 分类系统管理</div>', unsafe_allow_html=True)
     
-    st.info("在这里您可以自定义活动分类系统。分类系统采用四级结构：需求 → 企划 → 活动 → 行为")
-    
-    # 选择要编辑的层级
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        demand_options = list(st.session_state.classification_system.keys())
-        selected_demand = st.selectbox("选择需求", options=demand_options)
+    st.info("在这里您可以自定义活动分类系统。分类系统采用五级结构：需求 → 企划 → 活动 → 行为 → 片段")
     
-    with col2:
-        if selected_demand:
-            project_options = list(st.session_state.classification_system[selected_demand].keys())
-            selected_project = st.selectbox("选择企划", options=project_options)
+    classification_index = get_classification_index(members=True)
+    system = st.session_state.classification_system
     
-    with col3:
-        if selected_demand and selected_project:
-            activity_options = list(st.session_state.classification_system[selected_demand][selected_project].keys())
-            selected_activity = st.selectbox("选择活动", options=activity_options)
-    
-    with col4:
-        if selected_demand and selected_project and selected_activity:
-            behavior_options = list(st.session_state.classification_system[selected_demand][selected_project][selected_activity].keys())
-            selected_behavior = st.selectbox("选择行为", options=behavior_options)
+    # 选择要编辑的层级：selected 为当前选中的路径，逐级延长
+    selected = ()
+    for column, level_name in zip(st.columns(len(CLASSIFICATION_LEVEL_NAMES)), CLASSIFICATION_LEVEL_NAMES):
+        options = child_names(classification_index, selected)
+        with column:
+            choice = st.selectbox(f"选择{level_name}", options=options) if options else None
+        if not choice:
+            break
+        selected += (choice,)
     
     # 编辑区域
     st.markdown("---")
@@ -1506,71 +1794,69 @@ def classification_management():
     with edit_col1:
         st.markdown("**添加新分类**")
         
-        new_demand = st.text_input("新需求名称")
-        if st.button("添加需求") and new_demand:
-            if new_demand not in st.session_state.classification_system:
-                st.session_state.classification_system[new_demand] = {}
-                save_all_data()
-                st.success(f"已添加需求: {new_demand}")
-                st.rerun()
-        
-        if selected_demand:
-            new_project = st.text_input("新企划名称")
-            if st.button("添加企划") and new_project:
-                if new_project not in st.session_state.classification_system[selected_demand]:
-                    st.session_state.classification_system[selected_demand][new_project] = {}
-                    save_all_data()
-                    st.success(f"已添加企划: {new_project}")
-                    st.rerun()
-        
-        if selected_demand and selected_project:
-            new_activity = st.text_input("新活动名称")
-            if st.button("添加活动") and new_activity:
-                if new_activity not in st.session_state.classification_system[selected_demand][selected_project]:
-                    st.session_state.classification_system[selected_demand][selected_project][new_activity] = {}
+        for depth in range(min(len(selected) + 1, len(CLASSIFICATION_LEVEL_NAMES))):
+            level_name = CLASSIFICATION_LEVEL_NAMES[depth]
+            new_name = st.text_input(f"新{level_name}名称")
+            if st.button(f"添加{level_name}") and new_name:
+                if add_node(classification_index, system, selected[:depth], new_name):
                     save_all_data()
-                    st.success(f"已添加活动: {new_activity}")
-                    st.rerun()
-        
-        if selected_demand and selected_project and selected_activity:
-            new_behavior = st.text_input("新行为名称")
-            if st.button("添加行为") and new_behavior:
-                if new_behavior not in st.session_state.classification_system[selected_demand][selected_project][selected_activity]:
-                    st.session_state.classification_system[selected_demand][selected_project][selected_activity][new_behavior] = []
-                    save_all_data()
-                    st.success(f"已添加行为: {new_behavior}")
+                    st.success(f"已添加{level_name}: {new_name}")
                     st.rerun()
     
     with edit_col2:
         st.markdown("**删除分类**")
         
-        if selected_demand and len(st.session_state.classification_system) > 1:
-            if st.button("删除当前需求", type="secondary"):
-                del st.session_state.classification_system[selected_demand]
-                save_all_data()
-                st.success(f"已删除需求: {selected_demand}")
-                st.rerun()
-        
-        if selected_demand and selected_project and len(st.session_state.classification_system[selected_demand]) > 1:
-            if st.button("删除当前企划", type="secondary"):
-                del st.session_state.classification_system[selected_demand][selected_project]
-                save_all_data()
-                st.success(f"已删除企划: {selected_project}")
-                st.rerun()
+        for depth in range(len(selected)):
+            level_name = CLASSIFICATION_LEVEL_NAMES[depth]
+            path = selected[:depth + 1]
+            if len(child_names(classification_index, path[:-1])) <= 1:
+                continue
+            if st.button(f"删除当前{level_name}", type="secondary"):
+                if delete_node(classification_index, system, path):
+                    save_all_data()
+                    st.success(f"已删除{level_name}: {path[-1]}")
+                    st.rerun()
+                else:
+                    st.warning(f"还有 {count_activities(classification_index, path)} 条活动属于{level_name}"
+                               f"“{path[-1]}”，请先将其合并到其他{level_name}")
+    
+    # 改名与合并：已有活动和模板随之批量更新
+    if selected:
+        st.markdown("---")
+        st.markdown("### 改名与合并")
+        depth = st.radio("层级", list(range(len(selected))), format_func=lambda d: CLASSIFICATION_LEVEL_NAMES[d],
+                         index=len(selected) - 1, horizontal=True, key="rename_level")
+        path = selected[:depth + 1]
+        level_name = CLASSIFICATION_LEVEL_NAMES[depth]
+        st.caption(f"“{' → '.join(path)}” 下共有 {count_activities(classification_index, path)} 条活动")
         
-        if selected_demand and selected_project and selected_activity and len(st.session_state.classification_system[selected_demand][selected_project]) > 1:
-            if st.button("删除当前活动", type="secondary"):
-                del st.session_state.classification_system[selected_demand][selected_project][selected_activity]
+        rename_col, merge_col = st.columns(2)
+        with rename_col:
+            new_name = st.text_input(f"{level_name}新名称", value=path[-1], key=f"rename_to_{'/'.join(path)}")
+            if st.button(f"改名{level_name}", help="与同级已有名称相同时合并到该分类") and new_name and new_name != path[-1]:
+                changed = indexes.rename_classification(st.session_state, path, new_name)
                 save_all_data()
-                st.success(f"已删除活动: {selected_activity}")
+                st.success(f"已将“{path[-1]}”改名为“{new_name}”，更新了 {changed} 条活动")
                 st.rerun()
-        
-        if selected_demand and selected_project and selected_activity and selected_behavior and len(st.session_state.classification_system[selected_demand][selected_project][selected_activity]) > 1:
-            if st.button("删除当前行为", type="secondary"):
-                del st.session_state.classification_system[selected_demand][selected_project][selected_activity][selected_behavior]
+        with merge_col:
+            targets = [p for p in classification_index["paths"] if len(p) == len(path) and p != path]
+            target = st.selectbox(f"合并到{level_name}", options=targets, format_func=" → ".join, key="merge_to")
+            if st.button(f"合并{level_name}") and target:
+                changed = indexes.merge_classification(st.session_state, path, target)
                 save_all_data()
-                st.success(f"已删除行为: {selected_behavior}")
+                st.success(f"已将“{' → '.join(path)}”合并到“{' → '.join(target)}”，更新了 {changed} 条活动")
                 st.rerun()
+    
+    # 分类系统中不存在的活动路径
+    orphans = classification_index["orphans"]
+    if orphans:
+        st.markdown("---")
+        st.warning(f"有 {len(orphans)} 条活动的分类不在分类系统中")
+        if st.button("将这些分类补回分类系统"):
+            restored = restore_orphans(classification_index, system)
+            save_all_data()
+            st.success(f"已补回 {restored} 条活动的分类")
+            st.rerun()
 
 # 数据管理
 def data_management():
@@ -1583,7 +1869,7 @@ def data_management():
         st.markdown("**📤 导出数据**")
         if st.button("导出为JSON", use_container_width=True):
             export_data = {
-                "activities": st.session_state.activities,
+                "activities": list(st.session_state.activities),
                 "location_categories": st.session_state.location_categories,
                 "classification_system": st.session_state.classification_system,
                 "activity_templates": st.session_state.activity_templates,
@@ -1611,10 +1897,14 @@ def data_management():
                 if st.button("导入数据", use_container_width=True):
                     if "activities" in import_data:
                         st.session_state.activities = import_data["activities"]
+                        migrate_activities(st.session_state.activities, st.session_state.timezone)
+                        store.renumber_duplicate_ids(st.session_state.activities)
+                        invalidate_activity_indexes()
                     if "location_categories" in import_data:
                         st.session_state.location_categories = import_data["location_categories"]
                     if "classification_system" in import_data:
                         st.session_state.classification_system = import_data["classification_system"]
+                        st.session_state.pop("classification_index", None)
                     if "activity_templates" in import_data:
                         st.session_state.activity_templates = import_data["activity_templates"]
                     
@@ -1624,6 +1914,10 @@ def data_management():
             except Exception as e:
                 st.error(f"文件解析失败: {e}")
     
+    # GPS轨迹导入
+    st.markdown("---")
+    gps_track_import()
+    
     # 清空数据
     st.markdown("---")
     st.markdown("**⚠️ 危险操作**")
@@ -1632,6 +1926,7 @@ def data_management():
         if st.button("清空活动数据", type="secondary", use_container_width=True):
             if st.checkbox("我确认要清空所有活动数据，此操作不可恢复"):
                 st.session_state.activities = []
+                invalidate_activity_indexes()
                 save_all_data()
                 st.success("活动数据已清空")
                 st.rerun()
@@ -1639,25 +1934,117 @@ def data_management():
         if st.button("重置所有数据", type="secondary", use_container_width=True):
             if st.checkbox("我确认要重置所有数据，包括分类系统和模板"):
                 st.session_state.activities = []
+                invalidate_activity_indexes()
                 st.session_state.classification_system = {}
                 st.session_state.activity_templates = {}
                 save_all_data()
                 st.success("所有数据已重置")
                 st.rerun()
 
+def gps_track_import():
+    """GPS轨迹导入：解析为草稿，确认后批量写入"""
+    import tempfile
+    import gps_import
+    st.markdown("**🛰️ 导入GPS轨迹**")
+    st.caption("支持GPX、CSV（含经纬度和时间列）和Google Takeout的Records.json，大文件请填写本地路径以流式读取")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        local_paths = st.text_area("本地文件路径（每行一个）", height=80)
+        uploaded_tracks = st.file_uploader("或上传轨迹文件", type=["gpx", "csv", "json"],
+                                           accept_multiple_files=True, key="gps_upload")
+    with col2:
+        sample_seconds = st.number_input("降采样间隔(秒)", min_value=1, max_value=600,
+                                         value=gps_import.DEFAULT_SAMPLE_SECONDS)
+        radius_m = st.number_input("停留半径(米)", min_value=20, max_value=2000,
+                                   value=gps_import.DEFAULT_STAY_RADIUS_M)
+        min_stay = st.number_input("最短停留(分钟)", min_value=1, max_value=600,
+                                   value=gps_import.DEFAULT_MIN_STAY_MINUTES)
+    
+    if st.button("解析轨迹", use_container_width=True):
+        paths = [line.strip() for line in local_paths.splitlines() if line.strip()]
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            st.error(f"文件不存在: {', '.join(missing)}")
+            return
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 上传的文件先落盘，解析器统一按文件流式读取
+            for uploaded in uploaded_tracks or []:
+                path = os.path.join(tmp_dir, uploaded.name)
+                with open(path, "wb") as f:
+                    f.write(uploaded.getbuffer())
+                paths.append(path)
+            
+            if not paths:
+                st.warning("请先选择轨迹文件")
+                return
+            
+            try:
+                with st.spinner("解析轨迹中..."):
+                    results = gps_import.read_tracks_parallel(
+                        paths, timezone=st.session_state.timezone, sample_seconds=sample_seconds,
+                        radius_m=radius_m, min_stay_minutes=min_stay)
+            except Exception as e:
+                st.error(f"轨迹解析失败: {e}")
+                return
+        
+        segments = sorted((segment for result in results for segment in result), key=lambda x: x["start"])
+        st.session_state.gps_drafts = gps_segments_to_drafts(segments)
+    
+    drafts = st.session_state.get('gps_drafts')
+    if not drafts:
+        return
+    
+    st.markdown(f"识别出 {len(drafts)} 条草稿，请检查并补全分类后导入")
+    editor_columns = ["start_time", "end_time", "duration", "location_category", "location_name",
+                      "demand", "project", "activity", "behavior", "description"]
+    draft_df = pd.DataFrame(drafts)[editor_columns]
+    draft_df.insert(0, "导入", True)
+    edited = st.data_editor(draft_df, use_container_width=True, hide_index=True,
+                            disabled=["start_time", "end_time", "duration"], key="gps_draft_editor")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("✅ 导入选中草稿", use_container_width=True):
+            selected = []
+            for i, row in edited.iterrows():
+                if not row["导入"]:
+                    continue
+                if not all(row[column] for column in ("location_category", "location_name", "demand",
+                                                      "project", "activity", "behavior")):
+                    st.error(f"第 {i + 1} 行缺少分类或地点信息")
+                    return
+                draft = dict(drafts[i])
+                draft.update({column: row[column] for column in editor_columns if column not in ("start_time", "end_time", "duration")})
+                selected.append(draft)
+            if selected:
+                add_activities(selected)
+            del st.session_state.gps_drafts
+            st.success(f"已导入 {len(selected)} 条活动")
+            st.rerun()
+    with col2:
+        if st.button("放弃草稿", use_container_width=True):
+            del st.session_state.gps_drafts
+            st.rerun()
+
 # 主应用
 def main():
     """主应用"""
     # 初始化和样式
-    initialize_data()
-    apply_custom_css()
+    start_profile_run()
+    with profile_section("initialize_data"):
+        initialize_data()
+    with profile_section("apply_custom_css"):
+        apply_custom_css()
     
     # 标题
     st.markdown('<div class="main-header">🛤️ 个人活动轨迹日志</div>', unsafe_allow_html=True)
     st.markdown('基于时间地理学理论的个人活动记录与分析系统')
     
     # 快速操作面板
-    quick_actions()
+    with profile_section("quick_actions"):
+        quick_actions()
     
     # 侧边栏导航
     with st.sidebar:
@@ -1676,6 +2063,8 @@ def main():
         
         selected_page = st.selectbox("选择功能", options=list(page_options.keys()))
         page = page_options[selected_page]
+        st.selectbox("🌐 当前时区", pytz.common_timezones, key="timezone",
+                     help="新记录默认使用的时区，也用于确定“今天”的起止")
         
         st.markdown("---")
         st.markdown("### 使用说明")
@@ -1691,36 +2080,37 @@ def main():
         
         st.markdown("---")
         st.markdown("### 数据状态")
-        st.write(f"📊 活动记录: {len(st.session_state.activities)} 条")
-        st.write(f"🏷️ 分类数量: {len(st.session_state.classification_system)} 个需求类型")
-        st.write(f"📋 模板数量: {len(st.session_state.activity_templates)} 个")
+        with profile_section("侧边栏统计"):
+            st.write(f"📊 活动记录: {len(st.session_state.activities)} 条")
+            st.write(f"🏷️ 分类数量: {len(st.session_state.classification_system)} 个需求类型")
+            st.write(f"📋 模板数量: {len(st.session_state.activity_templates)} 个")
         
-        # 今日统计
-        today = datetime.date.today()
-        today_activities = [a for a in st.session_state.activities 
-                           if datetime.datetime.fromisoformat(a["start_time"]).date() == today]
-        st.write(f"🌞 今日活动: {len(today_activities)} 条")
+            # 今日统计
+            today = local_today()
+            today_activities = activities_overlapping(st.session_state.activities, today, today,
+                                                      get_interval_index()["max_length"])
+            today_minutes = minutes_on_dates(today_activities, today, today).sum() if today_activities else 0
+            st.write(f"🌞 今日活动: {len(today_activities)} 条，{today_minutes / 60:.1f} 小时")
         
         # 手动保存按钮
         if st.button("💾 手动保存数据", use_container_width=True):
             save_all_data()
             st.success("数据已保存")
     
-    # 页面路由
-    if page == "记录活动":
-        activity_form()
-    elif page == "活动模板":
-        activity_templates()
-    elif page == "数据概览":
-        data_overview()
-    elif page == "活动记录":
-        activity_records()
-    elif page == "时空轨迹":
-        spatiotemporal_analysis()
-    elif page == "分类管理":
-        classification_management()
-    elif page == "数据管理":
-        data_management()
+    # 页面路由：只运行选中的页面，地图、绘图等依赖随页面函数首次调用才导入
+    pages = {
+        "记录活动": activity_form,
+        "活动模板": activity_templates,
+        "数据概览": data_overview,
+        "活动记录": activity_records,
+        "时空轨迹": spatiotemporal_analysis,
+        "分类管理": classification_management,
+        "数据管理": data_management,
+    }
+    with profile_section(f"页面: {page}"):
+        pages[page]()
+    
+    show_profile_report(page)
 
 if __name__ == "__main__":
     main()